@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Benchmark do agendador de chamadas à OpenAI contra um mock com limites
+Sobe o mock da OpenAI com orçamento de requisições por minuto e uma fração
+de erros 500/503, dispara uma rajada de /analisar-nota (textos distintos,
+sem cache) e conta os status recebidos pelos clientes: 200, 429 com
+Retry-After (fila cheia ou limite esgotado), 503 e 500. Com `--lote`, um
+POST /analisar-notas/lote roda junto, para ver as análises interativas
+passando na frente do lote na fila.
+
+Uso:
+    python benchmarks/bench_agendador.py [--analises 300] [--concorrencia 100]
+        [--rpm 600] [--rajada 5] [--falhas 0.02] [--latencia 0.3] [--lote 0]
+        [--env OPENAI_RPM=600 ...] [--app-dir DIR]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+
+import httpx
+
+from comum import DIRETORIO_API, percentil, servidor_api, servidor_mock_openai
+
+def texto_nota(i: int) -> str:
+    return f"NOTA FISCAL Nº {i} - Supermercado - Total: R$ {i},00"
+
+async def executar(url, total, concorrencia, lote):
+    limites = httpx.Limits(max_connections=concorrencia + 10)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=300.0) as client:
+        latencias = []
+        status = Counter()
+        com_retry_after = 0
+        fila = iter(range(total))
+
+        async def analisar():
+            nonlocal com_retry_after
+            for i in fila:
+                inicio = time.perf_counter()
+                r = await client.post("/analisar-nota", json={"texto": texto_nota(i)})
+                status[r.status_code] += 1
+                if r.status_code == 200:
+                    latencias.append(time.perf_counter() - inicio)
+                elif "retry-after" in r.headers:
+                    com_retry_after += 1
+
+        async def analisar_lote():
+            inicio = time.perf_counter()
+            notas = [{"texto": texto_nota(total + i)} for i in range(lote)]
+            r = await client.post("/analisar-notas/lote", json={"notas": notas})
+            resumo = json.loads(r.text.strip().splitlines()[-1])["resumo"]
+            return time.perf_counter() - inicio, resumo
+
+        inicio = time.perf_counter()
+        tarefa_lote = asyncio.create_task(analisar_lote()) if lote else None
+        await asyncio.gather(*(analisar() for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+        resultado_lote = await tarefa_lote if tarefa_lote else None
+    return duracao, latencias, status, com_retry_after, resultado_lote
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--analises", type=int, default=300)
+    parser.add_argument("--concorrencia", type=int, default=100)
+    parser.add_argument("--rpm", type=int, default=600, help="Limite de requisições por minuto do mock")
+    parser.add_argument("--rajada", type=float, default=5, help="Segundos de orçamento acumuláveis no mock")
+    parser.add_argument("--falhas", type=float, default=0.02, help="Fração de 500/503 do mock")
+    parser.add_argument("--latencia", type=float, default=0.3)
+    parser.add_argument("--lote", type=int, default=0, help="Notas de um /analisar-notas/lote em paralelo")
+    parser.add_argument("--env", nargs="*", default=[], help="Variáveis da API (ex.: OPENAI_RPM=600)")
+    parser.add_argument("--app-dir", default=DIRETORIO_API)
+    args = parser.parse_args()
+
+    argumentos_mock = ["--rpm", str(args.rpm), "--rajada", str(args.rajada), "--falhas", str(args.falhas)]
+    with servidor_mock_openai(args.latencia, argumentos_mock) as base_url:
+        env = {"OPENAI_API_KEY": "sk-mock-benchmark", "OPENAI_BASE_URL": base_url}
+        env.update(item.split("=", 1) for item in args.env)
+        with servidor_api(args.app_dir, env) as url:
+            duracao, latencias, status, com_retry_after, resultado_lote = asyncio.run(
+                executar(url, args.analises, args.concorrencia, args.lote)
+            )
+        mock = httpx.get(base_url.removesuffix("/v1") + "/chamadas").json()
+
+    print(f"API: {args.app_dir} {' '.join(args.env)}")
+    print(f"Mock: {args.rpm} RPM (rajada {args.rajada:g}s), {args.falhas:.0%} de 500/503, latência {args.latencia}s")
+    print(f"Análises: {args.analises} | Concorrência: {args.concorrencia} | Tempo total: {duracao:.1f}s\n")
+    print("Status para os clientes: " + ", ".join(f"{codigo}: {n}" for codigo, n in sorted(status.items())))
+    print(f"Respostas de erro com Retry-After: {com_retry_after}")
+    print(f"Mock: {mock['chamadas']} chamadas aceitas, {mock['limitadas']} respondidas com 429, {mock['falhas']} com 500/503")
+    print(f"Latência dos 200 (ms): p50 {percentil(latencias, 50):.0f} | p95 {percentil(latencias, 95):.0f} | "
+          f"p99 {percentil(latencias, 99):.0f}")
+    if resultado_lote:
+        tempo_lote, resumo = resultado_lote
+        print(f"Lote de {args.lote} notas: {tempo_lote:.1f}s, {resumo['analisadas']} analisadas, {resumo['erros']} com erro")
+
+if __name__ == "__main__":
+    main_bench()
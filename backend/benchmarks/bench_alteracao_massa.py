@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Benchmark da alteração e exclusão em massa de clientes
+Compara renomear e apagar N clientes uma requisição por vez
+(`PUT`/`DELETE /clientes/{id}`) com uma única requisição
+`PATCH`/`DELETE /clientes/bulk`, por lista de ids e por filtro. Conta também
+as consultas SQL de cada cenário (contador de consultas das métricas).
+
+Uso: python benchmarks/bench_alteracao_massa.py [--clientes 1000,10000]
+"""
+
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import insert
+
+from comum import banco_temporario, gerar_clientes, main
+
+def popular(engine, total):
+    # Metade criada "ontem", para o cenário por filtro de data
+    agora = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(main.ClienteDB), [
+            {**cliente, "created_at": agora - timedelta(days=1) if i % 2 else agora}
+            for i, cliente in enumerate(gerar_clientes(total))
+        ])
+
+def consultas_sql() -> float:
+    # Soma das séries do contador, como aparecem no /metrics
+    return sum(float(linha.rsplit(" ", 1)[1]) for linha in main.METRICA_DB_CONSULTAS.exportar())
+
+async def medir(executar):
+    consultas = consultas_sql()
+    inicio = time.perf_counter()
+    afetados = await executar()
+    return (time.perf_counter() - inicio) * 1000, afetados, consultas_sql() - consultas
+
+async def cenario(total: int):
+    metade = total // 2
+    ontem = (datetime.utcnow() - timedelta(hours=12)).isoformat()
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            async def um_a_um(metodo, ids, **kwargs):
+                for cliente_id in ids:
+                    response = await client.request(metodo, f"/clientes/{cliente_id}", **kwargs)
+                    assert response.status_code in (200, 204), response.text
+                return len(ids)
+
+            async def em_massa(metodo, corpo, chave):
+                response = await client.request(metodo, "/clientes/bulk", json=corpo)
+                assert response.status_code == 200, response.text
+                return response.json()[chave]
+
+            ids_pares = list(range(2, total + 1, 2))[:metade // 2]
+            ids_impares = list(range(1, total + 1, 2))[:metade // 2]
+            return {
+                "PUT um a um": await medir(lambda: um_a_um("PUT", ids_pares, json={"nome": "Renomeado"})),
+                "PATCH bulk ids": await medir(lambda: em_massa(
+                    "PATCH", {"ids": ids_impares, "valores": {"nome": "Renomeado"}}, "atualizados"
+                )),
+                "PATCH bulk filtro": await medir(lambda: em_massa(
+                    "PATCH", {"filtro": {"created_before": ontem}, "valores": {"nome": "De ontem"}}, "atualizados"
+                )),
+                "DELETE um a um": await medir(lambda: um_a_um("DELETE", ids_pares)),
+                "DELETE bulk ids": await medir(lambda: em_massa("DELETE", {"ids": ids_impares}, "apagados")),
+                "DELETE bulk filtro": await medir(lambda: em_massa(
+                    "DELETE", {"filtro": {"created_before": ontem}}, "apagados"
+                )),
+            }
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", default="1000,10000", help="Tamanhos da base, separados por vírgula")
+    args = parser.parse_args()
+
+    main.cache_respostas = None
+    main.OUTBOX_HABILITADO = False
+    print(f"{'Base':>7} {'Cenário':<20} {'Tempo (ms)':>11} {'Afetados':>9} {'Consultas':>10} {'Clientes/s':>11}")
+    for total in (int(valor) for valor in args.clientes.split(",")):
+        with banco_temporario() as engine:
+            popular(engine, total)
+            resultados = asyncio.run(cenario(total))
+        for nome, (ms, afetados, consultas) in resultados.items():
+            print(f"{total:>7} {nome:<20} {ms:>11.1f} {afetados:>9} {consultas:>10.0f} {afetados / ms * 1000:>11.0f}")
+
+if __name__ == "__main__":
+    main_bench()
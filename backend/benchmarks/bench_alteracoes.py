@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark da sincronização incremental de clientes
+Com a base já sincronizada, aplica algumas alterações (atualizações e
+exclusões) e mede quanto custa para um consumidor (N8N, planilha, data
+warehouse) descobrir o que mudou: relendo a base inteira pela exportação,
+pela exportação incremental (`updated_since`) ou pelo feed
+`GET /clientes/changes?since=`. Roda em dois tamanhos de base para mostrar
+o que cresce com a tabela e o que cresce só com as alterações.
+
+Uso: python benchmarks/bench_alteracoes.py [--clientes 20000,200000] [--alteracoes 100]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+import httpx
+from sqlalchemy import insert
+
+from comum import banco_temporario, gerar_clientes, main
+
+REPETICOES = 5
+
+def popular(engine, total):
+    agora = datetime.utcnow()
+    with engine.begin() as conn:
+        lote = []
+        for cliente in gerar_clientes(total):
+            lote.append({**cliente, "created_at": agora})
+            if len(lote) == 50_000:
+                conn.execute(insert(main.ClienteDB), lote)
+                lote = []
+        if lote:
+            conn.execute(insert(main.ClienteDB), lote)
+
+async def medir(client, metodo, params, contar):
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        response = await client.get(metodo, params=params)
+        tempos.append(time.perf_counter() - inicio)
+        assert response.status_code == 200, response.text
+    tempos.sort()
+    return tempos[len(tempos) // 2] * 1000, contar(response), len(response.content)
+
+async def cenario(total: int, alteracoes: int):
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Ponto de partida do consumidor: exportação completa + último seq
+            response = await client.get("/clientes/export")
+            sincronizado_em = response.headers["x-exportado-em"]
+            ultimo_seq = int(response.headers["x-ultimo-seq"])
+
+            aleatorio = random.Random(total)
+            for cliente_id in aleatorio.sample(range(1, total + 1), alteracoes):
+                if aleatorio.random() < 0.8:
+                    response = await client.put(f"/clientes/{cliente_id}", json={"nome": f"Alterado {cliente_id}"})
+                else:
+                    response = await client.delete(f"/clientes/{cliente_id}")
+                assert response.status_code in (200, 204), response.text
+
+            linhas = lambda r: r.text.count("\n")
+            return {
+                "exportação completa": await medir(client, "/clientes/export", {}, linhas),
+                "export updated_since": await medir(
+                    client, "/clientes/export", {"updated_since": sincronizado_em}, linhas
+                ),
+                "feed changes": await medir(
+                    client, "/clientes/changes", {"since": ultimo_seq, "limit": main.ALTERACOES_LIMITE_MAX},
+                    lambda r: len(r.json()["alteracoes"])
+                ),
+            }
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", default="20000,200000", help="Tamanhos da base, separados por vírgula")
+    parser.add_argument("--alteracoes", type=int, default=100, help="Alterações aplicadas depois da sincronização")
+    args = parser.parse_args()
+
+    main.cache_respostas = None
+    main.OUTBOX_HABILITADO = False
+    print(f"{'Base':>9} {'Cenário':<22} {'Mediana (ms)':>13} {'Linhas':>9} {'Tamanho (KB)':>13}")
+    for total in (int(valor) for valor in args.clientes.split(",")):
+        with banco_temporario() as engine:
+            popular(engine, total)
+            resultados = asyncio.run(cenario(total, args.alteracoes))
+        for nome, (ms, linhas, tamanho) in resultados.items():
+            print(f"{total:>9} {nome:<22} {ms:>13.2f} {linhas:>9} {tamanho / 1000:>13.1f}")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark do GET /clientes/search sobre uma base grande
+Popula um banco temporário com nomes variados (com acento), e-mails e
+CPF/CNPJ válidos e mede a latência de cada tipo de busca, sem o cache de
+respostas.
+
+Uso: python benchmarks/bench_busca.py [--clientes 1000000] [--repeticoes 50]
+"""
+
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime
+
+from comum import banco_temporario, gerar_cnpj, gerar_cpf, main, percentil
+
+import httpx
+
+PRIMEIROS = ["João", "Maria", "José", "Ana", "Antônio", "Francisca", "Carlos", "Luíza", "Paulo", "Márcia",
+             "Pedro", "Adriana", "Lucas", "Juliana", "Luís", "Fernanda", "Marcos", "Patrícia", "Gabriel", "Aline",
+             "Rafael", "Camila", "Daniel", "Letícia", "Mateus", "Bárbara", "André", "Cecília", "Otávio", "Simone"]
+SOBRENOMES = ["Silva", "Santos", "Oliveira", "Souza", "Rodrigues", "Ferreira", "Alves", "Pereira", "Lima",
+              "Gomes", "Costa", "Ribeiro", "Martins", "Carvalho", "Araújo", "Melo", "Barbosa", "Rocha", "Dias",
+              "Nascimento", "Andrade", "Moreira", "Nunes", "Marques", "Machado", "Mendes", "Freitas", "Cardoso",
+              "Ramos", "Gonçalves", "Teixeira", "Correia", "Brandão", "Assunção", "Figueiredo", "Magalhães"]
+
+CONSULTAS = [
+    ("nome (prefixo)", "mar"),
+    ("nome completo", "joão silva"),
+    ("nome sem acento", "marcia goncalves"),
+    ("nome raro", "cecilia magalhaes brandao"),
+    ("e-mail (prefixo)", None),
+    ("CPF parcial", "4567"),
+    ("CPF formatado", "123.456"),
+    ("CNPJ completo", None),
+]
+
+SQL_INSERIR = (
+    "INSERT OR IGNORE INTO clientes (nome, email, cpf_cnpj, tipo_documento, created_at, updated_at) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+def popular(engine, total):
+    rng = random.Random(3)
+    conexao = engine.raw_connection()
+    try:
+        cursor = conexao.cursor()
+        agora = datetime.utcnow().isoformat(" ")
+        lote = []
+        for i in range(1, total + 1):
+            nome = f"{rng.choice(PRIMEIROS)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+            email = main.normalizar_texto(nome).replace(" ", ".") + f".{i}@email.com"
+            # Sementes espalhadas, para os documentos não compartilharem os mesmos prefixos
+            documento = gerar_cnpj(i * 7919) if i % 5 == 0 else gerar_cpf(i * 7919)
+            lote.append((nome, email, documento, "cnpj" if len(documento) == 14 else "cpf", agora, agora))
+            if len(lote) == 50000:
+                cursor.executemany(SQL_INSERIR, lote)
+                lote = []
+        if lote:
+            cursor.executemany(SQL_INSERIR, lote)
+        conexao.commit()
+    finally:
+        conexao.close()
+
+async def medir(repeticoes):
+    main.cache_respostas = None
+    resultados = []
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as client:
+        for nome, q in CONSULTAS:
+            if q is None and nome.startswith("e-mail"):
+                cliente = (await client.get("/clientes/500")).json()
+                q = cliente["email"].split("@")[0] + "@"
+            q = q or gerar_cnpj(500 * 7919)
+            duracoes = []
+            for _ in range(repeticoes):
+                inicio = time.perf_counter()
+                resposta = await client.get("/clientes/search", params={"q": q, "limit": 20})
+                duracoes.append(time.perf_counter() - inicio)
+            resultados.append((nome, q, len(resposta.json()), duracoes))
+    return resultados
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", type=int, default=1_000_000)
+    parser.add_argument("--repeticoes", type=int, default=50)
+    args = parser.parse_args()
+
+    with banco_temporario() as engine:
+        inicio = time.perf_counter()
+        popular(engine, args.clientes)
+        print(f"Base: {args.clientes} clientes (carga com índice de busca em {time.perf_counter() - inicio:.1f}s)\n")
+        resultados = asyncio.run(medir(args.repeticoes))
+
+    print(f"{'Busca':<18} {'q':<28} {'Itens':>5} {'p50 (ms)':>10} {'p99 (ms)':>10}")
+    for nome, q, itens, duracoes in resultados:
+        print(f"{nome:<18} {q:<28} {itens:>5} {percentil(duracoes, 50):>10.2f} {percentil(duracoes, 99):>10.2f}")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Benchmark de carga reproduzível da API (substitui o antigo test_api.py)
+Sobe a API com um banco SQLite temporário, pré-carrega clientes com
+CPF/CNPJ válidos pelo POST /clientes/bulk e dispara uma carga mista e
+concorrente (criar, obter, listar, atualizar, deletar e analisar nota
+contra o mock da OpenAI). Reporta req/s e p50/p95/p99 por operação e
+grava o resultado em JSON para comparar execuções.
+
+Modos:
+    uvicorn   API em um processo uvicorn separado (padrão, mais próximo de produção)
+    processo  API no mesmo processo via ASGITransport (sem rede nem servidor)
+
+Uso:
+    python benchmarks/bench_carga.py [--modo uvicorn] [--concorrencia 32] [--duracao 20]
+        [--clientes 5000] [--mix obter=50,listar=10,criar=15,atualizar=10,deletar=5,analisar=10]
+        [--saida resultado.json] [--comparar anterior.json] [--tolerancia 15]
+
+Com `--comparar`, as métricas são comparadas com um resultado anterior e o
+script sai com código 1 se o req/s cair ou algum p95 subir mais que
+`--tolerancia` por cento (útil para pegar regressões no CI).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+import httpx
+
+from comum import (
+    DIRETORIO_API, DIRETORIO_BENCHMARKS, banco_temporario, gerar_clientes, percentil,
+    servidor_api, servidor_mock_openai,
+)
+
+MIX_PADRAO = "obter=50,listar=10,criar=15,atualizar=10,deletar=5,analisar=10"
+OPERACOES = ("criar", "obter", "listar", "atualizar", "deletar", "analisar")
+
+# Notas com CNPJ, data, total e categoria claros são resolvidas pela extração
+# local; as demais vão para o mock da OpenAI
+NOTA_COMPLETA = (
+    "SUPERMERCADO BOM PRECO LTDA CNPJ: 11.222.333/0001-81 Data de emissão: 15/08/2024 "
+    "Cupom {i} - arroz feijão leite pão café TOTAL: R$ {valor}"
+)
+NOTA_INCOMPLETA = "Recibo {i} - serviços diversos prestados - valor a combinar {valor}"
+
+def interpretar_mix(texto: str) -> dict:
+    pesos = {}
+    for parte in texto.split(","):
+        operacao, _, peso = parte.partition("=")
+        operacao = operacao.strip()
+        if operacao not in OPERACOES:
+            raise SystemExit(f"Operação desconhecida no --mix: {operacao} (use {', '.join(OPERACOES)})")
+        pesos[operacao] = float(peso)
+    return pesos
+
+def commit_atual() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=DIRETORIO_API,
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+async def pre_carregar(client: httpx.AsyncClient, total: int) -> list:
+    """Importa `total` clientes válidos em uma requisição e retorna os ids criados"""
+    corpo = "\n".join(json.dumps(cliente) for cliente in gerar_clientes(total)) + "\n"
+    r = await client.post(
+        "/clientes/bulk", params={"notificar": "false"}, content=corpo,
+        headers={"Content-Type": "application/x-ndjson"}
+    )
+    r.raise_for_status()
+    ids = [linha["id"] for linha in map(json.loads, r.text.splitlines()) if linha.get("status") == "criado"]
+    if len(ids) != total:
+        raise RuntimeError(f"Pré-carga criou {len(ids)} de {total} clientes")
+    return ids
+
+async def executar_carga(client, ids, pesos, concorrencia, duracao, aquecimento, semente):
+    """Roda a carga mista; só o que termina depois do aquecimento entra nas medições"""
+    # "deletar" sem clientes da carga para apagar cria um, medido como "criar"
+    medidas = list(pesos) + (["criar"] if "deletar" in pesos and "criar" not in pesos else [])
+    latencias = {operacao: [] for operacao in medidas}
+    status_por_operacao = {operacao: {} for operacao in medidas}
+    falhas_transporte = {operacao: 0 for operacao in medidas}
+    operacoes, pesos_lista = list(pesos), list(pesos.values())
+    # Faixa de sementes própria por `semente`: geradores em paralelo não criam documentos repetidos
+    proximo = iter(range(len(ids) + 1 + (semente - 1) * 10**7, 10**9))
+    criados = []
+    inicio_medicao = time.perf_counter() + aquecimento
+    fim = inicio_medicao + duracao
+
+    def requisicao(operacao, aleatorio):
+        """Monta (método, caminho, kwargs, status esperado) para a operação"""
+        if operacao == "obter":
+            return "GET", f"/clientes/{aleatorio.choice(ids)}", {}, 200
+        if operacao == "listar":
+            return "GET", "/clientes", {"params": {"skip": aleatorio.randrange(len(ids)), "limit": 50}}, 200
+        if operacao == "atualizar":
+            cliente_id = aleatorio.choice(ids)
+            return "PUT", f"/clientes/{cliente_id}", {"json": {"nome": f"Cliente {cliente_id} v{aleatorio.randrange(10**6)}"}}, 200
+        i = next(proximo)
+        if operacao == "criar" or (operacao == "deletar" and not criados):
+            cliente = next(gerar_clientes(1, inicio=i))
+            return "POST", "/clientes", {"json": cliente}, 201
+        if operacao == "deletar":
+            # Só apaga clientes criados pela própria carga: obter/atualizar não esbarram em 404
+            return "DELETE", f"/clientes/{criados.pop(aleatorio.randrange(len(criados)))}", {}, 204
+        modelo = NOTA_COMPLETA if aleatorio.random() < 0.5 else NOTA_INCOMPLETA
+        valor = f"{aleatorio.randrange(1, 5000)},{aleatorio.randrange(100):02d}"
+        return "POST", "/analisar-nota", {"json": {"texto": modelo.format(i=i, valor=valor)}}, 200
+
+    async def trabalhador(numero):
+        aleatorio = random.Random(semente * 1000 + numero)
+        while True:
+            agora = time.perf_counter()
+            if agora >= fim:
+                return
+            operacao = aleatorio.choices(operacoes, pesos_lista)[0]
+            metodo, caminho, opcoes, esperado = requisicao(operacao, aleatorio)
+            inicio = time.perf_counter()
+            try:
+                r = await client.request(metodo, caminho, **opcoes)
+            except httpx.TransportError:
+                if inicio >= inicio_medicao:
+                    falhas_transporte[operacao] += 1
+                continue
+            duracao_requisicao = time.perf_counter() - inicio
+            if metodo == "POST" and caminho == "/clientes" and r.status_code == 201:
+                criados.append(r.json()["id"])
+            if inicio < inicio_medicao:
+                continue
+            if operacao == "deletar" and metodo == "POST":
+                operacao = "criar"
+            latencias[operacao].append(duracao_requisicao)
+            chave = str(r.status_code) if r.status_code == esperado else f"{r.status_code}!"
+            status_por_operacao[operacao][chave] = status_por_operacao[operacao].get(chave, 0) + 1
+
+    await asyncio.gather(*(trabalhador(n) for n in range(concorrencia)))
+    return latencias, status_por_operacao, falhas_transporte
+
+def resumir(valores: list, erros: int, duracao: float) -> dict:
+    return {
+        "requisicoes": len(valores),
+        "rps": round(len(valores) / duracao, 1),
+        "erros": erros,
+        "p50_ms": round(percentil(valores, 50), 2),
+        "p95_ms": round(percentil(valores, 95), 2),
+        "p99_ms": round(percentil(valores, 99), 2),
+    }
+
+async def medir(client, args, pesos) -> dict:
+    inicio = time.perf_counter()
+    ids = await pre_carregar(client, args.clientes)
+    print(f"Pré-carga: {len(ids)} clientes em {time.perf_counter() - inicio:.1f}s")
+
+    latencias, status_por_operacao, falhas = await executar_carga(
+        client, ids, pesos, args.concorrencia, args.duracao, args.aquecimento, args.semente
+    )
+    operacoes = {}
+    for operacao, valores in latencias.items():
+        erros = falhas[operacao] + sum(n for chave, n in status_por_operacao[operacao].items() if chave.endswith("!"))
+        operacoes[operacao] = {**resumir(valores, erros, args.duracao), "status": status_por_operacao[operacao]}
+    todas = [valor for valores in latencias.values() for valor in valores]
+    return {
+        "total": resumir(todas, sum(o["erros"] for o in operacoes.values()), args.duracao),
+        "operacoes": operacoes,
+    }
+
+def executar(args, pesos) -> dict:
+    limites = httpx.Limits(max_connections=args.concorrencia, max_keepalive_connections=args.concorrencia)
+    with servidor_mock_openai(args.latencia_openai) as base_url:
+        env_openai = {"OPENAI_BASE_URL": base_url, "OPENAI_API_KEY": "sk-mock"}
+
+        if args.modo == "uvicorn":
+            with servidor_api(args.app_dir, env_extra=env_openai) as url:
+                async def rodar():
+                    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60.0) as client:
+                        return await medir(client, args, pesos)
+                resultado = asyncio.run(rodar())
+        else:
+            os.environ.update(env_openai)
+            import main
+            with banco_temporario():
+                async def rodar():
+                    async with main.app.router.lifespan_context(main.app):
+                        transporte = httpx.ASGITransport(app=main.app)
+                        async with httpx.AsyncClient(transport=transporte, base_url="http://bench", timeout=60.0) as client:
+                            return await medir(client, args, pesos)
+                resultado = asyncio.run(rodar())
+
+        resultado["openai"] = httpx.get(base_url.removesuffix("/v1") + "/chamadas").json()
+    return resultado
+
+def imprimir(resultado: dict):
+    print(f"\n{'Operação':<10} {'N':>7} {'req/s':>8} {'Erros':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    linhas = list(resultado["operacoes"].items()) + [("total", resultado["total"])]
+    for operacao, dados in linhas:
+        print(f"{operacao:<10} {dados['requisicoes']:>7} {dados['rps']:>8.1f} {dados['erros']:>6} "
+              f"{dados['p50_ms']:>10.1f} {dados['p95_ms']:>10.1f} {dados['p99_ms']:>10.1f}")
+    print(f"\nChamadas ao mock da OpenAI: {resultado['openai']['chamadas']}")
+
+def comparar(resultado: dict, anterior: dict, tolerancia: float) -> bool:
+    """Imprime a variação contra um resultado anterior; retorna False se houve regressão"""
+    print(f"\nComparação com {anterior.get('commit') or '?'} ({anterior.get('data', '?')}, "
+          f"modo {anterior['parametros'].get('modo')}), tolerância {tolerancia:.0f}%")
+    print(f"{'Operação':<10} {'req/s':>16} {'p95 (ms)':>20}")
+    ok = True
+    atuais = {**resultado["operacoes"], "total": resultado["total"]}
+    antigos = {**anterior["operacoes"], "total": anterior["total"]}
+    for operacao, dados in atuais.items():
+        base = antigos.get(operacao)
+        if not base or not base["requisicoes"]:
+            continue
+        variacao_rps = (dados["rps"] / base["rps"] - 1) * 100 if base["rps"] else 0.0
+        variacao_p95 = (dados["p95_ms"] / base["p95_ms"] - 1) * 100 if base["p95_ms"] else 0.0
+        regrediu = variacao_p95 > tolerancia or (operacao == "total" and variacao_rps < -tolerancia)
+        ok = ok and not regrediu
+        print(f"{operacao:<10} {dados['rps']:>8.1f} {variacao_rps:>+6.1f}% {dados['p95_ms']:>10.1f} "
+              f"{variacao_p95:>+6.1f}%{'  ⚠️ regressão' if regrediu else ''}")
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modo", choices=("uvicorn", "processo"), default="uvicorn")
+    parser.add_argument("--app-dir", default=DIRETORIO_API, help="Outra versão da API (só no modo uvicorn)")
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--duracao", type=float, default=20.0)
+    parser.add_argument("--aquecimento", type=float, default=2.0)
+    parser.add_argument("--clientes", type=int, default=5000, help="Clientes pré-carregados")
+    parser.add_argument("--mix", default=MIX_PADRAO, help="Pesos das operações")
+    parser.add_argument("--latencia-openai", type=float, default=0.2)
+    parser.add_argument("--semente", type=int, default=1)
+    parser.add_argument("--saida", help="Arquivo JSON do resultado (padrão: benchmarks/resultados/carga-<data>.json)")
+    parser.add_argument("--comparar", help="Resultado JSON anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=15.0)
+    args = parser.parse_args()
+    pesos = interpretar_mix(args.mix)
+
+    print(f"Modo: {args.modo} | Concorrência: {args.concorrencia} | Duração: {args.duracao:.0f}s "
+          f"(+{args.aquecimento:.0f}s de aquecimento) | Mix: {args.mix}")
+    resultado = {
+        "data": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_atual(),
+        "parametros": {**vars(args), "mix": pesos},
+        "ambiente": {"python": platform.python_version(), "plataforma": platform.platform(), "cpus": os.cpu_count()},
+        **executar(args, pesos),
+    }
+    imprimir(resultado)
+
+    saida = args.saida or os.path.join(
+        DIRETORIO_BENCHMARKS, "resultados", f"carga-{datetime.now():%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+    print(f"Resultado salvo em {saida}")
+
+    if args.comparar:
+        with open(args.comparar, encoding="utf-8") as arquivo:
+            if not comparar(resultado, json.load(arquivo), args.tolerancia):
+                sys.exit(1)
+
+if __name__ == "__main__":
+    main()
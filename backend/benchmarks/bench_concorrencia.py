@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark de concorrência com carga mista de leitura/escrita
+Sobe a API com uvicorn em um diretório temporário (banco vazio) e dispara
+requisições concorrentes: 70% GET /clientes/{id}, 10% GET /clientes e
+20% POST /clientes, além de um GET /health periódico para medir o quanto
+o event loop fica bloqueado. Reporta p50/p95/p99 por operação.
+
+Uso:
+    python benchmarks/bench_concorrencia.py [--app-dir DIR] [--concorrencia 64] [--duracao 15]
+
+`--app-dir` permite rodar a mesma carga contra outra versão da API
+(por exemplo, um `git worktree` de um commit anterior) para comparação.
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from comum import DIRETORIO_API, gerar_cpf, percentil, servidor_api
+
+async def executar_carga(url, concorrencia, duracao):
+    latencias = {"obter": [], "listar": [], "criar": [], "health": []}
+    erros = 0
+    contador = iter(range(1, 10**9))
+    ids = []
+
+    limites = httpx.Limits(max_connections=concorrencia + 1, max_keepalive_connections=concorrencia + 1)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=30.0) as client:
+        for _ in range(200):
+            i = next(contador)
+            r = await client.post("/clientes", json={"nome": f"Cliente {i}", "email": f"c{i}@bench.com", "cpf_cnpj": gerar_cpf(i)})
+            ids.append(r.json()["id"])
+
+        fim = time.perf_counter() + duracao
+
+        async def trabalhador():
+            nonlocal erros
+            aleatorio = random.Random()
+            while time.perf_counter() < fim:
+                sorteio = aleatorio.random()
+                inicio = time.perf_counter()
+                try:
+                    if sorteio < 0.7:
+                        operacao = "obter"
+                        r = await client.get(f"/clientes/{aleatorio.choice(ids)}")
+                    elif sorteio < 0.8:
+                        operacao = "listar"
+                        r = await client.get("/clientes", params={"limit": 50})
+                    else:
+                        operacao = "criar"
+                        i = next(contador)
+                        r = await client.post("/clientes", json={"nome": f"Cliente {i}", "email": f"c{i}@bench.com", "cpf_cnpj": gerar_cpf(i)})
+                        if r.status_code == 201:
+                            ids.append(r.json()["id"])
+                except httpx.TransportError:
+                    erros += 1
+                    continue
+                latencias[operacao].append(time.perf_counter() - inicio)
+                if r.status_code >= 400:
+                    erros += 1
+
+        async def sonda_health():
+            while time.perf_counter() < fim:
+                inicio = time.perf_counter()
+                try:
+                    await client.get("/health")
+                except httpx.TransportError:
+                    continue
+                latencias["health"].append(time.perf_counter() - inicio)
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(sonda_health(), *(trabalhador() for _ in range(concorrencia)))
+    return latencias, erros
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=DIRETORIO_API)
+    parser.add_argument("--concorrencia", type=int, default=64)
+    parser.add_argument("--duracao", type=float, default=15.0)
+    args = parser.parse_args()
+
+    with servidor_api(args.app_dir) as url:
+        latencias, erros = asyncio.run(executar_carga(url, args.concorrencia, args.duracao))
+
+    total = sum(len(v) for k, v in latencias.items() if k != "health")
+    print(f"API: {args.app_dir}")
+    print(f"Concorrência: {args.concorrencia} | Duração: {args.duracao:.0f}s | "
+          f"Requisições: {total} ({total / args.duracao:.0f} req/s) | Erros: {erros}")
+    print(f"\n{'Operação':<10} {'N':>7} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    todas = []
+    for operacao, valores in latencias.items():
+        if operacao != "health":
+            todas.extend(valores)
+        print(f"{operacao:<10} {len(valores):>7} {percentil(valores, 50):>10.1f} "
+              f"{percentil(valores, 95):>10.1f} {percentil(valores, 99):>10.1f}")
+    print(f"{'mista':<10} {len(todas):>7} {percentil(todas, 50):>10.1f} "
+          f"{percentil(todas, 95):>10.1f} {percentil(todas, 99):>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Teste de carga de cadastros duplicados concorrentes
+Dispara rodadas de POST /clientes simultâneos com o mesmo email e/ou CPF/CNPJ
+e confere que exatamente um é criado e os demais recebem 400 com a mensagem
+correta, sem nenhum 500.
+
+Uso: python benchmarks/bench_duplicados.py [--rodadas 20] [--concorrencia 50]
+"""
+
+import argparse
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+
+from comum import banco_temporario, gerar_cpf
+
+from main import app
+
+CENARIOS = {
+    # nome: (email compartilhado, CPF compartilhado, mensagem esperada)
+    "email e CPF": (True, True, None),
+    "só email": (True, False, "Email já cadastrado"),
+    "só CPF": (False, True, "CPF/CNPJ já cadastrado"),
+}
+
+async def rodada(client, semente, concorrencia, email_igual, cpf_igual):
+    async def enviar(i):
+        email = f"dup{semente}@bench.com" if email_igual else f"dup{semente}-{i}@bench.com"
+        cpf = gerar_cpf(semente) if cpf_igual else gerar_cpf(semente * 1000 + i)
+        inicio = time.perf_counter()
+        r = await client.post("/clientes", json={"nome": "Duplicado", "email": email, "cpf_cnpj": cpf})
+        return r.status_code, r.json().get("detail"), time.perf_counter() - inicio
+    return await asyncio.gather(*(enviar(i) for i in range(concorrencia)))
+
+async def executar(rodadas, concorrencia):
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transporte, base_url="http://bench") as client:
+        semente = 1
+        print(f"{'Cenário':<12} {'201':>6} {'400':>6} {'500':>6} {'Msg. errada':>12} {'p99 (ms)':>10}")
+        for nome, (email_igual, cpf_igual, esperada) in CENARIOS.items():
+            status = Counter()
+            mensagens_erradas = 0
+            latencias = []
+            for _ in range(rodadas):
+                semente += 1
+                resultados = await rodada(client, semente, concorrencia, email_igual, cpf_igual)
+                criados = 0
+                for codigo, detalhe, duracao in resultados:
+                    status[codigo] += 1
+                    latencias.append(duracao)
+                    if codigo == 201:
+                        criados += 1
+                    elif codigo == 400 and esperada and detalhe != esperada:
+                        mensagens_erradas += 1
+                if criados != 1:
+                    mensagens_erradas += abs(criados - 1)
+            latencias.sort()
+            p99 = latencias[int(len(latencias) * 0.99)] * 1000
+            print(f"{nome:<12} {status[201]:>6} {status[400]:>6} {status[500]:>6} {mensagens_erradas:>12} {p99:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rodadas", type=int, default=20)
+    parser.add_argument("--concorrencia", type=int, default=50)
+    args = parser.parse_args()
+
+    with banco_temporario():
+        asyncio.run(executar(args.rodadas, args.concorrencia))
+
+if __name__ == "__main__":
+    main()
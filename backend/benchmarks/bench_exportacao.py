@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark da exportação da base de clientes
+Compara a leitura da base inteira paginando o GET /clientes (limit=100,
+por cursor, como na sincronização com o data warehouse) com o
+GET /clientes/export em NDJSON, CSV e Parquet. Mede tempo, linhas/s e o
+pico de memória alocada pelo Python durante cada leitura (tracemalloc, em
+uma execução à parte), em dois tamanhos de base para mostrar se a memória
+cresce com ela.
+
+Uso: python benchmarks/bench_exportacao.py [--clientes 20000,200000]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import time
+import tracemalloc
+from datetime import datetime
+from urllib.parse import urlencode
+
+from sqlalchemy import insert
+
+from comum import banco_temporario, gerar_clientes, main
+
+def popular(engine, total):
+    agora = datetime.utcnow()
+    with engine.begin() as conn:
+        lote = []
+        for cliente in gerar_clientes(total):
+            lote.append({**cliente, "created_at": agora})
+            if len(lote) == 50_000:
+                conn.execute(insert(main.ClienteDB), lote)
+                lote = []
+        if lote:
+            conn.execute(insert(main.ClienteDB), lote)
+
+async def requisitar(caminho: str, params: dict, ao_receber) -> dict:
+    """Chama a aplicação ASGI diretamente, entregando o corpo em pedaços a `ao_receber`
+
+    O ASGITransport do httpx acumula a resposta inteira em memória, o que
+    esconderia o streaming do servidor na medição.
+    """
+    headers = {}
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+        "scheme": "http", "path": caminho, "raw_path": caminho.encode(), "root_path": "",
+        "query_string": urlencode(params).encode(), "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 1), "server": ("bench", 80), "state": {},
+    }
+    enviado = False
+
+    async def receive():
+        nonlocal enviado
+        if not enviado:
+            enviado = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await asyncio.Event().wait()
+
+    async def send(mensagem):
+        if mensagem["type"] == "http.response.start":
+            headers.update((k.decode().lower(), v.decode()) for k, v in mensagem["headers"])
+        elif mensagem["type"] == "http.response.body":
+            ao_receber(mensagem.get("body", b""))
+
+    await main.app(scope, receive, send)
+    return headers
+
+async def paginar():
+    linhas, cursor = 0, None
+    while True:
+        corpo = bytearray()
+        headers = await requisitar("/clientes", {"limit": 100, **({"cursor": cursor} if cursor else {})}, corpo.extend)
+        linhas += len(json.loads(corpo))
+        cursor = headers.get("x-next-cursor")
+        if not cursor:
+            return linhas, None
+
+async def exportar(formato):
+    tamanho = 0
+
+    def contar(pedaco):
+        nonlocal tamanho
+        tamanho += len(pedaco)
+
+    await requisitar("/clientes/export", {"format": formato}, contar)
+    return None, tamanho
+
+async def medir(cenario, memoria: bool):
+    async with main.app.router.lifespan_context(main.app):
+        if memoria:
+            tracemalloc.start()
+        inicio = time.perf_counter()
+        resultado = await cenario()
+        duracao = time.perf_counter() - inicio
+        pico = tracemalloc.get_traced_memory()[1] if memoria else 0
+        tracemalloc.stop()
+    return duracao, pico, resultado
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", default="20000,200000", help="Tamanhos da base, separados por vírgula")
+    args = parser.parse_args()
+
+    # Sem cache de respostas, para medir a leitura do banco
+    main.cache_respostas = None
+    cenarios = [("paginação limit=100", paginar)]
+    for formato in ("ndjson", "csv", "parquet"):
+        if formato == "parquet" and importlib.util.find_spec("pyarrow") is None:
+            print("pyarrow não instalado: Parquet fora da comparação")
+            continue
+        cenarios.append((f"export {formato}", lambda formato=formato: exportar(formato)))
+
+    print(f"{'Cenário':<22} {'Linhas':>9} {'Tempo (s)':>10} {'Linhas/s':>10} {'Tamanho (MB)':>13} {'Pico mem. (MB)':>15}")
+    for total in (int(valor) for valor in args.clientes.split(",")):
+        with banco_temporario() as engine:
+            popular(engine, total)
+            for nome, cenario in cenarios:
+                # tracemalloc deixa as alocações bem mais lentas: tempo e memória em execuções separadas
+                duracao, _, (linhas, tamanho) = asyncio.run(medir(cenario, memoria=False))
+                _, pico, _ = asyncio.run(medir(cenario, memoria=True))
+                tamanho_mb = f"{tamanho / 1e6:.1f}" if tamanho is not None else "-"
+                print(f"{nome:<22} {total:>9} {duracao:>10.2f} {total / duracao:>10.0f} {tamanho_mb:>13} {pico / 1e6:>15.1f}")
+                if linhas is not None and linhas != total:
+                    print(f"  ⚠️ {linhas} linhas lidas de {total}")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Benchmark da extração local de notas fiscais (sem OpenAI)
+Mede o tempo de extrair_dados_nota por nota e quantas notas de um corpus
+sintético seriam respondidas sem chamar a OpenAI.
+
+Uso: python benchmarks/bench_extracao.py [--notas 20000]
+"""
+
+import argparse
+import random
+import time
+
+from comum import gerar_cnpj, main, percentil
+
+MODELOS = [
+    "NOTA FISCAL ELETRÔNICA - Supermercado Bom Preço LTDA - CNPJ: {cnpj}\n"
+    "Arroz 5kg R$ 25,00\nFeijão 1kg R$ 8,50\nLeite 1L R$ 4,99\n"
+    "SUBTOTAL R$ {subtotal}\nDesconto R$ 1,00\nTOTAL: R$ {total}\nData de emissão: {data}",
+    "CUPOM FISCAL\nAuto Posto Estrela {cnpj}\nGasolina comum 40,000 L\nVALOR TOTAL R$ {total}\n{data} 14:32",
+    "DROGARIA SÃO JOÃO - CNPJ {cnpj}\nDipirona 500mg - medicamento genérico\nTotal a pagar: {total}\nEmitida em {data}",
+    "Livraria Cultura\nCaderno universitário, canetas e lápis - material escolar\nValor total: R$ {total}\n{data}",
+    # Sem rótulo de total nem vocabulário conhecido: deve ir para a OpenAI
+    "Serviços diversos prestados conforme contrato\nValor R$ {total}\nReferência {data}",
+]
+
+def gerar_notas(total):
+    rng = random.Random(42)
+    notas = []
+    for i in range(total):
+        valor = rng.uniform(5, 5000)
+        cnpj = gerar_cnpj(i + 1)
+        notas.append(rng.choice(MODELOS).format(
+            cnpj=f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}",
+            subtotal=f"{valor + 1:.2f}".replace(".", ","),
+            total=f"{valor:,.2f}".replace(",", "X").replace(".", ",").replace("X", "."),
+            data=f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2024"
+        ))
+    return notas
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notas", type=int, default=20000)
+    args = parser.parse_args()
+
+    notas = gerar_notas(args.notas)
+    duracoes = []
+    confiaveis = 0
+    for texto in notas:
+        inicio = time.perf_counter()
+        extracao = main.extrair_dados_nota(texto)
+        duracoes.append(time.perf_counter() - inicio)
+        confiaveis += extracao.confiavel
+
+    print(f"Notas: {args.notas}")
+    print(f"Resolvidas localmente: {confiaveis} ({confiaveis / args.notas:.0%})")
+    print(f"Tempo por nota: média {sum(duracoes) / len(duracoes) * 1e6:.1f} µs | "
+          f"p50 {percentil(duracoes, 50) * 1000:.1f} µs | p99 {percentil(duracoes, 99) * 1000:.1f} µs")
+
+if __name__ == "__main__":
+    main_bench()
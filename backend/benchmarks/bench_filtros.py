@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos filtros e das estatísticas de clientes
+Compara o que um dashboard faz hoje para responder "clientes criados no
+mês" e "CPF x CNPJ" (baixar a base inteira pela exportação e contar do
+lado dele) com `GET /clientes/stats`, que agrega no banco lendo só os
+índices parciais (tipo_documento, created_at, id) e (created_at, id). Mede
+também a listagem filtrada e ordenada por data e, direto no SQLite, a mesma
+contagem por tipo feita pela tabela (derivando o tipo do tamanho do
+cpf_cnpj, sem o índice) e pelo índice.
+
+Uso: python benchmarks/bench_filtros.py [--clientes 20000,200000]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+import httpx
+from sqlalchemy import insert, text
+
+from comum import banco_temporario, gerar_clientes, main
+
+REPETICOES = 5
+DIAS = 730
+
+def popular(engine, total):
+    # created_at espalhado pelos últimos dois anos, em ordem de id
+    inicio = datetime.utcnow() - timedelta(days=DIAS)
+    passo = timedelta(days=DIAS) / total
+    with engine.begin() as conn:
+        lote = []
+        for i, cliente in enumerate(gerar_clientes(total)):
+            lote.append({**cliente, "created_at": inicio + passo * i})
+            if len(lote) == 50_000:
+                conn.execute(insert(main.ClienteDB), lote)
+                lote = []
+        if lote:
+            conn.execute(insert(main.ClienteDB), lote)
+
+def contar_exportacao(response):
+    # O que o dashboard calcula hoje a partir da base inteira
+    por_tipo, por_mes = Counter(), Counter()
+    for linha in response.text.splitlines():
+        cliente = json.loads(linha)
+        por_tipo["cnpj" if len(cliente["cpf_cnpj"]) == 14 else "cpf"] += 1
+        por_mes[cliente["created_at"][:7]] += 1
+    return sum(por_tipo.values())
+
+async def medir(client, caminho, params, contar):
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        response = await client.get(caminho, params=params)
+        assert response.status_code == 200, response.text
+        resultado = contar(response)
+        tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return tempos[len(tempos) // 2] * 1000, resultado
+
+def medir_sql(engine, sql):
+    tempos = []
+    with engine.connect() as conn:
+        plano = conn.execute(text("EXPLAIN QUERY PLAN " + sql)).fetchall()[0][-1]
+        for _ in range(REPETICOES):
+            inicio = time.perf_counter()
+            linhas = conn.execute(text(sql)).fetchall()
+            tempos.append(time.perf_counter() - inicio)
+    tempos.sort()
+    return tempos[len(tempos) // 2] * 1000, sum(linha[1] for linha in linhas), plano
+
+async def cenario():
+    mes_passado = (datetime.utcnow() - timedelta(days=30)).isoformat()
+    async with main.app.router.lifespan_context(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            total_stats = lambda r: r.json()["total"]
+            return {
+                "export + contagem": await medir(client, "/clientes/export", {}, contar_exportacao),
+                "stats": await medir(client, "/clientes/stats", {}, total_stats),
+                "stats periodo=mes": await medir(client, "/clientes/stats", {"periodo": "mes"}, total_stats),
+                "stats último mês": await medir(
+                    client, "/clientes/stats", {"created_since": mes_passado}, total_stats
+                ),
+                "lista cnpj -created_at": await medir(
+                    client, "/clientes", {"tipo_documento": "cnpj", "sort": "-created_at", "limit": 100},
+                    lambda r: len(r.json())
+                ),
+            }
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clientes", default="20000,200000", help="Tamanhos da base, separados por vírgula")
+    args = parser.parse_args()
+
+    main.cache_respostas = None
+    main.OUTBOX_HABILITADO = False
+    print(f"{'Base':>9} {'Cenário':<24} {'Mediana (ms)':>13} {'Resultado':>10}  Plano")
+    for total in (int(valor) for valor in args.clientes.split(",")):
+        with banco_temporario() as engine:
+            popular(engine, total)
+            resultados = asyncio.run(cenario())
+            for nome, (ms, resultado) in resultados.items():
+                print(f"{total:>9} {nome:<24} {ms:>13.2f} {resultado:>10}")
+            consultas = {
+                "SQL pela tabela": (
+                    "SELECT CASE WHEN length(cpf_cnpj) = 14 THEN 'cnpj' ELSE 'cpf' END, count(*) "
+                    "FROM clientes NOT INDEXED WHERE deleted_at IS NULL GROUP BY 1"
+                ),
+                "SQL pelo índice": (
+                    "SELECT tipo_documento, count(*) FROM clientes WHERE deleted_at IS NULL GROUP BY tipo_documento"
+                ),
+            }
+            for nome, sql in consultas.items():
+                ms, resultado, plano = medir_sql(engine, sql)
+                print(f"{total:>9} {nome:<24} {ms:>13.2f} {resultado:>10}  {plano}")
+
+if __name__ == "__main__":
+    main_bench()
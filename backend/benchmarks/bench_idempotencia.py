@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark da Idempotency-Key em novas tentativas de clientes
+Simula clientes que reenviam a requisição (timeout do lado deles): cada
+cadastro e cada análise de nota é enviado `--tentativas` vezes, parte em
+paralelo e parte logo depois da primeira resposta, contra a API com vários
+workers e o mock da OpenAI. Compara sem e com o header `Idempotency-Key`:
+clientes criados, erros "já cadastrado" devolvidos ao cliente, chamadas
+pagas à OpenAI e a latência das respostas repetidas.
+
+Uso:
+    python benchmarks/bench_idempotencia.py [--cadastros 200] [--notas 50]
+        [--tentativas 3] [--concorrencia 20] [--workers 2] [--latencia 0.5] [--app-dir DIR]
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from collections import Counter
+
+import httpx
+
+from comum import DIRETORIO_API, gerar_clientes, percentil, servidor_api, servidor_mock_openai
+
+def texto_nota(i: int) -> str:
+    return f"NOTA FISCAL Nº {i} - Farmácia Central - Total: R$ {i},90"
+
+async def executar(url, cadastros, notas, tentativas, concorrencia, com_chave):
+    status = Counter()
+    vagas = asyncio.Semaphore(concorrencia)
+    latencias = {"primeira": [], "paralela": [], "depois": []}
+    limites = httpx.Limits(max_connections=200)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120.0) as client:
+        async def enviar(caminho, corpo, chave, tipo):
+            headers = {"Idempotency-Key": chave} if com_chave else {}
+            inicio = time.perf_counter()
+            r = await client.post(caminho, json=corpo, headers=headers)
+            latencias[tipo].append(time.perf_counter() - inicio)
+            status[f"{caminho} {r.status_code}"] += 1
+
+        async def com_novas_tentativas(caminho, corpo):
+            # Metade das repetições sai junto com a primeira (timeout curto do
+            # cliente), a outra metade depois que ela responde
+            chave = str(uuid.uuid4())
+            paralelas = tentativas // 2
+            async with vagas:
+                await asyncio.gather(
+                    enviar(caminho, corpo, chave, "primeira"),
+                    *(enviar(caminho, corpo, chave, "paralela") for _ in range(paralelas))
+                )
+                for _ in range(tentativas - 1 - paralelas):
+                    await enviar(caminho, corpo, chave, "depois")
+
+        inicio = time.perf_counter()
+        await asyncio.gather(
+            *(com_novas_tentativas("/clientes", cliente) for cliente in gerar_clientes(cadastros)),
+            *(com_novas_tentativas("/analisar-nota", {"texto": texto_nota(i)}) for i in range(notas))
+        )
+        duracao = time.perf_counter() - inicio
+        criados = len((await client.get("/clientes", params={"limit": cadastros * tentativas})).json())
+    return duracao, status, criados, latencias
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cadastros", type=int, default=200)
+    parser.add_argument("--notas", type=int, default=50)
+    parser.add_argument("--tentativas", type=int, default=3, help="Envios de cada requisição")
+    parser.add_argument("--concorrencia", type=int, default=20, help="Cadastros/notas em andamento ao mesmo tempo")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--latencia", type=float, default=0.5, help="Latência do mock da OpenAI (s)")
+    parser.add_argument("--app-dir", default=DIRETORIO_API)
+    args = parser.parse_args()
+
+    print(f"Cadastros: {args.cadastros} | Notas: {args.notas} | Envios de cada: {args.tentativas} | "
+          f"Concorrência: {args.concorrencia} | Workers: {args.workers}\n")
+    for com_chave in (False, True):
+        with servidor_mock_openai(args.latencia) as base_url:
+            env = {"OPENAI_API_KEY": "sk-mock-benchmark", "OPENAI_BASE_URL": base_url, "EXTRACAO_LOCAL_MODO": "desligado"}
+            with servidor_api(args.app_dir, env, workers=args.workers) as url:
+                duracao, status, criados, latencias = asyncio.run(
+                    executar(url, args.cadastros, args.notas, args.tentativas, args.concorrencia, com_chave)
+                )
+            chamadas = httpx.get(base_url.removesuffix("/v1") + "/chamadas").json()["chamadas"]
+        print(f"{'Com' if com_chave else 'Sem'} Idempotency-Key ({duracao:.1f}s)")
+        print("  Status: " + ", ".join(f"{chave}: {n}" for chave, n in sorted(status.items())))
+        print(f"  Clientes criados: {criados} de {args.cadastros} | Chamadas à OpenAI: {chamadas} para {args.notas} notas")
+        print("  Latência p50/p95 (ms): " + " | ".join(
+            f"{tipo} {percentil(valores, 50):.0f}/{percentil(valores, 95):.0f}" for tipo, valores in latencias.items()
+        ) + "\n")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark do POST /clientes/bulk
+Importa N clientes válidos via NDJSON e CSV e mede registros por segundo.
+Uso: python benchmarks/bench_importacao.py [total_registros]
+"""
+
+import json
+import sys
+import time
+
+from comum import banco_temporario, gerar_clientes
+
+from fastapi.testclient import TestClient
+
+from main import app
+
+TOTAL = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+def corpo_ndjson(clientes):
+    return "".join(json.dumps(c) + "\n" for c in clientes).encode()
+
+def corpo_csv(clientes):
+    linhas = ["nome,email,cpf_cnpj"] + [f"{c['nome']},{c['email']},{c['cpf_cnpj']}" for c in clientes]
+    return ("\n".join(linhas) + "\n").encode()
+
+def importar(client, corpo, content_type):
+    inicio = time.perf_counter()
+    response = client.post(
+        "/clientes/bulk",
+        params={"notificar": "false"},
+        content=corpo,
+        headers={"Content-Type": content_type}
+    )
+    duracao = time.perf_counter() - inicio
+    assert response.status_code == 200, response.text
+    resumo = json.loads(response.text.strip().rsplit("\n", 1)[-1])["resumo"]
+    return duracao, resumo
+
+def main():
+    client = TestClient(app)
+    cenarios = [
+        ("NDJSON", corpo_ndjson, "application/x-ndjson", 1),
+        ("CSV", corpo_csv, "text/csv", TOTAL + 1),
+    ]
+    print(f"{'Formato':<10} {'Registros':>10} {'Criados':>10} {'Tempo (s)':>10} {'Registros/s':>12}")
+    for nome, gerar_corpo, content_type, inicio in cenarios:
+        with banco_temporario():
+            corpo = gerar_corpo(list(gerar_clientes(TOTAL, inicio=inicio)))
+            duracao, resumo = importar(client, corpo, content_type)
+            print(f"{nome:<10} {TOTAL:>10} {resumo['criados']:>10} {duracao:>10.2f} {TOTAL / duracao:>12.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark do POST /analisar-notas/lote contra o /analisar-nota nota a nota
+Analisa o mesmo conjunto de notas (textos distintos, sem cache) das duas
+formas, usando o mock local da OpenAI, e compara tempo total, número de
+chamadas à OpenAI e tokens estimados.
+
+Uso:
+    python benchmarks/bench_lote.py [--notas 300] [--concorrencia 50] [--latencia 0.5]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from comum import percentil, servidor_api, servidor_mock_openai
+
+def gerar_notas(total, prefixo):
+    return [
+        f"NOTA FISCAL {prefixo}-{i} - Supermercado Exemplo - CNPJ 11.222.333/0001-81 - "
+        f"Arroz 5kg R$ 25,00 - Feijão 1kg R$ 8,50 - Total: R$ {i},50 - Data: 15/08/2024"
+        for i in range(total)
+    ]
+
+async def contadores(base_url):
+    async with httpx.AsyncClient() as client:
+        return (await client.get(base_url.removesuffix("/v1") + "/chamadas")).json()
+
+async def individual(url, notas, concorrencia):
+    latencias = []
+    erros = 0
+    fila = iter(notas)
+    async with httpx.AsyncClient(base_url=url, timeout=300.0) as client:
+        async def trabalhador():
+            nonlocal erros
+            for texto in fila:
+                inicio = time.perf_counter()
+                r = await client.post("/analisar-nota", json={"texto": texto})
+                latencias.append(time.perf_counter() - inicio)
+                if r.status_code != 200:
+                    erros += 1
+        await asyncio.gather(*(trabalhador() for _ in range(concorrencia)))
+    return latencias, erros
+
+async def em_lote(url, notas):
+    latencias = []
+    erros = 0
+    resumo = None
+    inicio = time.perf_counter()
+    async with httpx.AsyncClient(base_url=url, timeout=300.0) as client:
+        async with client.stream("POST", "/analisar-notas/lote", json={"notas": [{"texto": t} for t in notas]}) as r:
+            async for linha in r.aiter_lines():
+                if not linha:
+                    continue
+                item = json.loads(linha)
+                if "resumo" in item:
+                    resumo = item["resumo"]
+                    continue
+                # Tempo até cada nota chegar ao cliente
+                latencias.append(time.perf_counter() - inicio)
+                if item["status"] != "ok":
+                    erros += 1
+    return latencias, erros, resumo
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notas", type=int, default=300)
+    parser.add_argument("--concorrencia", type=int, default=50, help="Requisições simultâneas no modo nota a nota")
+    parser.add_argument("--latencia", type=float, default=0.5)
+    args = parser.parse_args()
+
+    resultados = []
+    with servidor_mock_openai(args.latencia) as base_url:
+        env = {"OPENAI_API_KEY": "sk-mock-benchmark", "OPENAI_BASE_URL": base_url}
+        with servidor_api(env_extra=env) as url:
+            for nome, prefixo in (("nota a nota", "A"), ("lote", "B")):
+                notas = gerar_notas(args.notas, prefixo)
+                antes = asyncio.run(contadores(base_url))
+                inicio = time.perf_counter()
+                if nome == "lote":
+                    latencias, erros, _ = asyncio.run(em_lote(url, notas))
+                else:
+                    latencias, erros = asyncio.run(individual(url, notas, args.concorrencia))
+                duracao = time.perf_counter() - inicio
+                depois = asyncio.run(contadores(base_url))
+                resultados.append((
+                    nome, duracao, latencias, erros,
+                    depois["chamadas"] - antes["chamadas"], depois["tokens"] - antes["tokens"]
+                ))
+
+    print(f"Notas: {args.notas} | Latência do mock: {args.latencia}s\n")
+    print(f"{'Modo':<12} {'Tempo (s)':>10} {'Notas/s':>9} {'p50 (ms)':>10} {'p99 (ms)':>10} "
+          f"{'Chamadas':>9} {'Tokens':>8} {'Erros':>6}")
+    for nome, duracao, latencias, erros, chamadas, tokens in resultados:
+        print(f"{nome:<12} {duracao:>10.2f} {args.notas / duracao:>9.1f} {percentil(latencias, 50):>10.1f} "
+              f"{percentil(latencias, 99):>10.1f} {chamadas:>9} {tokens:>8} {erros:>6}")
+
+if __name__ == "__main__":
+    main()
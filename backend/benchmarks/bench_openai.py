@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark do /analisar-nota contra um mock local da OpenAI
+Dispara uma rajada de análises (textos distintos, sem acerto de cache) e,
+ao mesmo tempo, mede a latência do GET /clientes, que não deve piorar
+enquanto as análises esperam a OpenAI.
+
+Uso:
+    python benchmarks/bench_openai.py [--analises 200] [--concorrencia 100] [--latencia 0.5] [--app-dir DIR]
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from comum import DIRETORIO_API, percentil, servidor_api, servidor_mock_openai
+
+async def executar(url, total, concorrencia):
+    limites = httpx.Limits(max_connections=concorrencia + 10)
+    async with httpx.AsyncClient(base_url=url, limits=limites, timeout=120.0) as client:
+        latencias_notas, latencias_clientes = [], []
+        erros = 0
+        fila = iter(range(total))
+        terminou = asyncio.Event()
+
+        async def analisar():
+            nonlocal erros
+            for i in fila:
+                inicio = time.perf_counter()
+                r = await client.post("/analisar-nota", json={"texto": f"NOTA FISCAL Nº {i} - Supermercado - Total: R$ {i},00"})
+                if r.status_code != 200:
+                    erros += 1
+                latencias_notas.append(time.perf_counter() - inicio)
+
+        async def sondar_clientes():
+            while not terminou.is_set():
+                inicio = time.perf_counter()
+                await client.get("/clientes", params={"limit": 10})
+                latencias_clientes.append(time.perf_counter() - inicio)
+                await asyncio.sleep(0.02)
+
+        sonda = asyncio.create_task(sondar_clientes())
+        inicio = time.perf_counter()
+        await asyncio.gather(*(analisar() for _ in range(concorrencia)))
+        duracao = time.perf_counter() - inicio
+        terminou.set()
+        await sonda
+    return duracao, latencias_notas, latencias_clientes, erros
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--analises", type=int, default=200)
+    parser.add_argument("--concorrencia", type=int, default=100)
+    parser.add_argument("--latencia", type=float, default=0.5)
+    parser.add_argument("--app-dir", default=DIRETORIO_API)
+    args = parser.parse_args()
+
+    with servidor_mock_openai(args.latencia) as base_url:
+        env = {"OPENAI_API_KEY": "sk-mock-benchmark", "OPENAI_BASE_URL": base_url}
+        with servidor_api(args.app_dir, env) as url:
+            duracao, notas, clientes, erros = asyncio.run(executar(url, args.analises, args.concorrencia))
+
+    print(f"API: {args.app_dir}")
+    print(f"Análises: {args.analises} | Concorrência: {args.concorrencia} | Latência do mock: {args.latencia}s")
+    print(f"Tempo total: {duracao:.1f}s | {args.analises / duracao:.1f} análises/s | Erros: {erros}\n")
+    print(f"{'Rota':<16} {'N':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    for nome, valores in (("/analisar-nota", notas), ("GET /clientes", clientes)):
+        print(f"{nome:<16} {len(valores):>6} {percentil(valores, 50):>10.1f} "
+              f"{percentil(valores, 95):>10.1f} {percentil(valores, 99):>10.1f}")
+
+if __name__ == "__main__":
+    main()
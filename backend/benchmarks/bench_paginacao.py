@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Benchmark de paginação do GET /clientes
+Compara o custo da página 1 e de uma página profunda usando `skip` (OFFSET)
+e `cursor` (keyset). Uso: python benchmarks/bench_paginacao.py [total_linhas]
+"""
+
+import sys
+import time
+from datetime import datetime
+
+from comum import banco_temporario
+
+from fastapi.testclient import TestClient
+from sqlalchemy import insert
+
+from main import app, ClienteDB, codificar_cursor
+
+TOTAL_LINHAS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+LIMITE = 100
+PAGINA_PROFUNDA = 10_000
+REPETICOES = 20
+
+def popular_banco(engine, total):
+    agora = datetime.utcnow()
+    lote = 50_000
+    with engine.begin() as conn:
+        for inicio in range(0, total, lote):
+            conn.execute(insert(ClienteDB), [
+                {
+                    "nome": f"Cliente {i}",
+                    "email": f"cliente{i}@bench.com",
+                    "cpf_cnpj": f"{i:011d}",
+                    "created_at": agora,
+                }
+                for i in range(inicio + 1, min(inicio + lote, total) + 1)
+            ])
+
+def medir(client, params):
+    tempos = []
+    for _ in range(REPETICOES):
+        inicio = time.perf_counter()
+        response = client.get("/clientes", params=params)
+        tempos.append(time.perf_counter() - inicio)
+        assert response.status_code == 200, response.text
+    tempos.sort()
+    return tempos[len(tempos) // 2] * 1000
+
+def main():
+    pagina = min(PAGINA_PROFUNDA, TOTAL_LINHAS // LIMITE)
+    with banco_temporario() as engine:
+        print(f"📥 Populando {TOTAL_LINHAS} clientes...")
+        popular_banco(engine, TOTAL_LINHAS)
+
+        client = TestClient(app)
+        skip_profundo = (pagina - 1) * LIMITE
+        # Os ids são sequenciais, então o cursor da página N aponta para o id skip_profundo
+        cursor_profundo = codificar_cursor(skip_profundo)
+        resultados = {
+            "skip página 1": medir(client, {"skip": 0, "limit": LIMITE}),
+            f"skip página {pagina}": medir(client, {"skip": skip_profundo, "limit": LIMITE}),
+            "cursor página 1": medir(client, {"cursor": codificar_cursor(0), "limit": LIMITE}),
+            f"cursor página {pagina}": medir(client, {"cursor": cursor_profundo, "limit": LIMITE}),
+        }
+
+    print(f"\n{'Cenário':<25} {'Mediana (ms)':>12}")
+    for nome, ms in resultados.items():
+        print(f"{nome:<25} {ms:>12.2f}")
+
+if __name__ == "__main__":
+    main()
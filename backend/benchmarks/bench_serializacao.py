@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark da serialização de uma página de clientes (limit=1000)
+Compara o caminho antigo (objetos ORM → ClienteResponse validado com
+from_attributes → JSON) com o caminho rápido do GET /clientes (tuplas de
+colunas → TypeAdapter de TypedDict → JSON), medindo só a serialização e
+a leitura + serialização, e confere que os dois geram o mesmo JSON.
+
+Uso: python benchmarks/bench_serializacao.py [--limite 1000] [--repeticoes 200]
+"""
+
+import argparse
+import statistics
+import time
+from datetime import datetime
+from typing import List
+
+from pydantic import TypeAdapter
+from sqlalchemy import insert, select
+from sqlalchemy.orm import Session
+
+from comum import banco_temporario, gerar_clientes, main
+
+# Caminho anterior do listar_clientes/obter_cliente
+lista_clientes_adapter = TypeAdapter(List[main.ClienteResponse])
+
+def serializar_antigo(clientes) -> bytes:
+    return lista_clientes_adapter.dump_json(lista_clientes_adapter.validate_python(clientes))
+
+def cronometrar(funcao, repeticoes):
+    funcao()
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append(time.perf_counter() - inicio)
+    return statistics.median(tempos) * 1000
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limite", type=int, default=1000)
+    parser.add_argument("--repeticoes", type=int, default=200)
+    args = parser.parse_args()
+
+    with banco_temporario() as engine:
+        with engine.begin() as conn:
+            agora = datetime.utcnow()
+            clientes = [{**cliente, "created_at": agora} for cliente in gerar_clientes(args.limite)]
+            # Nome acentuado e data sem microssegundos, para conferir o JSON nos casos de borda
+            clientes[0].update(nome="José Ñandú D'Ávila \"Zé\"", created_at=datetime(2024, 1, 1, 10, 0))
+            conn.execute(insert(main.ClienteDB), clientes)
+
+        with Session(engine) as db:
+            query_orm = select(main.ClienteDB).order_by(main.ClienteDB.id).limit(args.limite)
+            query_colunas = select(*main.COLUNAS_CLIENTE).order_by(main.ClienteDB.id).limit(args.limite)
+
+            def ler_orm():
+                objetos = db.scalars(query_orm).all()
+                db.expunge_all()
+                return objetos
+
+            objetos = ler_orm()
+            linhas = db.execute(query_colunas).all()
+            antigo, novo = serializar_antigo(objetos), main.lista_clientes_json(linhas)
+            if antigo != novo:
+                raise SystemExit("❌ Os dois caminhos geraram JSON diferente")
+
+            resultados = {
+                "serialização (antigo)": cronometrar(lambda: serializar_antigo(objetos), args.repeticoes),
+                "serialização (rápido)": cronometrar(lambda: main.lista_clientes_json(linhas), args.repeticoes),
+                "leitura + serial. (antigo)": cronometrar(lambda: serializar_antigo(ler_orm()), args.repeticoes),
+                "leitura + serial. (rápido)": cronometrar(
+                    lambda: main.lista_clientes_json(db.execute(query_colunas).all()), args.repeticoes
+                ),
+            }
+
+    print(f"Página de {args.limite} clientes, JSON idêntico ({len(novo)} bytes)\n")
+    print(f"{'Cenário':<28} {'Mediana (ms)':>12}")
+    for nome, ms in resultados.items():
+        print(f"{nome:<28} {ms:>12.2f}")
+
+if __name__ == "__main__":
+    main_bench()
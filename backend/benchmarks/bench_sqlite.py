@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Benchmark do perfil de armazenamento do SQLite
+Mede a vazão de leituras por id enquanto escritores inserem clientes em
+paralelo, com o perfil "padrao" (journal de rollback) e "producao" (WAL + PRAGMAs).
+
+Uso: python benchmarks/bench_sqlite.py [--leitores 8] [--escritores 2] [--duracao 10]
+"""
+
+import argparse
+import random
+import threading
+import time
+from datetime import datetime
+
+from comum import banco_temporario, gerar_cpf
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import OperationalError
+
+from main import ClienteDB
+
+POPULACAO_INICIAL = 50_000
+
+def percentil(valores, p):
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))] * 1000
+
+def executar(perfil, leitores, escritores, duracao):
+    with banco_temporario(perfil) as engine:
+        agora = datetime.utcnow()
+        with engine.begin() as conn:
+            conn.execute(insert(ClienteDB), [
+                {"nome": f"Cliente {i}", "email": f"c{i}@bench.com", "cpf_cnpj": gerar_cpf(i), "created_at": agora}
+                for i in range(1, POPULACAO_INICIAL + 1)
+            ])
+
+        fim = time.perf_counter() + duracao
+        proximo = iter(range(POPULACAO_INICIAL + 1, 10**9))
+        trava = threading.Lock()
+        resultado = {"leituras": 0, "escritas": 0, "bloqueios": 0, "latencias": []}
+
+        def leitor():
+            aleatorio = random.Random()
+            latencias = []
+            leituras = bloqueios = 0
+            consulta = select(ClienteDB.id, ClienteDB.nome, ClienteDB.email)
+            while time.perf_counter() < fim:
+                inicio = time.perf_counter()
+                try:
+                    with engine.connect() as conn:
+                        conn.execute(consulta.where(ClienteDB.id == aleatorio.randint(1, POPULACAO_INICIAL))).first()
+                    leituras += 1
+                    latencias.append(time.perf_counter() - inicio)
+                except OperationalError:
+                    bloqueios += 1
+            with trava:
+                resultado["leituras"] += leituras
+                resultado["bloqueios"] += bloqueios
+                resultado["latencias"].extend(latencias)
+
+        def escritor():
+            escritas = bloqueios = 0
+            while time.perf_counter() < fim:
+                with trava:
+                    i = next(proximo)
+                try:
+                    with engine.begin() as conn:
+                        conn.execute(insert(ClienteDB).values(
+                            nome=f"Cliente {i}", email=f"c{i}@bench.com", cpf_cnpj=gerar_cpf(i), created_at=datetime.utcnow()
+                        ))
+                    escritas += 1
+                except OperationalError:
+                    bloqueios += 1
+            with trava:
+                resultado["escritas"] += escritas
+                resultado["bloqueios"] += bloqueios
+
+        threads = [threading.Thread(target=leitor) for _ in range(leitores)]
+        threads += [threading.Thread(target=escritor) for _ in range(escritores)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    return resultado
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--leitores", type=int, default=8)
+    parser.add_argument("--escritores", type=int, default=2)
+    parser.add_argument("--duracao", type=float, default=10.0)
+    args = parser.parse_args()
+
+    print(f"Leitores: {args.leitores} | Escritores: {args.escritores} | Duração: {args.duracao:.0f}s\n")
+    print(f"{'Perfil':<10} {'Leituras/s':>11} {'p99 leitura (ms)':>17} {'Escritas/s':>11} {'Bloqueios':>10}")
+    for perfil in ("padrao", "producao"):
+        r = executar(perfil, args.leitores, args.escritores, args.duracao)
+        print(f"{perfil:<10} {r['leituras'] / args.duracao:>11.0f} {percentil(r['latencias'], 99):>17.2f} "
+              f"{r['escritas'] / args.duracao:>11.0f} {r['bloqueios']:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark do /analisar-nota/stream contra o /analisar-nota
+Sobe a API e o mock da OpenAI (que em stream manda o primeiro pedaço depois
+de `--ttft` e o resto ao longo da latência) e analisa notas inéditas pelos
+dois endpoints, com `--concorrencia` requisições simultâneas. Mede o tempo
+até o primeiro byte, até o primeiro campo, até o primeiro trecho do resumo
+e até o resultado completo.
+
+Uso:
+    python benchmarks/bench_streaming.py [--notas 50] [--concorrencia 5]
+        [--latencia 2.0] [--ttft 0.2] [--app-dir DIR]
+"""
+
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from comum import DIRETORIO_API, percentil, servidor_api, servidor_mock_openai
+
+def texto_nota(i: int, endpoint: str) -> str:
+    # Texto diferente a cada requisição: nada sai do cache de análises
+    return f"NOTA FISCAL Nº {i} ({endpoint}) - Farmácia Central - Total: R$ {i},90"
+
+async def analisar(client, i):
+    inicio = time.perf_counter()
+    r = await client.post("/analisar-nota", json={"texto": texto_nota(i, "json")})
+    assert r.status_code == 200, r.text
+    total = time.perf_counter() - inicio
+    # Sem stream, tudo chega junto no fim
+    return {"primeiro byte": total, "primeiro campo": total, "primeiro resumo": total, "resultado": total}
+
+async def analisar_stream(client, i):
+    tempos = {}
+    inicio = time.perf_counter()
+    async with client.stream("POST", "/analisar-nota/stream", json={"texto": texto_nota(i, "stream")}) as r:
+        assert r.status_code == 200, await r.aread()
+        evento = None
+        async for linha in r.aiter_lines():
+            tempos.setdefault("primeiro byte", time.perf_counter() - inicio)
+            if linha.startswith("event: "):
+                evento = linha[len("event: "):]
+            elif linha.startswith("data: "):
+                assert evento != "erro", linha
+                nome = {"campo": "primeiro campo", "resumo": "primeiro resumo", "resultado": "resultado"}[evento]
+                tempos.setdefault(nome, time.perf_counter() - inicio)
+                if evento == "resultado":
+                    json.loads(linha[len("data: "):])
+    return tempos
+
+async def executar(url, notas, concorrencia, analisar_nota):
+    vagas = asyncio.Semaphore(concorrencia)
+    async with httpx.AsyncClient(base_url=url, timeout=120.0) as client:
+        async def uma(i):
+            async with vagas:
+                return await analisar_nota(client, i)
+        resultados = await asyncio.gather(*(uma(i) for i in range(notas)))
+    return {nome: [tempos[nome] for tempos in resultados] for nome in resultados[0]}
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--notas", type=int, default=50)
+    parser.add_argument("--concorrencia", type=int, default=5)
+    parser.add_argument("--latencia", type=float, default=2.0, help="Latência total do mock da OpenAI (s)")
+    parser.add_argument("--ttft", type=float, default=0.2, help="Tempo do mock até o primeiro pedaço do stream (s)")
+    parser.add_argument("--app-dir", default=DIRETORIO_API)
+    args = parser.parse_args()
+
+    print(f"Notas: {args.notas} | Concorrência: {args.concorrencia} | "
+          f"Latência do mock: {args.latencia}s (primeiro pedaço em {args.ttft}s)\n")
+    print(f"{'Endpoint':<22} {'Marco':<16} {'p50 (ms)':>9} {'p95 (ms)':>9}")
+    with servidor_mock_openai(args.latencia, ["--ttft", str(args.ttft)]) as base_url:
+        env = {"OPENAI_API_KEY": "sk-mock-benchmark", "OPENAI_BASE_URL": base_url, "EXTRACAO_LOCAL_MODO": "desligado"}
+        with servidor_api(args.app_dir, env) as url:
+            for nome, analisar_nota in (("/analisar-nota", analisar), ("/analisar-nota/stream", analisar_stream)):
+                tempos = asyncio.run(executar(url, args.notas, args.concorrencia, analisar_nota))
+                for marco, valores in tempos.items():
+                    print(f"{nome:<22} {marco:<16} {percentil(valores, 50):>9.0f} "
+                          f"{percentil(valores, 95):>9.0f}")
+
+if __name__ == "__main__":
+    main_bench()
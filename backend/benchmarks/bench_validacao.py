@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark da validação de CPF/CNPJ
+Compara a implementação anterior (uma string por vez, com re.sub e int() por
+caractere), a validação individual atual (motivo_documento) e a validação em
+lote com NumPy (validar_documentos_lote), conferindo que todas concordam.
+
+Uso: python benchmarks/bench_validacao.py [--documentos 1000000]
+"""
+
+import argparse
+import random
+import re
+import time
+
+from comum import gerar_cnpj, gerar_cpf, main
+
+def validar_cpf_anterior(cpf):
+    cpf = re.sub(r'[^\d]', '', cpf)
+    if len(cpf) != 11 or cpf == cpf[0] * 11:
+        return False
+    soma = sum(int(cpf[i]) * (10 - i) for i in range(9))
+    resto = soma % 11
+    if int(cpf[9]) != (0 if resto < 2 else 11 - resto):
+        return False
+    soma = sum(int(cpf[i]) * (11 - i) for i in range(10))
+    resto = soma % 11
+    return int(cpf[10]) == (0 if resto < 2 else 11 - resto)
+
+def validar_cnpj_anterior(cnpj):
+    cnpj = re.sub(r'[^\d]', '', cnpj)
+    if len(cnpj) != 14 or cnpj == cnpj[0] * 14:
+        return False
+    multiplicadores1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    soma = sum(int(cnpj[i]) * multiplicadores1[i] for i in range(12))
+    resto = soma % 11
+    if int(cnpj[12]) != (0 if resto < 2 else 11 - resto):
+        return False
+    multiplicadores2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+    soma = sum(int(cnpj[i]) * multiplicadores2[i] for i in range(13))
+    resto = soma % 11
+    return int(cnpj[13]) == (0 if resto < 2 else 11 - resto)
+
+def valido_anterior(documento):
+    # Mesmo caminho do antigo validar_cpf_cnpj: limpar, decidir pelo tamanho, validar
+    digitos = re.sub(r'[^\d]', '', documento)
+    if len(digitos) == 11:
+        return validar_cpf_anterior(digitos)
+    if len(digitos) == 14:
+        return validar_cnpj_anterior(digitos)
+    return False
+
+def valido_individual(documento):
+    return main.motivo_documento(main.RE_NAO_DIGITO.sub('', documento)) == main.MOTIVO_VALIDO
+
+def gerar_documentos(total):
+    """Mistura de CPFs e CNPJs válidos, formatados, com dígito errado e malformados"""
+    rng = random.Random(7)
+    documentos = []
+    for i in range(total):
+        sorteio = rng.random()
+        documento = gerar_cnpj(i + 1) if rng.random() < 0.2 else gerar_cpf(i + 1)
+        if sorteio < 0.1:
+            documento = documento[:-1] + str((int(documento[-1]) + 1) % 10)
+        elif sorteio < 0.15:
+            documento = documento[:-3]
+        elif sorteio < 0.17:
+            documento = documento[0] * len(documento)
+        elif sorteio < 0.4 and len(documento) == 11:
+            documento = f"{documento[:3]}.{documento[3:6]}.{documento[6:9]}-{documento[9:]}"
+        elif sorteio < 0.4:
+            documento = f"{documento[:2]}.{documento[2:5]}.{documento[5:8]}/{documento[8:12]}-{documento[12:]}"
+        documentos.append(documento)
+    return documentos
+
+def cronometrar(funcao):
+    inicio = time.perf_counter()
+    resultado = funcao()
+    return resultado, time.perf_counter() - inicio
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documentos", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    documentos = gerar_documentos(args.documentos)
+    anterior, t_anterior = cronometrar(lambda: [valido_anterior(d) for d in documentos])
+    individual, t_individual = cronometrar(lambda: [valido_individual(d) for d in documentos])
+    (mascara, motivos), t_lote = cronometrar(lambda: main.validar_documentos_lote(documentos))
+
+    assert anterior == individual == mascara.tolist(), "implementações discordam"
+    for codigo, descricao in main.MOTIVOS_DOCUMENTO.items():
+        print(f"  {descricao:<55} {int((motivos == codigo).sum()):>9}")
+    print(f"\nDocumentos: {args.documentos} (resultados idênticos nas três implementações)\n")
+    print(f"{'Implementação':<28} {'Tempo (s)':>10} {'Docs/s':>14} {'Ganho':>7}")
+    for nome, duracao in (("anterior (um por vez)", t_anterior),
+                          ("individual atual", t_individual),
+                          ("lote NumPy", t_lote)):
+        print(f"{nome:<28} {duracao:>10.3f} {args.documentos / duracao:>14,.0f} {t_anterior / duracao:>6.1f}x")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark de vazão por número de workers
+Sobe a API pelo ponto de entrada de produção (`python main.py --workers N`)
+com um banco temporário, para cada N pedido, e dispara a mesma carga mista
+do bench_carga.py a partir de vários processos geradores (um gerador só
+viraria o gargalo antes da API). Reporta req/s, p50/p95/p99 e o ganho
+sobre 1 worker.
+
+Uso:
+    python benchmarks/bench_workers.py [--workers 1,2,4] [--geradores 4] [--concorrencia 32] [--duracao 15]
+
+O ganho depende dos núcleos livres: com a API e os geradores na mesma
+máquina, rode com mais núcleos do que workers + geradores para medir a API.
+"""
+
+import argparse
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from bench_carga import executar_carga, interpretar_mix, pre_carregar, resumir
+from comum import DIRETORIO_API, servidor_api
+
+MIX_PADRAO = "obter=70,listar=10,criar=15,atualizar=5"
+
+def gerar_carga(url, ids, pesos, concorrencia, duracao, aquecimento, semente):
+    """Um processo gerador: roda a carga e devolve as latências por operação"""
+    async def rodar():
+        limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+        async with httpx.AsyncClient(base_url=url, limits=limites, timeout=60.0) as client:
+            return await executar_carga(client, ids, pesos, concorrencia, duracao, aquecimento, semente)
+    latencias, status_por_operacao, falhas = asyncio.run(rodar())
+    erros = sum(falhas.values()) + sum(
+        n for contagem in status_por_operacao.values() for chave, n in contagem.items() if chave.endswith("!")
+    )
+    return latencias, erros
+
+def medir(args, pesos, workers):
+    with servidor_api(args.app_dir, workers=workers, argumentos_extra=["--log-level", "warning"]) as url:
+        async def preparar():
+            async with httpx.AsyncClient(base_url=url, timeout=120.0) as client:
+                return await pre_carregar(client, args.clientes)
+        ids = asyncio.run(preparar())
+        with ProcessPoolExecutor(args.geradores) as executor:
+            futuros = [
+                executor.submit(gerar_carga, url, ids, pesos, args.concorrencia, args.duracao, args.aquecimento, semente)
+                for semente in range(1, args.geradores + 1)
+            ]
+            resultados = [futuro.result() for futuro in futuros]
+    todas = [valor for latencias, _ in resultados for valores in latencias.values() for valor in valores]
+    return resumir(todas, sum(erros for _, erros in resultados), args.duracao)
+
+def main_bench():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--app-dir", default=DIRETORIO_API)
+    parser.add_argument("--workers", default="1,2,4", help="Números de workers, separados por vírgula")
+    parser.add_argument("--geradores", type=int, default=4, help="Processos geradores de carga")
+    parser.add_argument("--concorrencia", type=int, default=32, help="Requisições simultâneas por gerador")
+    parser.add_argument("--duracao", type=float, default=15.0)
+    parser.add_argument("--aquecimento", type=float, default=2.0)
+    parser.add_argument("--clientes", type=int, default=2000)
+    parser.add_argument("--mix", default=MIX_PADRAO)
+    args = parser.parse_args()
+    pesos = interpretar_mix(args.mix)
+
+    print(f"Núcleos: {os.cpu_count()} | Geradores: {args.geradores} x {args.concorrencia} conexões | "
+          f"Duração: {args.duracao:.0f}s | Mix: {args.mix}")
+    print(f"\n{'Workers':>7} {'req/s':>9} {'Ganho':>7} {'Erros':>6} {'p50 (ms)':>10} {'p95 (ms)':>10} {'p99 (ms)':>10}")
+    base = None
+    for workers in (int(valor) for valor in args.workers.split(",")):
+        resultado = medir(args, pesos, workers)
+        base = base or resultado["rps"]
+        print(f"{workers:>7} {resultado['rps']:>9.1f} {resultado['rps'] / base:>6.2f}x {resultado['erros']:>6} "
+              f"{resultado['p50_ms']:>10.1f} {resultado['p95_ms']:>10.1f} {resultado['p99_ms']:>10.1f}")
+
+if __name__ == "__main__":
+    main_bench()
@@ -0,0 +1,170 @@
+"""
+Utilitários compartilhados pelos benchmarks
+Bancos temporários (SQLite e Postgres) e geração de CPF/CNPJ válidos em escala
+"""
+
+import asyncio
+import logging
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+from contextlib import contextmanager
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.orm import sessionmaker
+
+import main
+
+# Silenciar o log por requisição do cliente de teste
+logging.disable(logging.INFO)
+
+DIRETORIO_API = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DIRETORIO_BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+
+PESOS_CPF_1 = list(range(10, 1, -1))
+PESOS_CPF_2 = list(range(11, 1, -1))
+PESOS_CNPJ_1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+PESOS_CNPJ_2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
+
+def _digito(digitos, pesos):
+    resto = sum(d * p for d, p in zip(digitos, pesos)) % 11
+    return 0 if resto < 2 else 11 - resto
+
+def gerar_cpf(semente: int) -> str:
+    """CPF válido e determinístico para a semente (sementes distintas, CPFs distintos)"""
+    base = [int(c) for c in f"{semente % 10**9:09d}"]
+    if len(set(base)) == 1:
+        base[-1] = (base[-1] + 1) % 10
+    base.append(_digito(base, PESOS_CPF_1))
+    base.append(_digito(base, PESOS_CPF_2))
+    return "".join(map(str, base))
+
+def gerar_cnpj(semente: int) -> str:
+    """CNPJ válido e determinístico para a semente (sementes distintas, CNPJs distintos)"""
+    base = [int(c) for c in f"{semente % 10**8:08d}0001"]
+    base.append(_digito(base, PESOS_CNPJ_1))
+    base.append(_digito(base, PESOS_CNPJ_2))
+    return "".join(map(str, base))
+
+def gerar_clientes(total: int, inicio: int = 1, proporcao_cnpj: float = 0.2):
+    """Gera dicionários de clientes válidos (nome, email, cpf_cnpj)"""
+    aleatorio = random.Random(inicio)
+    for i in range(inicio, inicio + total):
+        documento = gerar_cnpj(i) if aleatorio.random() < proporcao_cnpj else gerar_cpf(i)
+        yield {"nome": f"Cliente {i}", "email": f"cliente{i}@bench.com", "cpf_cnpj": documento}
+
+@contextmanager
+def banco_temporario(perfil: str = main.SQLITE_PERFIL):
+    """Aponta a aplicação para um banco SQLite descartável durante o bloco"""
+    originais = (main.engine, main.SessionLocal, main.async_engine, main.AsyncSessionLocal)
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{tmp}/bench.db"
+        engine = main.criar_engine(url, perfil)
+        main.Base.metadata.create_all(bind=engine)
+        main.engine = engine
+        main.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        main.async_engine = main.criar_engine_assincrono(url, perfil)
+        main.AsyncSessionLocal = async_sessionmaker(main.async_engine, autoflush=False, expire_on_commit=False)
+        try:
+            yield engine
+        finally:
+            engine.dispose()
+            main.engine, main.SessionLocal, main.async_engine, main.AsyncSessionLocal = originais
+
+@contextmanager
+def banco_postgres_temporario(url: str):
+    """Cria um banco descartável no servidor Postgres da URL e retorna a URL dele
+
+    O banco da URL só é usado para o CREATE/DROP DATABASE; nada nele é alterado.
+    """
+    url = main.normalizar_url_banco(url)
+    nome = f"bench_{os.getpid()}"
+    admin = create_engine(url, isolation_level="AUTOCOMMIT")
+    try:
+        with admin.connect() as conn:
+            conn.execute(text(f"DROP DATABASE IF EXISTS {nome}"))
+            conn.execute(text(f"CREATE DATABASE {nome}"))
+        try:
+            yield make_url(url).set(database=nome).render_as_string(hide_password=False)
+        finally:
+            with admin.connect() as conn:
+                conn.execute(text(f"DROP DATABASE IF EXISTS {nome} WITH (FORCE)"))
+    finally:
+        admin.dispose()
+
+def porta_livre() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def percentil(valores, p):
+    """Percentil p (0-100) de uma lista de durações em segundos, em milissegundos"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))] * 1000
+
+async def aguardar_url(url: str, tentativas: int = 100):
+    async with httpx.AsyncClient() as client:
+        for _ in range(tentativas):
+            try:
+                if (await client.get(url)).status_code < 500:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} não respondeu a tempo")
+
+@contextmanager
+def servidor_api(app_dir: str = DIRETORIO_API, env_extra: dict = None, argumentos_extra: list = None,
+                 workers: int = None):
+    """Sobe a API em um diretório temporário (banco novo) e retorna a URL base
+
+    Sem `workers`, roda o uvicorn direto em um processo; com `workers`, usa o
+    ponto de entrada de produção (`python main.py --workers N`).
+    """
+    porta = porta_livre()
+    url = f"http://127.0.0.1:{porta}"
+    env = dict(os.environ, OUTBOX_HABILITADO="false", N8N_WEBHOOK_URL="http://127.0.0.1:9/")
+    env.update(env_extra or {})
+    if workers is None:
+        comando = [sys.executable, "-m", "uvicorn", "main:app", "--app-dir", os.path.abspath(app_dir),
+                   "--port", str(porta), "--log-level", "warning", "--no-access-log"]
+    else:
+        comando = [sys.executable, os.path.join(os.path.abspath(app_dir), "main.py"),
+                   "--host", "127.0.0.1", "--port", str(porta), "--workers", str(workers)]
+    with tempfile.TemporaryDirectory() as tmp:
+        processo = subprocess.Popen(
+            [*comando, *(argumentos_extra or [])],
+            cwd=tmp, env=env
+        )
+        try:
+            asyncio.run(aguardar_url(f"{url}/health"))
+            yield url
+        finally:
+            processo.terminate()
+            processo.wait()
+
+@contextmanager
+def servidor_mock_openai(latencia: float = 0.5, argumentos_extra: list = None):
+    """Sobe o mock da OpenAI (benchmarks/mock_openai.py) e retorna a base_url para o SDK"""
+    porta = porta_livre()
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(DIRETORIO_BENCHMARKS, "mock_openai.py"),
+         "--porta", str(porta), "--latencia", str(latencia), *(argumentos_extra or [])]
+    )
+    try:
+        asyncio.run(aguardar_url(f"http://127.0.0.1:{porta}/chamadas"))
+        yield f"http://127.0.0.1:{porta}/v1"
+    finally:
+        processo.terminate()
+        processo.wait()
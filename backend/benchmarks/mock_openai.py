@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita a API de chat completions da OpenAI
+Responde com uma análise de nota fiscal em JSON após uma latência fixa,
+para benchmarks sem custo nem dependência de rede.
+
+Opcionalmente simula os limites da conta como a OpenAI: orçamentos de
+requisições e tokens por minuto que se recarregam continuamente (com
+rajada de até `--rajada` segundos de orçamento), 429 com `retry-after-ms`
+quando acabam, headers `x-ratelimit-remaining-*` e uma fração de 500/503.
+
+Com `"stream": true` responde em Server-Sent Events como a OpenAI: o primeiro
+pedaço sai depois de `--ttft` segundos e os demais (~4 caracteres cada, como
+um token) se espalham pelo resto da latência.
+
+Uso: python benchmarks/mock_openai.py [--porta 8100] [--latencia 0.5]
+        [--ttft 0.2] [--rpm 0] [--tpm 0] [--rajada 60] [--falhas 0.0]
+Na API: OPENAI_BASE_URL=http://127.0.0.1:8100/v1 OPENAI_API_KEY=sk-mock
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import random
+import re
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Mock OpenAI")
+app.state.latencia = 0.5
+app.state.ttft = 0.2
+app.state.chamadas = 0
+app.state.tokens = 0
+app.state.limitadas = 0
+app.state.falhas = 0
+app.state.taxa_falhas = 0.0
+
+class Balde:
+    """Orçamento por minuto recarregado continuamente (0 = sem limite)"""
+
+    def __init__(self, por_minuto: int, rajada: float):
+        self.por_minuto = por_minuto
+        self.capacidade = por_minuto * rajada / 60
+        self.saldo = self.capacidade
+        self.atualizado_em = time.monotonic()
+
+    def recarregar(self):
+        agora = time.monotonic()
+        self.saldo = min(self.capacidade, self.saldo + (agora - self.atualizado_em) * self.por_minuto / 60)
+        self.atualizado_em = agora
+
+    def espera(self, quantidade: float) -> float:
+        if not self.por_minuto or self.saldo >= quantidade:
+            return 0.0
+        return (quantidade - self.saldo) * 60 / self.por_minuto
+
+app.state.requisicoes = Balde(0, 60)
+app.state.orcamento_tokens = Balde(0, 60)
+
+ANALISE = {
+    "categoria": "alimentação",
+    "resumo": "Compra de alimentos no supermercado",
+    "valor_total": 33.5,
+    "data_emissao": "15/08/2024",
+    "cnpj_emissor": "11.222.333/0001-81",
+}
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    corpo = await request.json()
+    prompt = " ".join(m.get("content", "") for m in corpo.get("messages", []))
+    requisicoes, orcamento_tokens = app.state.requisicoes, app.state.orcamento_tokens
+    custo = len(prompt) // 4 + corpo.get("max_tokens", 0)
+    requisicoes.recarregar()
+    orcamento_tokens.recarregar()
+    espera = max(requisicoes.espera(1), orcamento_tokens.espera(min(custo, orcamento_tokens.capacidade)))
+    if espera > 0:
+        app.state.limitadas += 1
+        return JSONResponse(
+            status_code=429,
+            content={"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+            headers={"retry-after-ms": str(math.ceil(espera * 1000)), "retry-after": str(math.ceil(espera))}
+        )
+    if requisicoes.por_minuto:
+        requisicoes.saldo -= 1
+    if orcamento_tokens.por_minuto:
+        orcamento_tokens.saldo -= custo
+    limites = {
+        f"x-ratelimit-remaining-{nome}": str(max(0, int(balde.saldo)))
+        for nome, balde in (("requests", requisicoes), ("tokens", orcamento_tokens)) if balde.por_minuto
+    }
+
+    app.state.chamadas += 1
+    await asyncio.sleep(min(app.state.ttft, app.state.latencia) if corpo.get("stream") else app.state.latencia)
+    if random.random() < app.state.taxa_falhas:
+        app.state.falhas += 1
+        return JSONResponse(
+            status_code=random.choice((500, 503)),
+            content={"error": {"message": "The server had an error while processing your request", "type": "server_error"}}
+        )
+    # Prompt de lote (/analisar-notas/lote): um item por "### Nota N"
+    indices = [int(n) for n in re.findall(r"### Nota (\d+)", prompt)]
+    if indices:
+        conteudo = {"notas": [dict(ANALISE, indice=i) for i in indices]}
+    else:
+        conteudo = ANALISE
+    tokens_prompt = len(prompt) // 4
+    tokens_resposta = 60 * max(1, len(indices))
+    app.state.tokens += tokens_prompt + tokens_resposta
+    if corpo.get("stream"):
+        uso = corpo.get("stream_options", {}).get("include_usage")
+        return StreamingResponse(
+            pedacos_stream(json.dumps(conteudo, ensure_ascii=False), corpo, tokens_prompt, tokens_resposta, uso),
+            media_type="text/event-stream", headers=limites
+        )
+    return JSONResponse(headers=limites, content={
+        "id": f"chatcmpl-mock-{app.state.chamadas}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": corpo.get("model", "gpt-4o-mini"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": json.dumps(conteudo, ensure_ascii=False)},
+            "finish_reason": "stop",
+        }],
+        "usage": {
+            "prompt_tokens": tokens_prompt,
+            "completion_tokens": tokens_resposta,
+            "total_tokens": tokens_prompt + tokens_resposta,
+        },
+    })
+
+async def pedacos_stream(texto, corpo, tokens_prompt, tokens_resposta, uso):
+    base = {
+        "id": f"chatcmpl-mock-{app.state.chamadas}",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": corpo.get("model", "gpt-4o-mini"),
+    }
+
+    def pedaco(choices, usage=None):
+        return f"data: {json.dumps(dict(base, choices=choices, usage=usage), ensure_ascii=False)}\n\n"
+
+    trechos = [texto[i:i + 4] for i in range(0, len(texto), 4)]
+    intervalo = max(0.0, app.state.latencia - app.state.ttft) / max(1, len(trechos) - 1)
+    yield pedaco([{"index": 0, "delta": {"role": "assistant", "content": ""}, "finish_reason": None}])
+    for i, trecho in enumerate(trechos):
+        if i:
+            await asyncio.sleep(intervalo)
+        yield pedaco([{"index": 0, "delta": {"content": trecho}, "finish_reason": None}])
+    yield pedaco([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if uso:
+        yield pedaco([], {
+            "prompt_tokens": tokens_prompt,
+            "completion_tokens": tokens_resposta,
+            "total_tokens": tokens_prompt + tokens_resposta,
+        })
+    yield "data: [DONE]\n\n"
+
+@app.get("/chamadas")
+def chamadas():
+    return {
+        "chamadas": app.state.chamadas,
+        "tokens": app.state.tokens,
+        "limitadas": app.state.limitadas,
+        "falhas": app.state.falhas,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--porta", type=int, default=8100)
+    parser.add_argument("--latencia", type=float, default=0.5)
+    parser.add_argument("--ttft", type=float, default=0.2, help="Tempo até o primeiro pedaço nas respostas em stream (s)")
+    parser.add_argument("--rpm", type=int, default=0, help="Requisições por minuto (0 = sem limite)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens por minuto (0 = sem limite)")
+    parser.add_argument("--rajada", type=float, default=60, help="Segundos de orçamento acumuláveis")
+    parser.add_argument("--falhas", type=float, default=0.0, help="Fração das chamadas que respondem 500/503")
+    args = parser.parse_args()
+    app.state.latencia = args.latencia
+    app.state.ttft = args.ttft
+    app.state.requisicoes = Balde(args.rpm, args.rajada)
+    app.state.orcamento_tokens = Balde(args.tpm, args.rajada)
+    app.state.taxa_falhas = args.falhas
+    uvicorn.run(app, host="127.0.0.1", port=args.porta, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,533 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, Text
+from fastapi.responses import StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import create_engine, event, inspect, Column, Index, Integer, String, DateTime, Text, update, insert, select, or_, text, func, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
-from pydantic import BaseModel, EmailStr, field_validator
-from datetime import datetime
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool
+from starlette.datastructures import MutableHeaders
+from pydantic import BaseModel, EmailStr, TypeAdapter, ValidationError, field_validator, model_validator
+from datetime import datetime, timedelta, timezone
+from contextlib import AsyncExitStack, asynccontextmanager, contextmanager
+from contextvars import ContextVar
 import re
-from typing import List, Optional
+from typing import List, Optional, Tuple
+from typing_extensions import TypedDict
 import os
 import logging
 import json
+import codecs
+import csv
+import io
+import base64
+import binascii
+import asyncio
+import random
+import time
+import hashlib
+import bisect
+import heapq
+import itertools
+import threading
+import math
+import operator
+import unicodedata
+from collections import OrderedDict
 import httpx
-from openai import OpenAI
+import numpy as np
+from openai import AsyncOpenAI, APIConnectionError, InternalServerError, RateLimitError
 from dotenv import load_dotenv
 load_dotenv()
 
 N8N_WEBHOOK_URL = os.getenv("N8N_WEBHOOK_URL", "https://n8nwebhook.creatorsia.com/webhook/cliente-novo")
 
+# Configuração do dispatcher do outbox (entrega dos eventos ao N8N)
+OUTBOX_HABILITADO = os.getenv("OUTBOX_HABILITADO", "true").lower() in ("1", "true", "yes")
+OUTBOX_INTERVALO = float(os.getenv("OUTBOX_INTERVALO", "2.0"))
+OUTBOX_LOTE = int(os.getenv("OUTBOX_LOTE", "50"))
+OUTBOX_TIMEOUT = float(os.getenv("OUTBOX_TIMEOUT", "5.0"))
+OUTBOX_BACKOFF_BASE = float(os.getenv("OUTBOX_BACKOFF_BASE", "1.0"))
+OUTBOX_BACKOFF_MAX = float(os.getenv("OUTBOX_BACKOFF_MAX", "300.0"))
+OUTBOX_LEASE = float(os.getenv("OUTBOX_LEASE", "60.0"))
+
+# Importação, alteração e exclusão em massa: linhas gravadas por transação
+BULK_LOTE = int(os.getenv("BULK_LOTE", "2000"))
+# Ids aceitos por requisição no PATCH/DELETE /clientes/bulk
+BULK_MAX_IDS = int(os.getenv("BULK_MAX_IDS", "100000"))
+
+# Cache de respostas do GET /clientes e GET /clientes/{id}
+CACHE_HABILITADO = os.getenv("CACHE_HABILITADO", "true").lower() in ("1", "true", "yes")
+CACHE_TTL = float(os.getenv("CACHE_TTL", "30"))
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "10000"))
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+
+# Idempotency-Key no POST /clientes e no POST /analisar-nota
+ROTAS_IDEMPOTENTES = {"/clientes", "/analisar-nota"}
+IDEMPOTENCIA_TTL = float(os.getenv("IDEMPOTENCIA_TTL", "86400"))
+IDEMPOTENCIA_CACHE_MAX = int(os.getenv("IDEMPOTENCIA_CACHE_MAX", "10000"))
+# Quanto uma requisição espera pela primeira com a mesma chave antes de 409;
+# também é a validade da reserva, renovada enquanto a primeira roda
+IDEMPOTENCIA_ESPERA_MAX = float(os.getenv("IDEMPOTENCIA_ESPERA_MAX", "120"))
+# Intervalo de consulta ao banco quando a primeira roda em outro processo
+IDEMPOTENCIA_INTERVALO = float(os.getenv("IDEMPOTENCIA_INTERVALO", "0.1"))
+RE_CHAVE_IDEMPOTENCIA = re.compile(r'[\x21-\x7e]{1,255}')
+# Respostas que pedem nova tentativa não são guardadas (além dos 5xx)
+STATUS_NAO_GUARDADOS = {409, 429}
+# Headers da resposta guardados e repetidos junto com o corpo
+HEADERS_IDEMPOTENCIA = ("etag", "location", "retry-after")
+
+# Busca de clientes
+BUSCA_LIMITE_MAX = int(os.getenv("BUSCA_LIMITE_MAX", "100"))
+RE_TERMO_DOCUMENTO = re.compile(r'[\d.\-/\s]*\d[\d.\-/\s]*')
+RE_TOKEN_BUSCA = re.compile(r'\w+')
+RE_TERMO_EMAIL = re.compile(r'[^\s@]*\w[._][^\s@]*')
+
+# Exportação da base de clientes: linhas lidas do cursor por vez
+EXPORTACAO_LOTE = int(os.getenv("EXPORTACAO_LOTE", "5000"))
+# Recuo (s) do X-Exportado-Em: transações abertas no início da exportação
+# gravaram `updated_at` antes dele e só confirmam depois
+EXPORTACAO_MARGEM = float(os.getenv("EXPORTACAO_MARGEM", "300"))
+
+# Feed de alterações de clientes (GET /clientes/changes): página, long-poll e heartbeat do SSE
+ALTERACOES_LIMITE_MAX = int(os.getenv("ALTERACOES_LIMITE_MAX", "1000"))
+ALTERACOES_ESPERA_MAX = float(os.getenv("ALTERACOES_ESPERA_MAX", "30"))
+ALTERACOES_INTERVALO = float(os.getenv("ALTERACOES_INTERVALO", "1.0"))
+ALTERACOES_HEARTBEAT = float(os.getenv("ALTERACOES_HEARTBEAT", "15"))
+
+# Análise de notas fiscais: modelo, versão do prompt (incrementar sempre que
+# o prompt mudar, para não reaproveitar análises antigas) e cache de resultados
+OPENAI_MODELO = os.getenv("OPENAI_MODELO", "gpt-4o-mini")
+PROMPT_NOTA_VERSAO = "1"
+PROMPT_SISTEMA_NOTA = "Você é um assistente especializado em análise de notas fiscais brasileiras. Sempre responda em JSON válido."
+ANALISE_CACHE_MAX_ENTRADAS = int(os.getenv("ANALISE_CACHE_MAX_ENTRADAS", "5000"))
+ANALISE_CACHE_TTL = float(os.getenv("ANALISE_CACHE_TTL", str(24 * 3600)))
+
+# Cliente OpenAI compartilhado: pool de conexões HTTP e limite de chamadas simultâneas
+OPENAI_MAX_CONEXOES = int(os.getenv("OPENAI_MAX_CONEXOES", "20"))
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "60"))
+OPENAI_CONCORRENCIA = int(os.getenv("OPENAI_CONCORRENCIA", "8"))
+
+# Agendador das chamadas à OpenAI: orçamento por minuto da conta (0 = sem limite),
+# dividido entre os WEB_CONCURRENCY workers, fila e novas tentativas
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "200000"))
+OPENAI_FILA_MAX = int(os.getenv("OPENAI_FILA_MAX", "200"))
+OPENAI_TENTATIVAS = int(os.getenv("OPENAI_TENTATIVAS", "4"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "0.5"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+
+# Extração local antes da OpenAI: "local", "resumo" ou "desligado"
+EXTRACAO_LOCAL_MODO = os.getenv("EXTRACAO_LOCAL_MODO", "local").lower()
+EXTRACAO_CONFIANCA_MIN = float(os.getenv("EXTRACAO_CONFIANCA_MIN", "0.6"))
+EXTRACAO_PONTUACAO_MIN = float(os.getenv("EXTRACAO_PONTUACAO_MIN", "6.0"))
+
+# Análise de notas em lote
+LOTE_NOTAS_POR_CHAMADA = int(os.getenv("LOTE_NOTAS_POR_CHAMADA", "10"))
+LOTE_CONCORRENCIA = int(os.getenv("LOTE_CONCORRENCIA", "4"))
+LOTE_MAX_NOTAS = int(os.getenv("LOTE_MAX_NOTAS", "1000"))
+
+# Servidor (python main.py): workers, drenagem no desligamento e migração do esquema
+SERVIDOR_HOST = os.getenv("SERVIDOR_HOST", "0.0.0.0")
+SERVIDOR_PORTA = int(os.getenv("SERVIDOR_PORTA", "8000"))
+SERVIDOR_WORKERS = os.getenv("SERVIDOR_WORKERS", "1")
+SERVIDOR_DRENAGEM_TIMEOUT = float(os.getenv("SERVIDOR_DRENAGEM_TIMEOUT", "30"))
+DB_MIGRAR_NA_INICIALIZACAO = os.getenv("DB_MIGRAR_NA_INICIALIZACAO", "true").lower() in ("1", "true", "yes")
+
 # Configurar logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Métricas no formato de exposição do Prometheus (GET /metrics)
+METRICAS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRICAS_REQUISICAO_LENTA = float(os.getenv("METRICAS_REQUISICAO_LENTA", "1.0"))
+
+def _escapar_rotulo(valor) -> str:
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _formatar_rotulos(nomes: tuple, valores: tuple, extra: str = "") -> str:
+    pares = [f'{nome}="{_escapar_rotulo(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+class Contador:
+    """Contador monotônico, com rótulos opcionais"""
+    
+    tipo = "counter"
+    
+    def __init__(self, nome: str, descricao: str, rotulos: tuple = ()):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self._valores = {}
+        self._lock = threading.Lock()
+    
+    def inc(self, valor: float = 1.0, **rotulos):
+        chave = tuple(rotulos.get(nome, "") for nome in self.rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0.0) + valor
+    
+    def exportar(self) -> List[str]:
+        with self._lock:
+            valores = list(self._valores.items())
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {valor:g}" for chave, valor in valores]
+
+class Histograma:
+    """Histograma de durações (segundos) com buckets cumulativos"""
+    
+    tipo = "histogram"
+    
+    def __init__(self, nome: str, descricao: str, rotulos: tuple = (), buckets: tuple = METRICAS_BUCKETS):
+        self.nome = nome
+        self.descricao = descricao
+        self.rotulos = rotulos
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observar(self, valor: float, **rotulos):
+        chave = tuple(rotulos.get(nome, "") for nome in self.rotulos)
+        indice = bisect.bisect_left(self.buckets, valor)
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            serie[0][indice] += 1
+            serie[1] += valor
+            serie[2] += 1
+    
+    def exportar(self) -> List[str]:
+        with self._lock:
+            series = [(chave, list(contagens), soma, total) for chave, (contagens, soma, total) in self._series.items()]
+        linhas = []
+        for chave, contagens, soma, total in series:
+            acumulado = 0
+            for limite, contagem in zip(self.buckets, contagens):
+                acumulado += contagem
+                rotulos = _formatar_rotulos(self.rotulos, chave, 'le="%g"' % limite)
+                linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+            rotulos = _formatar_rotulos(self.rotulos, chave, 'le="+Inf"')
+            linhas.append(f"{self.nome}_bucket{rotulos} {total}")
+            linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {soma:.6f}")
+            linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {total}")
+        return linhas
+
+class RegistroMetricas:
+    def __init__(self):
+        self.metricas = []
+    
+    def contador(self, nome: str, descricao: str, rotulos: tuple = ()) -> Contador:
+        metrica = Contador(nome, descricao, rotulos)
+        self.metricas.append(metrica)
+        return metrica
+    
+    def histograma(self, nome: str, descricao: str, rotulos: tuple = (), buckets: tuple = METRICAS_BUCKETS) -> Histograma:
+        metrica = Histograma(nome, descricao, rotulos, buckets)
+        self.metricas.append(metrica)
+        return metrica
+    
+    def exportar(self) -> str:
+        linhas = []
+        for metrica in self.metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.descricao}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            linhas.extend(metrica.exportar())
+        return "\n".join(linhas) + "\n"
+
+metricas = RegistroMetricas()
+METRICA_HTTP_DURACAO = metricas.histograma(
+    "http_requisicao_duracao_segundos", "Duração das requisições HTTP por rota", ("metodo", "rota"))
+METRICA_HTTP_REQUISICOES = metricas.contador(
+    "http_requisicoes_total", "Requisições HTTP por rota e status", ("metodo", "rota", "status"))
+METRICA_DB_CONSULTAS = metricas.contador(
+    "db_consultas_total", "Comandos SQL executados", ("engine", "operacao"))
+METRICA_DB_DURACAO = metricas.histograma(
+    "db_consulta_duracao_segundos", "Duração dos comandos SQL", ("engine", "operacao"))
+METRICA_DB_ESPERA_POOL = metricas.histograma(
+    "db_pool_espera_segundos", "Espera por uma conexão livre no pool", ("engine",))
+METRICA_WEBHOOK_DURACAO = metricas.histograma(
+    "webhook_entrega_duracao_segundos", "Duração das entregas do webhook N8N")
+METRICA_WEBHOOK_ENTREGAS = metricas.contador(
+    "webhook_entregas_total", "Entregas do webhook N8N por resultado", ("resultado",))
+METRICA_OPENAI_DURACAO = metricas.histograma(
+    "openai_chamada_duracao_segundos", "Duração das chamadas à OpenAI (sem a espera na fila)")
+METRICA_OPENAI_CHAMADAS = metricas.contador(
+    "openai_chamadas_total", "Chamadas à OpenAI por resultado", ("resultado",))
+METRICA_OPENAI_TOKENS = metricas.contador(
+    "openai_tokens_total", "Tokens consumidos na OpenAI", ("tipo",))
+METRICA_OPENAI_NOVAS_TENTATIVAS = metricas.contador(
+    "openai_novas_tentativas_total", "Chamadas à OpenAI repetidas após 429, 5xx ou falha de conexão", ("motivo",))
+METRICA_OPENAI_FILA_CHEIA = metricas.contador(
+    "openai_fila_cheia_total", "Chamadas recusadas com 429 por fila de espera da OpenAI cheia")
+METRICA_ANALISES = metricas.contador(
+    "analises_nota_total", "Análises de nota fiscal por origem do resultado (HIT, MISS, COALESCED, LOCAL)", ("origem",))
+METRICA_ETAPA_DURACAO = metricas.histograma(
+    "etapa_duracao_segundos", "Duração das etapas instrumentadas dos endpoints", ("etapa",))
+
+class ContextoRequisicao:
+    """Etapas e consultas SQL de uma requisição, enviadas no header Server-Timing"""
+    
+    def __init__(self):
+        self.etapas = []
+        self.consultas = 0
+        self.tempo_db = 0.0
+        # Espera intencional (long-poll e SSE do feed de alterações, outra
+        # requisição com a mesma Idempotency-Key), fora do log de requisições lentas
+        self.espera = 0.0
+    
+    def server_timing(self, total: float) -> str:
+        partes = [f"{nome};dur={duracao * 1000:.2f}" for nome, duracao in self.etapas]
+        if self.consultas:
+            partes.append(f'db;dur={self.tempo_db * 1000:.2f};desc="{self.consultas} consultas"')
+        partes.append(f"total;dur={total * 1000:.2f}")
+        return ", ".join(partes)
+
+contexto_requisicao: ContextVar[Optional[ContextoRequisicao]] = ContextVar("contexto_requisicao", default=None)
+
+@contextmanager
+def etapa(nome: str):
+    """Mede uma etapa de um endpoint (histograma + Server-Timing da requisição)"""
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        duracao = time.perf_counter() - inicio
+        METRICA_ETAPA_DURACAO.observar(duracao, etapa=nome)
+        contexto = contexto_requisicao.get()
+        if contexto is not None:
+            contexto.etapas.append((nome, duracao))
+
+class MetricasMiddleware:
+    """Middleware ASGI: latência por rota, header Server-Timing e log de requisições lentas"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        contexto = ContextoRequisicao()
+        token = contexto_requisicao.set(contexto)
+        inicio = time.perf_counter()
+        status_resposta = 500
+        
+        async def enviar(mensagem):
+            nonlocal status_resposta
+            if mensagem["type"] == "http.response.start":
+                status_resposta = mensagem["status"]
+                MutableHeaders(scope=mensagem).append(
+                    "Server-Timing", contexto.server_timing(time.perf_counter() - inicio)
+                )
+            await send(mensagem)
+        
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            duracao = time.perf_counter() - inicio
+            # Rota pelo template (/clientes/{cliente_id}), não pelo caminho, para não explodir a cardinalidade
+            rota = getattr(scope.get("route"), "path", None)
+            if rota is None:
+                # Repetições e 400/409/422 do IdempotenciaMiddleware respondem antes do roteador
+                rota = scope["path"] if scope["path"] in ROTAS_IDEMPOTENTES else "nao_encontrada"
+            METRICA_HTTP_DURACAO.observar(duracao, metodo=scope["method"], rota=rota)
+            METRICA_HTTP_REQUISICOES.inc(metodo=scope["method"], rota=rota, status=status_resposta)
+            if duracao - contexto.espera >= METRICAS_REQUISICAO_LENTA:
+                etapas = ", ".join(f"{nome}={d * 1000:.1f}ms" for nome, d in contexto.etapas)
+                logger.warning(
+                    f"Requisição lenta: {scope['method']} {rota} {duracao * 1000:.0f}ms "
+                    f"({contexto.consultas} consultas, {contexto.tempo_db * 1000:.1f}ms no banco; {etapas})"
+                )
+            contexto_requisicao.reset(token)
+
+class IdempotenciaMiddleware:
+    """Middleware ASGI que aplica a Idempotency-Key aos POSTs de ROTAS_IDEMPOTENTES"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or scope["path"] not in ROTAS_IDEMPOTENTES:
+            await self.app(scope, receive, send)
+            return
+        chave = dict(scope["headers"]).get(b"idempotency-key")
+        if chave is None:
+            await self.app(scope, receive, send)
+            return
+        chave = chave.decode("latin-1")
+        if not RE_CHAVE_IDEMPOTENCIA.fullmatch(chave):
+            await enviar_json(send, 400, {"detail": "Idempotency-Key inválida: use até 255 caracteres ASCII visíveis"})
+            return
+        
+        # O corpo é lido inteiro para calcular o hash e depois entregue ao endpoint
+        partes = []
+        while True:
+            mensagem = await receive()
+            if mensagem["type"] == "http.disconnect":
+                return
+            partes.append(mensagem.get("body", b""))
+            if not mensagem.get("more_body"):
+                break
+        corpo = b"".join(partes)
+        hash_corpo = hashlib.blake2b(corpo, digest_size=16).hexdigest()
+        chave = f"{scope['path']}:{chave}"
+        
+        try:
+            entrada = await idempotencia.iniciar(chave, hash_corpo)
+        except HTTPException as e:
+            await enviar_json(send, e.status_code, {"detail": e.detail})
+            return
+        if entrada is not None:
+            if entrada["hash"] != hash_corpo:
+                await enviar_json(send, 422, {"detail": "Idempotency-Key já usada com outro corpo de requisição"})
+                return
+            await send({
+                "type": "http.response.start",
+                "status": entrada["status"],
+                "headers": [
+                    (b"content-type", entrada["tipo"].encode()),
+                    (b"content-length", str(len(entrada["corpo"].encode())).encode()),
+                    (b"idempotent-replayed", b"true"),
+                    *((nome.encode(), valor.encode("latin-1")) for nome, valor in entrada["headers"].items()),
+                ],
+            })
+            await send({"type": "http.response.body", "body": entrada["corpo"].encode()})
+            return
+        
+        entregue = False
+        async def receber():
+            nonlocal entregue
+            if not entregue:
+                entregue = True
+                return {"type": "http.request", "body": corpo, "more_body": False}
+            return await receive()
+        
+        resposta = {"status": 500, "tipo": "application/json", "headers": {}, "partes": []}
+        async def enviar(mensagem):
+            if mensagem["type"] == "http.response.start":
+                cabecalhos = MutableHeaders(scope=mensagem)
+                resposta["status"] = mensagem["status"]
+                resposta["tipo"] = cabecalhos.get("content-type", resposta["tipo"])
+                resposta["headers"] = {nome: cabecalhos[nome] for nome in HEADERS_IDEMPOTENCIA if nome in cabecalhos}
+            elif mensagem["type"] == "http.response.body":
+                resposta["partes"].append(mensagem.get("body", b""))
+            await send(mensagem)
+        
+        concluida = False
+        # Análises com fila e novas tentativas podem passar da validade da reserva
+        renovacao = asyncio.create_task(idempotencia.manter_reserva(chave))
+        try:
+            await self.app(scope, receber, enviar)
+            concluida = resposta["status"] < 500 and resposta["status"] not in STATUS_NAO_GUARDADOS
+        finally:
+            renovacao.cancel()
+            if concluida:
+                await idempotencia.concluir(
+                    chave, hash_corpo, resposta["status"], resposta["tipo"],
+                    b"".join(resposta["partes"]), resposta["headers"]
+                )
+            else:
+                # Erro do servidor, 409 ou 429: a chave é liberada para uma nova tentativa
+                await idempotencia.liberar(chave)
+
+async def enviar_json(send, status_code: int, conteudo: dict):
+    """Resposta JSON direto pelo `send` do ASGI (para os middlewares)"""
+    corpo = json.dumps(conteudo, ensure_ascii=False).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+OPERACOES_SQL = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "BEGIN", "COMMIT", "ROLLBACK", "SAVEPOINT", "RELEASE", "PRAGMA", "CREATE", "DROP", "ALTER"}
+
+def instrumentar_engine(engine_sincrono, nome: str):
+    """Conta e cronometra os comandos SQL de um engine (para o assíncrono, passe `.sync_engine`)"""
+    
+    @event.listens_for(engine_sincrono, "before_cursor_execute")
+    def antes_de_executar(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metricas_inicio", []).append(time.perf_counter())
+    
+    @event.listens_for(engine_sincrono, "after_cursor_execute")
+    def depois_de_executar(conn, cursor, statement, parameters, context, executemany):
+        inicios = conn.info.get("metricas_inicio")
+        if not inicios:
+            return
+        duracao = time.perf_counter() - inicios.pop()
+        palavras = statement.lstrip()[:16].split(None, 1)
+        operacao = palavras[0].upper() if palavras else ""
+        if operacao not in OPERACOES_SQL:
+            operacao = "OUTRA"
+        METRICA_DB_CONSULTAS.inc(engine=nome, operacao=operacao)
+        METRICA_DB_DURACAO.observar(duracao, engine=nome, operacao=operacao)
+        contexto = contexto_requisicao.get()
+        if contexto is not None:
+            contexto.consultas += 1
+            contexto.tempo_db += duracao
+    
+    @event.listens_for(engine_sincrono, "handle_error")
+    def erro_ao_executar(contexto_erro):
+        inicios = contexto_erro.connection.info.get("metricas_inicio") if contexto_erro.connection else None
+        if inicios:
+            inicios.pop()
+
+def pool_com_metricas(classe_pool, nome: str):
+    """Subclasse do pool que mede a espera por uma conexão (checkout)"""
+    
+    class PoolComMetricas(classe_pool):
+        def _do_get(self):
+            inicio = time.perf_counter()
+            try:
+                return super()._do_get()
+            finally:
+                METRICA_DB_ESPERA_POOL.observar(time.perf_counter() - inicio, engine=nome)
+    
+    PoolComMetricas.__name__ = f"{classe_pool.__name__}ComMetricas"
+    # O logger do pool vem do módulo da classe: mantém o do SQLAlchemy (sem os logs INFO do "main")
+    PoolComMetricas.__module__ = classe_pool.__module__
+    return PoolComMetricas
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Inicia e encerra os recursos de background da aplicação (um conjunto por worker)"""
+    # Conexões herdadas de um processo pai (gunicorn --preload faz fork depois
+    # do import) não podem ser compartilhadas: cada worker abre as suas
+    engine.dispose(close=False)
+    await async_engine.dispose(close=False)
+    if DB_MIGRAR_NA_INICIALIZACAO:
+        await run_in_threadpool(migrar_banco)
+    
+    dispatcher = OutboxDispatcher() if OUTBOX_HABILITADO else None
+    if dispatcher:
+        await dispatcher.iniciar()
+    app.state.outbox = dispatcher
+    try:
+        yield
+    finally:
+        if dispatcher:
+            await dispatcher.parar()
+        await fechar_clientes_openai()
+        await async_engine.dispose()
+        engine.dispose()
+
 # Configuração do FastAPI
 app = FastAPI(
     title="API de Clientes",
     description="API para gerenciamento de clientes com validação de CPF/CNPJ",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Idempotency-Key (adicionado primeiro: fica por dentro do CORS, que também
+# vale para as respostas repetidas)
+app.add_middleware(IdempotenciaMiddleware)
+
 # Configuração CORS
 app.add_middleware(
     CORSMiddleware,
@@ -35,26 +535,457 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag", "X-Cache", "Server-Timing", "X-Exportado-Em", "X-Ultimo-Seq",
+                    "Idempotent-Replayed"],
 )
 
-# Configuração do banco de dados SQLite
-SQLALCHEMY_DATABASE_URL = "sqlite:///./clientes.db"
-engine = create_engine(SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False})
+# Métricas por requisição (adicionado por último para medir também o CORS)
+app.add_middleware(MetricasMiddleware)
+
+# Configuração do banco de dados: SQLite local por padrão, Postgres via DATABASE_URL
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./clientes.db")
+
+# Perfil de armazenamento do SQLite: "producao" aplica WAL e os PRAGMAs abaixo
+# em toda conexão aberta; "padrao" mantém o comportamento padrão do SQLite
+SQLITE_PERFIL = os.getenv("SQLITE_PERFIL", "producao").lower()
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "65536")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_BYTES", str(256 * 1024 * 1024))),
+    "temp_store": "MEMORY",
+}
+
+# Pool de conexões por processo: o total de conexões (DB_CONEXOES_MAX) é
+# dividido entre os workers do servidor (WEB_CONCURRENCY)
+WEB_CONCURRENCY = max(1, int(os.getenv("WEB_CONCURRENCY", "1")))
+DB_CONEXOES_MAX = int(os.getenv("DB_CONEXOES_MAX", "40"))
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", str(max(5, DB_CONEXOES_MAX // WEB_CONCURRENCY))))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Só para servidores de banco (Postgres): pre-ping e reciclagem das conexões
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() == "true"
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def aplicar_perfil_sqlite(engine_sincrono):
+    """Registra os PRAGMAs do perfil de produção em toda nova conexão do engine"""
+    @event.listens_for(engine_sincrono, "connect")
+    def configurar_conexao(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma, valor in SQLITE_PRAGMAS.items():
+                cursor.execute(f"PRAGMA {pragma}={valor}")
+        finally:
+            cursor.close()
+
+# Driver síncrono quando a URL não escolhe um (postgres:// não é reconhecido pelo SQLAlchemy)
+DRIVERS_SINCRONOS = {
+    "postgres": "postgresql+psycopg2",
+    "postgresql": "postgresql+psycopg2",
+}
+
+def normalizar_url_banco(url: str) -> str:
+    """Fixa o driver síncrono das URLs sem driver explícito"""
+    url_banco = make_url(url)
+    driver = DRIVERS_SINCRONOS.get(url_banco.drivername)
+    if driver is None:
+        return url
+    return url_banco.set(drivername=driver).render_as_string(hide_password=False)
+
+def opcoes_engine(url: str, perfil: str, assincrono: bool = False) -> dict:
+    """Argumentos de create_engine para a URL e o perfil de armazenamento"""
+    url_banco = make_url(url)
+    opcoes = {}
+    opcoes_pool = dict(
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        poolclass=pool_com_metricas(
+            AsyncAdaptedQueuePool if assincrono else QueuePool,
+            "assincrono" if assincrono else "sincrono"
+        )
+    )
+    if url_banco.get_backend_name() == "sqlite":
+        opcoes["connect_args"] = {"check_same_thread": False}
+        em_memoria = url_banco.database in (None, "", ":memory:")
+        if perfil == "producao" and not em_memoria:
+            opcoes.update(opcoes_pool)
+    else:
+        # Servidor de banco: pool sempre, com pre-ping e reciclagem
+        opcoes.update(opcoes_pool, pool_pre_ping=DB_POOL_PRE_PING, pool_recycle=DB_POOL_RECYCLE)
+    return opcoes
+
+# Pacotes dos drivers de cada banco, para a mensagem de erro quando faltam
+PACOTES_DRIVERS = {
+    "postgresql": "psycopg2-binary asyncpg",
+}
+
+@contextmanager
+def driver_do_banco(url: str):
+    """Troca o ImportError de um driver ausente por uma mensagem com o pacote a instalar"""
+    try:
+        yield
+    except ImportError as e:
+        backend = make_url(url).get_backend_name()
+        pacotes = PACOTES_DRIVERS.get(backend)
+        if pacotes is None:
+            raise
+        raise RuntimeError(f"O banco {backend} requer os drivers (pip install {pacotes}): {e}") from e
+
+# Chave da trava (pg_advisory_xact_lock) que ordena as gravações em clientes_alteracoes
+CHAVE_TRAVA_ALTERACOES = 7305001
+
+def serializar_alteracoes(engine_sincrono):
+    """Postgres: uma transação por vez grava em clientes_alteracoes, até o commit"""
+    
+    @event.listens_for(engine_sincrono, "before_cursor_execute")
+    def travar_alteracoes(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().startswith("INSERT INTO clientes_alteracoes"):
+            cursor.execute(f"SELECT pg_advisory_xact_lock({CHAVE_TRAVA_ALTERACOES})")
+
+def criar_engine(url: str, perfil: str = SQLITE_PERFIL):
+    """Cria o engine síncrono aplicando o perfil de armazenamento"""
+    url = normalizar_url_banco(url)
+    with driver_do_banco(url):
+        engine_sincrono = create_engine(url, **opcoes_engine(url, perfil))
+    if perfil == "producao" and engine_sincrono.dialect.name == "sqlite":
+        aplicar_perfil_sqlite(engine_sincrono)
+    if engine_sincrono.dialect.name == "postgresql":
+        serializar_alteracoes(engine_sincrono)
+    instrumentar_engine(engine_sincrono, "sincrono")
+    return engine_sincrono
+
+# Drivers assíncronos usados pelos endpoints CRUD (o engine síncrono
+# continua servindo o dispatcher do outbox e a importação em massa, que rodam em threads)
+DRIVERS_ASSINCRONOS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+def url_assincrona(url: str) -> str:
+    """Converte a URL do banco para o driver assíncrono equivalente"""
+    url_banco = make_url(normalizar_url_banco(url))
+    driver = DRIVERS_ASSINCRONOS.get(url_banco.get_backend_name())
+    if driver is None:
+        raise ValueError(f"Banco sem driver assíncrono configurado: {url_banco.get_backend_name()}")
+    return url_banco.set(drivername=driver).render_as_string(hide_password=False)
+
+def criar_engine_assincrono(url: str, perfil: str = SQLITE_PERFIL):
+    """Cria o engine assíncrono aplicando o mesmo perfil de armazenamento"""
+    url = normalizar_url_banco(url)
+    with driver_do_banco(url):
+        engine_assincrono = create_async_engine(url_assincrona(url), **opcoes_engine(url, perfil, assincrono=True))
+    if perfil == "producao" and engine_assincrono.dialect.name == "sqlite":
+        aplicar_perfil_sqlite(engine_assincrono.sync_engine)
+    if engine_assincrono.dialect.name == "postgresql":
+        serializar_alteracoes(engine_assincrono.sync_engine)
+    instrumentar_engine(engine_assincrono.sync_engine, "assincrono")
+    return engine_assincrono
+
+engine = criar_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+async_engine = criar_engine_assincrono(SQLALCHEMY_DATABASE_URL)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
+def instante_criacao(contexto):
+    """Valor inicial do updated_at: o mesmo instante gravado em created_at"""
+    return contexto.get_current_parameters()["created_at"]
+
+def tipo_documento_de(cpf_cnpj: str) -> str:
+    """"cnpj" para 14 dígitos, "cpf" para os demais"""
+    return "cnpj" if len(cpf_cnpj) == 14 else "cpf"
+
+def tipo_documento_padrao(contexto):
+    """Valor do tipo_documento na inserção, a partir do CPF/CNPJ gravado"""
+    return tipo_documento_de(contexto.get_current_parameters()["cpf_cnpj"])
+
 # Modelo SQLAlchemy
 class ClienteDB(Base):
     __tablename__ = "clientes"
     
     id = Column(Integer, primary_key=True, index=True)
     nome = Column(String(100), nullable=False)
-    email = Column(String(100), unique=True, nullable=False, index=True)
-    cpf_cnpj = Column(String(18), unique=True, nullable=False, index=True)
+    email = Column(String(100), nullable=False)
+    cpf_cnpj = Column(String(18), nullable=False)
+    # Derivado do cpf_cnpj e gravado, para filtrar e agregar pelos índices
+    tipo_documento = Column(String(4), nullable=False, default=tipo_documento_padrao)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=instante_criacao, onupdate=datetime.utcnow, index=True)
+    # Exclusão lógica: o cliente apagado continua na tabela, fora das leituras
+    deleted_at = Column(DateTime, nullable=True)
+
+# Unicidade de email e CPF/CNPJ só entre os clientes ativos (índices parciais):
+# um cliente apagado libera o email e o documento para um novo cadastro
+for _campo in ("email", "cpf_cnpj"):
+    Index(
+        f"ux_clientes_{_campo}_ativo", getattr(ClienteDB, _campo), unique=True,
+        sqlite_where=ClienteDB.deleted_at.is_(None), postgresql_where=ClienteDB.deleted_at.is_(None)
+    )
+
+# Índices parciais da listagem e dos agregados (só clientes ativos); o deleted_at
+# no fim deixa o SQLite usar o índice como cobridor
+Index(
+    "ix_clientes_created_at_id", ClienteDB.created_at, ClienteDB.id, ClienteDB.deleted_at,
+    sqlite_where=ClienteDB.deleted_at.is_(None), postgresql_where=ClienteDB.deleted_at.is_(None)
+)
+# Busca por prefixo de e-mail fora do SQLite: a faixa é comparada em ordem de
+# bytes (collation "C"), que não depende do locale do banco
+Index(
+    "ix_clientes_email_prefixo", ClienteDB.email.collate("C"),
+    postgresql_where=ClienteDB.deleted_at.is_(None)
+).ddl_if(dialect="postgresql")
+Index(
+    "ix_clientes_tipo_documento_created_at_id",
+    ClienteDB.tipo_documento, ClienteDB.created_at, ClienteDB.id, ClienteDB.deleted_at,
+    sqlite_where=ClienteDB.deleted_at.is_(None), postgresql_where=ClienteDB.deleted_at.is_(None)
+)
+
+class ClienteAlteracaoDB(Base):
+    """Registro append-only das alterações de clientes, na ordem de `seq`"""
+    __tablename__ = "clientes_alteracoes"
+    __table_args__ = {"sqlite_autoincrement": True}
+    
+    seq = Column(Integer, primary_key=True)
+    cliente_id = Column(Integer, nullable=False, index=True)
+    operacao = Column(String(20), nullable=False)
+    dados = Column(Text, nullable=False)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+
+class OutboxEventoDB(Base):
+    """Evento pendente de entrega ao N8N, gravado na mesma transação do cliente"""
+    __tablename__ = "outbox_eventos"
+    
+    id = Column(Integer, primary_key=True, index=True)
+    tipo = Column(String(50), nullable=False)
+    payload = Column(Text, nullable=False)
+    tentativas = Column(Integer, nullable=False, default=0)
+    proxima_tentativa_em = Column(DateTime, nullable=False, default=datetime.utcnow, index=True)
+    ultimo_erro = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    enviado_em = Column(DateTime, nullable=True, index=True)
+
+class AnaliseNotaDB(Base):
+    """Resultado de uma análise de nota fiscal, indexado pelo hash do texto normalizado"""
+    __tablename__ = "analises_nota"
+    
+    chave = Column(String(64), primary_key=True)
+    modelo = Column(String(50), nullable=False)
+    prompt_versao = Column(String(20), nullable=False)
+    resultado = Column(Text, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
 
-# Criar tabelas
-Base.metadata.create_all(bind=engine)
+class IdempotenciaDB(Base):
+    """Resposta guardada de uma Idempotency-Key (status NULL: primeira requisição em andamento)"""
+    __tablename__ = "idempotencia"
+    
+    chave = Column(String(300), primary_key=True)
+    hash_corpo = Column(String(32), nullable=False)
+    status = Column(Integer, nullable=True)
+    tipo_conteudo = Column(String(100), nullable=True)
+    corpo = Column(Text, nullable=True)
+    headers = Column(Text, nullable=True)
+    expira_em = Column(DateTime, nullable=False, index=True)
+
+# Índice de busca de clientes (SQLite FTS5), mantido em sincronia por triggers
+DDL_BUSCA_CLIENTES = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS clientes_busca USING fts5(
+        nome, content='clientes', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4 5 6'
+    )""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS clientes_busca_documento USING fts5(
+        cpf_cnpj, content='clientes', content_rowid='id', tokenize='trigram'
+    )""",
+    # Só clientes ativos ficam no índice: a exclusão lógica tira o cliente e a
+    # restauração o devolve
+    """CREATE TRIGGER IF NOT EXISTS clientes_busca_ai AFTER INSERT ON clientes WHEN new.deleted_at IS NULL BEGIN
+        INSERT INTO clientes_busca(rowid, nome) VALUES (new.id, new.nome);
+        INSERT INTO clientes_busca_documento(rowid, cpf_cnpj) VALUES (new.id, new.cpf_cnpj);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS clientes_busca_ad AFTER DELETE ON clientes WHEN old.deleted_at IS NULL BEGIN
+        INSERT INTO clientes_busca(clientes_busca, rowid, nome) VALUES ('delete', old.id, old.nome);
+        INSERT INTO clientes_busca_documento(clientes_busca_documento, rowid, cpf_cnpj) VALUES ('delete', old.id, old.cpf_cnpj);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS clientes_busca_au AFTER UPDATE OF nome, cpf_cnpj, deleted_at ON clientes BEGIN
+        INSERT INTO clientes_busca(clientes_busca, rowid, nome) SELECT 'delete', old.id, old.nome WHERE old.deleted_at IS NULL;
+        INSERT INTO clientes_busca_documento(clientes_busca_documento, rowid, cpf_cnpj) SELECT 'delete', old.id, old.cpf_cnpj WHERE old.deleted_at IS NULL;
+        INSERT INTO clientes_busca(rowid, nome) SELECT new.id, new.nome WHERE new.deleted_at IS NULL;
+        INSERT INTO clientes_busca_documento(rowid, cpf_cnpj) SELECT new.id, new.cpf_cnpj WHERE new.deleted_at IS NULL;
+    END""",
+]
+
+@event.listens_for(Base.metadata, "after_create")
+def migrar_colunas(target, connection, **kw):
+    """Adiciona aos bancos já existentes as colunas criadas depois da tabela"""
+    colunas = {coluna["name"] for coluna in inspect(connection).get_columns("clientes")}
+    for nome in ("updated_at", "deleted_at", "tipo_documento"):
+        if nome not in colunas:
+            tipo = ClienteDB.__table__.c[nome].type.compile(dialect=connection.dialect)
+            connection.exec_driver_sql(f"ALTER TABLE clientes ADD COLUMN {nome} {tipo}")
+    if "updated_at" not in colunas:
+        connection.exec_driver_sql("UPDATE clientes SET updated_at = created_at")
+    if "tipo_documento" not in colunas:
+        connection.exec_driver_sql(
+            "UPDATE clientes SET tipo_documento = CASE WHEN length(cpf_cnpj) = 14 THEN 'cnpj' ELSE 'cpf' END"
+        )
+    if "headers" not in {coluna["name"] for coluna in inspect(connection).get_columns("idempotencia")}:
+        connection.exec_driver_sql("ALTER TABLE idempotencia ADD COLUMN headers TEXT")
+    # create_all não cria índices novos em tabelas que já existem
+    for indice in ClienteDB.__table__.indexes:
+        indice.create(connection, checkfirst=True)
+    # Índices únicos antigos (sobre todos os clientes), trocados pelos parciais
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_clientes_email")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_clientes_cpf_cnpj")
+
+@event.listens_for(Base.metadata, "after_create")
+def criar_indice_busca(target, connection, **kw):
+    """Cria o índice de busca no SQLite, populando-o a partir da tabela na primeira vez"""
+    if connection.dialect.name != "sqlite":
+        return
+    existia = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'clientes_busca'"
+    ).first()
+    trigger_atualizacao = connection.exec_driver_sql(
+        "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'clientes_busca_au'"
+    ).scalar()
+    desatualizado = trigger_atualizacao is not None and "deleted_at" not in trigger_atualizacao
+    if desatualizado:
+        # Triggers antigos indexavam também os apagados: recriados e o índice repopulado
+        for trigger in ("clientes_busca_ai", "clientes_busca_ad", "clientes_busca_au"):
+            connection.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    for ddl in DDL_BUSCA_CLIENTES:
+        connection.exec_driver_sql(ddl)
+    if not existia or desatualizado:
+        # 'rebuild' leria a tabela inteira, apagados inclusive
+        for tabela, coluna in (("clientes_busca", "nome"), ("clientes_busca_documento", "cpf_cnpj")):
+            connection.exec_driver_sql(f"INSERT INTO {tabela}({tabela}) VALUES ('delete-all')")
+            connection.exec_driver_sql(
+                f"INSERT INTO {tabela}(rowid, {coluna}) SELECT id, {coluna} FROM clientes WHERE deleted_at IS NULL"
+            )
+
+# Trava que serializa as migrações entre processos (workers subindo juntos)
+CHAVE_TRAVA_MIGRACAO = 7305002
+MIGRACAO_ESPERA_MS = 600_000
+
+def migrar_banco(engine_sincrono=None):
+    """Cria as tabelas que faltam e aplica as migrações (colunas novas, índice de busca)"""
+    engine_sincrono = engine_sincrono or engine
+    with engine_sincrono.connect() as conexao:
+        sqlite = conexao.dialect.name == "sqlite"
+        if sqlite:
+            # A migração de outro processo pode passar do busy_timeout normal
+            espera_anterior = conexao.exec_driver_sql("PRAGMA busy_timeout").scalar()
+            conexao.exec_driver_sql(f"PRAGMA busy_timeout = {MIGRACAO_ESPERA_MS}")
+            conexao.commit()
+            conexao.exec_driver_sql("BEGIN IMMEDIATE")
+        elif conexao.dialect.name == "postgresql":
+            conexao.exec_driver_sql(f"SELECT pg_advisory_xact_lock({CHAVE_TRAVA_MIGRACAO})")
+        try:
+            Base.metadata.create_all(bind=conexao)
+            conexao.commit()
+        finally:
+            if sqlite:
+                conexao.rollback()
+                conexao.exec_driver_sql(f"PRAGMA busy_timeout = {espera_anterior}")
+                conexao.commit()
+
+# Validação de CPF/CNPJ: pesos dos dígitos verificadores (módulo 11),
+# compartilhados pela validação individual e pela validação em lote (NumPy)
+PESOS_CPF = (tuple(range(10, 1, -1)), tuple(range(11, 1, -1)))
+PESOS_CNPJ = ((5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2), (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2))
+PESOS_DOCUMENTO = {11: PESOS_CPF, 14: PESOS_CNPJ}
+PESOS_DOCUMENTO_NP = {
+    tamanho: tuple(np.array(pesos, dtype=np.int32) for pesos in par)
+    for tamanho, par in PESOS_DOCUMENTO.items()
+}
+RE_NAO_DIGITO = re.compile(r'[^0-9]')
+VALIDACAO_BLOCO = 1 << 18
+
+# Motivos de rejeição de um documento
+MOTIVO_VALIDO = 0
+MOTIVO_TAMANHO = 1
+MOTIVO_DIGITOS_REPETIDOS = 2
+MOTIVO_DIGITO1 = 3
+MOTIVO_DIGITO2 = 4
+MOTIVOS_DOCUMENTO = {
+    MOTIVO_VALIDO: "válido",
+    MOTIVO_TAMANHO: "CPF deve ter 11 dígitos ou CNPJ deve ter 14 dígitos",
+    MOTIVO_DIGITOS_REPETIDOS: "todos os dígitos são iguais",
+    MOTIVO_DIGITO1: "primeiro dígito verificador inválido",
+    MOTIVO_DIGITO2: "segundo dígito verificador inválido",
+}
+
+def _digito_verificador(soma):
+    resto = soma % 11
+    return 0 if resto < 2 else 11 - resto
+
+def motivo_documento(digitos: str) -> int:
+    """Motivo de rejeição (MOTIVO_*) de um CPF/CNPJ que já contém só dígitos"""
+    pesos = PESOS_DOCUMENTO.get(len(digitos))
+    if pesos is None:
+        return MOTIVO_TAMANHO
+    if digitos == digitos[0] * len(digitos):
+        return MOTIVO_DIGITOS_REPETIDOS
+    
+    valores = [c - 48 for c in digitos.encode()]
+    pesos1, pesos2 = pesos
+    if valores[-2] != _digito_verificador(sum(map(operator.mul, valores, pesos1))):
+        return MOTIVO_DIGITO1
+    if valores[-1] != _digito_verificador(sum(map(operator.mul, valores, pesos2))):
+        return MOTIVO_DIGITO2
+    return MOTIVO_VALIDO
+
+def validar_documentos_lote(documentos) -> Tuple[np.ndarray, np.ndarray]:
+    """Valida muitos CPFs/CNPJs de uma vez com NumPy"""
+    documentos = list(documentos)
+    motivos = np.empty(len(documentos), dtype=np.uint8)
+    for inicio in range(0, len(documentos), VALIDACAO_BLOCO):
+        bloco = documentos[inicio:inicio + VALIDACAO_BLOCO]
+        motivos[inicio:inicio + len(bloco)] = _motivos_bloco(bloco)
+    return motivos == MOTIVO_VALIDO, motivos
+
+def _motivos_bloco(documentos: list) -> np.ndarray:
+    try:
+        brutos = np.array(documentos, dtype=np.bytes_)
+    except UnicodeEncodeError:
+        brutos = np.array([d.encode("ascii", "ignore") for d in documentos], dtype=np.bytes_)
+    total = len(brutos)
+    motivos = np.full(total, MOTIVO_TAMANHO, dtype=np.uint8)
+    largura = brutos.dtype.itemsize
+    if largura == 0:
+        return motivos
+    
+    caracteres = brutos.view(np.uint8).reshape(total, largura)
+    eh_digito = (caracteres >= 48) & (caracteres <= 57)
+    quantidade = eh_digito.sum(axis=1)
+    
+    # Compactar os dígitos de cada linha à esquerda (remove a pontuação)
+    if eh_digito.all():
+        digitos = caracteres[:, :14] - 48
+    else:
+        posicao = np.cumsum(eh_digito, axis=1, dtype=np.int32) - 1
+        selecao = eh_digito & (posicao < 14)
+        digitos = np.zeros((total, 14), dtype=np.uint8)
+        digitos[np.nonzero(selecao)[0], posicao[selecao]] = caracteres[selecao] - 48
+    
+    for tamanho, (pesos1, pesos2) in PESOS_DOCUMENTO_NP.items():
+        linhas = np.flatnonzero(quantidade == tamanho)
+        if not linhas.size:
+            continue
+        matriz = digitos[linhas, :tamanho].astype(np.int32)
+        resto1 = (matriz[:, :tamanho - 2] @ pesos1) % 11
+        resto2 = (matriz[:, :tamanho - 1] @ pesos2) % 11
+        digito1 = np.where(resto1 < 2, 0, 11 - resto1)
+        digito2 = np.where(resto2 < 2, 0, 11 - resto2)
+        
+        # Atribuídos do menos para o mais prioritário, como na validação individual
+        parcial = np.full(linhas.size, MOTIVO_VALIDO, dtype=np.uint8)
+        parcial[matriz[:, tamanho - 1] != digito2] = MOTIVO_DIGITO2
+        parcial[matriz[:, tamanho - 2] != digito1] = MOTIVO_DIGITO1
+        parcial[(matriz == matriz[:, :1]).all(axis=1)] = MOTIVO_DIGITOS_REPETIDOS
+        motivos[linhas] = parcial
+    return motivos
 
 # Pydantic Models
 class ClienteBase(BaseModel):
@@ -73,92 +1004,27 @@ class ClienteBase(BaseModel):
     @classmethod
     def validar_cpf_cnpj(cls, v):
         # Remove caracteres especiais
-        v = re.sub(r'[^\d]', '', v)
-        
-        if len(v) == 11:  # CPF
-            if not cls.validar_cpf(v):
-                raise ValueError('CPF inválido')
-        elif len(v) == 14:  # CNPJ
-            if not cls.validar_cnpj(v):
-                raise ValueError('CNPJ inválido')
-        else:
+        v = RE_NAO_DIGITO.sub('', v)
+        
+        motivo = motivo_documento(v)
+        if motivo == MOTIVO_TAMANHO:
             raise ValueError('CPF deve ter 11 dígitos ou CNPJ deve ter 14 dígitos')
+        if motivo != MOTIVO_VALIDO:
+            raise ValueError('CPF inválido' if len(v) == 11 else 'CNPJ inválido')
         
         return v
     
     @staticmethod
     def validar_cpf(cpf):
         # Remove caracteres não numéricos
-        cpf = re.sub(r'[^\d]', '', cpf)
-        
-        if len(cpf) != 11:
-            return False
-        
-        # Verifica se todos os dígitos são iguais
-        if cpf == cpf[0] * 11:
-            return False
-        
-        # Validação do primeiro dígito verificador
-        soma = sum(int(cpf[i]) * (10 - i) for i in range(9))
-        resto = soma % 11
-        if resto < 2:
-            digito1 = 0
-        else:
-            digito1 = 11 - resto
-        
-        if int(cpf[9]) != digito1:
-            return False
-        
-        # Validação do segundo dígito verificador
-        soma = sum(int(cpf[i]) * (11 - i) for i in range(10))
-        resto = soma % 11
-        if resto < 2:
-            digito2 = 0
-        else:
-            digito2 = 11 - resto
-        
-        if int(cpf[10]) != digito2:
-            return False
-        
-        return True
+        cpf = RE_NAO_DIGITO.sub('', cpf)
+        return len(cpf) == 11 and motivo_documento(cpf) == MOTIVO_VALIDO
     
     @staticmethod
     def validar_cnpj(cnpj):
         # Remove caracteres não numéricos
-        cnpj = re.sub(r'[^\d]', '', cnpj)
-        
-        if len(cnpj) != 14:
-            return False
-        
-        # Verifica se todos os dígitos são iguais
-        if cnpj == cnpj[0] * 14:
-            return False
-        
-        # Validação do primeiro dígito verificador
-        multiplicadores1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
-        soma = sum(int(cnpj[i]) * multiplicadores1[i] for i in range(12))
-        resto = soma % 11
-        if resto < 2:
-            digito1 = 0
-        else:
-            digito1 = 11 - resto
-        
-        if int(cnpj[12]) != digito1:
-            return False
-        
-        # Validação do segundo dígito verificador
-        multiplicadores2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
-        soma = sum(int(cnpj[i]) * multiplicadores2[i] for i in range(13))
-        resto = soma % 11
-        if resto < 2:
-            digito2 = 0
-        else:
-            digito2 = 11 - resto
-        
-        if int(cnpj[13]) != digito2:
-            return False
-        
-        return True
+        cnpj = RE_NAO_DIGITO.sub('', cnpj)
+        return len(cnpj) == 14 and motivo_documento(cnpj) == MOTIVO_VALIDO
 
 class ClienteCreate(ClienteBase):
     pass
@@ -173,6 +1039,58 @@ class ClienteUpdate(BaseModel):
         "validate_assignment": False
     }
 
+def valores_atualizacao(cliente: ClienteUpdate) -> dict:
+    """Colunas a gravar a partir dos campos enviados (o tipo do documento acompanha o CPF/CNPJ)"""
+    valores = {}
+    if cliente.nome is not None:
+        valores["nome"] = cliente.nome
+    
+    if cliente.email is not None:
+        valores["email"] = cliente.email
+    
+    if cliente.cpf_cnpj is not None:
+        # Validação simples: a unicidade do CPF/CNPJ é garantida pelo índice UNIQUE
+        valores["cpf_cnpj"] = re.sub(r'[^\d]', '', cliente.cpf_cnpj)
+        valores["tipo_documento"] = tipo_documento_de(valores["cpf_cnpj"])
+    return valores
+
+# Alteração e exclusão em massa (PATCH/DELETE /clientes/bulk)
+class FiltroClientes(BaseModel):
+    created_since: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    tipo_documento: Optional[str] = None
+
+class AlvoClientesLote(BaseModel):
+    """Clientes de uma operação em massa: lista de ids ou filtro, um dos dois"""
+    ids: Optional[List[int]] = None
+    filtro: Optional[FiltroClientes] = None
+    
+    @model_validator(mode="after")
+    def validar_alvo(self):
+        if (self.ids is None) == (self.filtro is None):
+            raise ValueError('Informe ids ou filtro (um dos dois)')
+        if self.ids is not None and not self.ids:
+            raise ValueError('Envie pelo menos um id')
+        if self.ids is not None and len(self.ids) > BULK_MAX_IDS:
+            raise ValueError(f'Envie no máximo {BULK_MAX_IDS} ids por requisição')
+        # Um filtro vazio alcançaria a base inteira
+        if self.filtro is not None and not self.filtro.model_dump(exclude_none=True):
+            raise ValueError('O filtro precisa de pelo menos uma condição')
+        return self
+
+class ClientesLoteUpdate(AlvoClientesLote):
+    valores: ClienteUpdate
+    
+    @model_validator(mode="after")
+    def validar_valores(self):
+        campos = self.valores.model_dump(exclude_none=True)
+        if not campos:
+            raise ValueError('Informe pelo menos um campo em valores')
+        # O mesmo email ou CPF/CNPJ em dois clientes violaria a unicidade
+        if {"email", "cpf_cnpj"} & campos.keys() and (self.filtro is not None or len(set(self.ids)) > 1):
+            raise ValueError('Email e CPF/CNPJ são únicos: só podem ser alterados em um cliente por vez')
+        return self
+
 class ClienteResponse(BaseModel):
     id: int
     nome: str
@@ -184,6 +1102,25 @@ class ClienteResponse(BaseModel):
         "from_attributes": True
     }
 
+# Respostas de leitura serializadas direto das tuplas do banco, sem objetos ORM
+class ClienteJSON(TypedDict):
+    id: int
+    nome: str
+    email: str
+    cpf_cnpj: str
+    created_at: datetime
+
+COLUNAS_CLIENTE = (ClienteDB.id, ClienteDB.nome, ClienteDB.email, ClienteDB.cpf_cnpj, ClienteDB.created_at)
+CAMPOS_CLIENTE = tuple(ClienteJSON.__annotations__)
+cliente_json_adapter = TypeAdapter(ClienteJSON)
+lista_clientes_json_adapter = TypeAdapter(List[ClienteJSON])
+
+def cliente_json(linha) -> bytes:
+    return cliente_json_adapter.dump_json(dict(zip(CAMPOS_CLIENTE, linha)))
+
+def lista_clientes_json(linhas) -> bytes:
+    return lista_clientes_json_adapter.dump_json([dict(zip(CAMPOS_CLIENTE, linha)) for linha in linhas])
+
 # Modelos para análise de notas fiscais
 class NotaFiscalRequest(BaseModel):
     texto: str
@@ -202,85 +1139,1523 @@ class NotaFiscalResponse(BaseModel):
     data_emissao: Optional[str] = None
     cnpj_emissor: Optional[str] = None
 
+class NotasFiscaisLoteRequest(BaseModel):
+    notas: List[NotaFiscalRequest]
+    
+    @field_validator('notas')
+    @classmethod
+    def validar_tamanho_lote(cls, v: List[NotaFiscalRequest]) -> List[NotaFiscalRequest]:
+        if not v:
+            raise ValueError('Envie pelo menos uma nota fiscal')
+        if len(v) > LOTE_MAX_NOTAS:
+            raise ValueError(f'Envie no máximo {LOTE_MAX_NOTAS} notas fiscais por lote')
+        return v
+
 # Dependency para obter a sessão do banco
-def get_db():
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Outbox do webhook N8N
+class OutboxDispatcher:
+    """Drena o outbox em background e entrega os eventos ao N8N"""
+    
+    def __init__(self):
+        self._acordar = asyncio.Event()
+        self._parando = False
+        self._tarefa: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    async def iniciar(self):
+        self._client = httpx.AsyncClient(
+            timeout=OUTBOX_TIMEOUT,
+            limits=httpx.Limits(max_connections=10, max_keepalive_connections=10)
+        )
+        self._tarefa = asyncio.create_task(self._executar())
+    
+    async def parar(self, timeout: float = SERVIDOR_DRENAGEM_TIMEOUT):
+        """Termina o lote em andamento (até `timeout`) e encerra o dispatcher"""
+        if self._tarefa:
+            self._parando = True
+            self._acordar.set()
+            try:
+                await asyncio.wait_for(self._tarefa, timeout)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                # Eventos reservados e não confirmados voltam à fila quando o lease vence
+                pass
+        if self._client:
+            await self._client.aclose()
+    
+    def notificar(self):
+        """Acorda o dispatcher para drenar eventos recém-gravados"""
+        self._acordar.set()
+    
+    async def _executar(self):
+        while not self._parando:
+            try:
+                enviados = await self.drenar()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Erro no dispatcher do outbox: {str(e)}")
+                enviados = 0
+            # Lote cheio: provavelmente há mais eventos, drena sem esperar
+            if enviados >= OUTBOX_LOTE or self._parando:
+                continue
+            try:
+                await asyncio.wait_for(self._acordar.wait(), timeout=OUTBOX_INTERVALO)
+            except asyncio.TimeoutError:
+                pass
+            self._acordar.clear()
+    
+    async def drenar(self) -> int:
+        """Entrega um lote de eventos pendentes e retorna quantos foram processados"""
+        eventos = await asyncio.to_thread(reservar_eventos_outbox, OUTBOX_LOTE)
+        if not eventos:
+            return 0
+        resultados = await asyncio.gather(*(self._entregar(evento) for evento in eventos))
+        await asyncio.to_thread(registrar_entregas_outbox, resultados)
+        return len(eventos)
+    
+    async def _entregar(self, evento: dict):
+        inicio = time.perf_counter()
+        try:
+            response = await self._client.post(
+                N8N_WEBHOOK_URL,
+                content=evento["payload"],
+                headers={
+                    "Content-Type": "application/json",
+                    "X-Evento-Id": str(evento["id"]),
+                    "X-Evento-Tipo": evento["tipo"]
+                }
+            )
+            response.raise_for_status()
+            logger.info(f"✅ N8N Webhook entregue: evento {evento['id']} (status {response.status_code})")
+            METRICA_WEBHOOK_ENTREGAS.inc(resultado="ok")
+            return evento, None
+        except Exception as e:
+            erro = str(e) or repr(e)
+            logger.warning(f"⚠️ Erro ao chamar N8N webhook (evento {evento['id']}): {erro}")
+            METRICA_WEBHOOK_ENTREGAS.inc(resultado="erro")
+            return evento, erro
+        finally:
+            METRICA_WEBHOOK_DURACAO.observar(time.perf_counter() - inicio)
+
+def reservar_eventos_outbox(limite: int) -> List[dict]:
+    """Empurra a próxima tentativa dos eventos vencidos para o fim do lease e os retorna"""
     db = SessionLocal()
     try:
-        yield db
+        agora = datetime.utcnow()
+        vencidos = select(OutboxEventoDB.id).where(
+            OutboxEventoDB.enviado_em.is_(None),
+            OutboxEventoDB.proxima_tentativa_em <= agora
+        ).order_by(OutboxEventoDB.id).limit(limite).with_for_update(skip_locked=True)
+        eventos = db.execute(
+            update(OutboxEventoDB)
+            .where(
+                OutboxEventoDB.id.in_(vencidos.scalar_subquery()),
+                OutboxEventoDB.enviado_em.is_(None),
+                OutboxEventoDB.proxima_tentativa_em <= agora
+            )
+            .values(proxima_tentativa_em=agora + timedelta(seconds=OUTBOX_LEASE))
+            .returning(OutboxEventoDB.id, OutboxEventoDB.tipo, OutboxEventoDB.payload, OutboxEventoDB.tentativas)
+        ).all()
+        db.commit()
+        return sorted(
+            ({"id": e.id, "tipo": e.tipo, "payload": e.payload, "tentativas": e.tentativas} for e in eventos),
+            key=operator.itemgetter("id")
+        )
+    finally:
+        db.close()
+
+def registrar_entregas_outbox(resultados):
+    """Marca eventos entregues e reagenda os que falharam com backoff exponencial"""
+    db = SessionLocal()
+    try:
+        agora = datetime.utcnow()
+        entregues = [evento["id"] for evento, erro in resultados if erro is None]
+        if entregues:
+            db.execute(
+                update(OutboxEventoDB)
+                .where(OutboxEventoDB.id.in_(entregues))
+                .values(enviado_em=agora, ultimo_erro=None)
+            )
+        for evento, erro in resultados:
+            if erro is None:
+                continue
+            tentativas = evento["tentativas"] + 1
+            espera = min(OUTBOX_BACKOFF_MAX, OUTBOX_BACKOFF_BASE * 2 ** (tentativas - 1))
+            espera = espera * random.uniform(0.5, 1.0)
+            db.execute(
+                update(OutboxEventoDB)
+                .where(OutboxEventoDB.id == evento["id"])
+                .values(
+                    tentativas=tentativas,
+                    ultimo_erro=erro[:1000],
+                    proxima_tentativa_em=agora + timedelta(seconds=espera)
+                )
+            )
+        db.commit()
     finally:
         db.close()
 
+def evento_cliente_criado(dados: dict) -> OutboxEventoDB:
+    """Monta o evento do outbox enviado ao N8N quando um cliente é criado"""
+    return OutboxEventoDB(
+        tipo="cliente.criado",
+        payload=json.dumps({
+            "id": dados["id"],
+            "nome": dados["nome"],
+            "email": dados["email"],
+            "cpf_cnpj": dados["cpf_cnpj"],
+            "created_at": str(dados["created_at"])
+        })
+    )
+
+def _data_iso(valor: Optional[datetime]) -> Optional[str]:
+    return valor.isoformat() if valor is not None else None
+
+# Encoder criado uma vez: json.dumps com argumentos cria um encoder novo a cada chamada
+_codificar_json = json.JSONEncoder(ensure_ascii=False).encode
+
+# Registro de alterações de clientes (feed GET /clientes/changes)
+COLUNAS_ALTERACAO = COLUNAS_CLIENTE + (ClienteDB.updated_at, ClienteDB.deleted_at)
+
+def dados_alteracao(cliente) -> dict:
+    """Linha de clientes_alteracoes com o estado do cliente (objeto ORM, linha ou dict)"""
+    valor = cliente.get if isinstance(cliente, dict) else lambda campo: getattr(cliente, campo)
+    return {
+        "cliente_id": valor("id"),
+        "dados": _codificar_json({
+            "id": valor("id"),
+            "nome": valor("nome"),
+            "email": valor("email"),
+            "cpf_cnpj": valor("cpf_cnpj"),
+            "created_at": _data_iso(valor("created_at")),
+            "updated_at": _data_iso(valor("updated_at")),
+            "deleted_at": _data_iso(valor("deleted_at")),
+        })
+    }
+
+def alteracao_cliente(operacao: str, cliente) -> ClienteAlteracaoDB:
+    """Monta o registro de alteração ("criado", "atualizado" ou "apagado") de um cliente"""
+    return ClienteAlteracaoDB(operacao=operacao, **dados_alteracao(cliente))
+
+class AvisoAlteracoes:
+    """Acorda os consumidores do feed em espera quando uma alteração é confirmada"""
+    
+    def __init__(self):
+        self.evento = asyncio.Event()
+    
+    def notificar(self):
+        self.evento.set()
+        self.evento = asyncio.Event()
+
+aviso_alteracoes = AvisoAlteracoes()
+
+# Cache de respostas
+class BackendCacheMemoria:
+    """Backend LRU em memória do processo, com expiração por TTL"""
+    
+    def __init__(self, max_entradas: int):
+        self._entradas = OrderedDict()
+        self._max_entradas = max_entradas
+        self._versoes = {}
+    
+    async def obter(self, chave: str) -> Optional[dict]:
+        item = self._entradas.get(chave)
+        if item is None:
+            return None
+        expira_em, entrada = item
+        if expira_em < time.monotonic():
+            del self._entradas[chave]
+            return None
+        self._entradas.move_to_end(chave)
+        return entrada
+    
+    async def guardar(self, chave: str, entrada: dict, ttl: float):
+        self._entradas[chave] = (time.monotonic() + ttl, entrada)
+        self._entradas.move_to_end(chave)
+        while len(self._entradas) > self._max_entradas:
+            self._entradas.popitem(last=False)
+    
+    async def remover(self, *chaves: str):
+        for chave in chaves:
+            self._entradas.pop(chave, None)
+    
+    async def versao(self, nome: str) -> int:
+        return self._versoes.get(nome, 0)
+    
+    async def incrementar_versao(self, nome: str):
+        self._versoes[nome] = self._versoes.get(nome, 0) + 1
+    
+    def __len__(self):
+        return len(self._entradas)
+
+class BackendCacheRedis:
+    """Backend compartilhado entre processos/hosts (requer `pip install redis`)"""
+    
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+    
+    async def obter(self, chave: str) -> Optional[dict]:
+        valor = await self._redis.get(f"cache:{chave}")
+        return json.loads(valor) if valor is not None else None
+    
+    async def guardar(self, chave: str, entrada: dict, ttl: float):
+        await self._redis.set(f"cache:{chave}", json.dumps(entrada), px=int(ttl * 1000))
+    
+    async def remover(self, *chaves: str):
+        await self._redis.delete(*(f"cache:{chave}" for chave in chaves))
+    
+    async def versao(self, nome: str) -> int:
+        return int(await self._redis.get(f"cache:versao:{nome}") or 0)
+    
+    async def incrementar_versao(self, nome: str):
+        await self._redis.incr(f"cache:versao:{nome}")
+    
+    def __len__(self):
+        return 0
+
+class CacheRespostas:
+    """Cache de respostas JSON já serializadas, com ETag e contadores de acerto"""
+    
+    def __init__(self, backend, ttl: float):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+    
+    async def obter(self, chave: str) -> Optional[dict]:
+        entrada = await self.backend.obter(chave)
+        if entrada is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entrada
+    
+    async def guardar(self, chave: str, corpo: bytes, headers: Optional[dict] = None) -> dict:
+        entrada = {
+            "corpo": corpo.decode(),
+            "etag": f'"{hashlib.blake2b(corpo, digest_size=16).hexdigest()}"',
+            "headers": headers or {}
+        }
+        await self.backend.guardar(chave, entrada, self.ttl)
+        return entrada
+    
+    async def guardar_se_atual(self, chave: str, corpo: bytes, versao: int) -> dict:
+        """Guarda um corpo lido do banco sob `versao`, desfazendo se uma escrita invalidou os clientes no meio"""
+        entrada = await self.guardar(chave, corpo)
+        if await self.backend.versao("clientes") != versao:
+            await self.backend.remover(chave)
+        return entrada
+    
+    async def versao_clientes(self) -> int:
+        return await self.backend.versao("clientes")
+    
+    async def chave_lista(self, *parametros) -> str:
+        versao = await self.backend.versao("clientes")
+        return f"clientes:v{versao}:" + ":".join(str(p) for p in parametros)
+    
+    async def invalidar_cliente(self, cliente_id: int):
+        # Versão antes da remoção (ver `guardar_se_atual`)
+        await self.invalidar_listas()
+        await self.backend.remover(f"cliente:{cliente_id}")
+    
+    async def invalidar_clientes(self, ids: List[int], lote: int = 1000):
+        await self.invalidar_listas()
+        for inicio in range(0, len(ids), lote):
+            await self.backend.remover(*(f"cliente:{cliente_id}" for cliente_id in ids[inicio:inicio + lote]))
+    
+    async def invalidar_listas(self):
+        await self.backend.incrementar_versao("clientes")
+    
+    def estatisticas(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "taxa_acerto": round(self.hits / total, 4) if total else 0.0,
+            "entradas": len(self.backend),
+            "backend": "redis" if isinstance(self.backend, BackendCacheRedis) else "memoria"
+        }
+
+def criar_cache_respostas() -> Optional[CacheRespostas]:
+    if not CACHE_HABILITADO:
+        return None
+    if not CACHE_REDIS_URL and WEB_CONCURRENCY > 1:
+        # Um cache em memória por worker: a escrita em um deixaria os outros servindo a versão antiga
+        logger.warning(
+            f"Cache de respostas desligado: {WEB_CONCURRENCY} workers sem CACHE_REDIS_URL "
+            "(o cache em memória é por processo)"
+        )
+        return None
+    backend = BackendCacheRedis(CACHE_REDIS_URL) if CACHE_REDIS_URL else BackendCacheMemoria(CACHE_MAX_ENTRADAS)
+    return CacheRespostas(backend, CACHE_TTL)
+
+cache_respostas = criar_cache_respostas()
+
+def resposta_cacheada(request: Request, entrada: dict, origem: str) -> Response:
+    """Monta a resposta a partir da entrada do cache, com 304 se o ETag conferir"""
+    headers = {"ETag": entrada["etag"], "X-Cache": origem, **entrada["headers"]}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or entrada["etag"] in [
+        etag.strip().removeprefix("W/") for etag in if_none_match.split(",")
+    ]):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=entrada["corpo"], media_type="application/json", headers=headers)
+
+async def invalidar_cache_clientes(ids: List[int]):
+    """Invalida o cache após uma escrita em massa (cada cliente e as listagens)"""
+    if cache_respostas is None:
+        return
+    try:
+        await cache_respostas.invalidar_clientes(ids)
+    except Exception as e:
+        logger.error(f"Erro ao invalidar cache: {str(e)}")
+
+async def invalidar_cache_cliente(cliente_id: Optional[int] = None):
+    """Invalida o cache após uma escrita (sem cliente_id, só as listagens)"""
+    if cache_respostas is None:
+        return
+    try:
+        if cliente_id is None:
+            await cache_respostas.invalidar_listas()
+        else:
+            await cache_respostas.invalidar_cliente(cliente_id)
+    except Exception as e:
+        logger.error(f"Erro ao invalidar cache: {str(e)}")
+
+# Idempotency-Key: respostas guardadas no banco (compartilhado entre os
+# workers), com as mais recentes também na memória do processo
+class ArmazemIdempotencia:
+    """Reserva de chaves e respostas guardadas do IdempotenciaMiddleware"""
+    
+    def __init__(self, ttl: float, max_entradas: int):
+        self.ttl = ttl
+        self.memoria = BackendCacheMemoria(max_entradas)
+        self.em_andamento = {}
+        self.limpeza_em = 0.0
+    
+    async def iniciar(self, chave: str, hash_corpo: str) -> Optional[dict]:
+        """Resposta guardada da chave, ou None se esta requisição ficou com a reserva"""
+        inicio = time.monotonic()
+        contexto = contexto_requisicao.get()
+        try:
+            while True:
+                entrada = await self.memoria.obter(chave)
+                if entrada is not None:
+                    return entrada
+                futuro = self.em_andamento.get(chave)
+                if futuro is not None:
+                    restante = inicio + IDEMPOTENCIA_ESPERA_MAX - time.monotonic()
+                    try:
+                        await asyncio.wait_for(asyncio.shield(futuro), max(0.0, restante))
+                    except asyncio.TimeoutError:
+                        raise self._em_andamento()
+                    continue
+                
+                self.em_andamento[chave] = asyncio.get_running_loop().create_future()
+                try:
+                    entrada = await self._reservar(chave, hash_corpo)
+                except BaseException:
+                    self._encerrar(chave)
+                    raise
+                if entrada is None:
+                    return None
+                self._encerrar(chave)
+                if entrada["status"] is not None:
+                    await self._guardar_na_memoria(chave, entrada)
+                    return entrada
+                # Primeira requisição rodando em outro processo
+                if time.monotonic() - inicio >= IDEMPOTENCIA_ESPERA_MAX:
+                    raise self._em_andamento()
+                await asyncio.sleep(IDEMPOTENCIA_INTERVALO)
+        finally:
+            if contexto is not None:
+                contexto.espera += time.monotonic() - inicio
+    
+    async def concluir(self, chave: str, hash_corpo: str, status_code: int, tipo: str, corpo: bytes, headers: dict):
+        """Grava a resposta da requisição que tinha a reserva e acorda quem espera por ela"""
+        entrada = {
+            "hash": hash_corpo, "status": status_code, "tipo": tipo, "corpo": corpo.decode(), "headers": headers,
+            "expira_em": datetime.utcnow() + timedelta(seconds=self.ttl)
+        }
+        try:
+            async with async_engine.begin() as conexao:
+                await conexao.execute(
+                    update(IdempotenciaDB)
+                    .where(IdempotenciaDB.chave == chave)
+                    .values(
+                        status=status_code, tipo_conteudo=tipo, corpo=entrada["corpo"],
+                        headers=json.dumps(headers), expira_em=entrada["expira_em"]
+                    )
+                )
+            await self._guardar_na_memoria(chave, entrada)
+        except Exception as e:
+            logger.error(f"Erro ao gravar a resposta da Idempotency-Key: {str(e)}")
+        finally:
+            self._encerrar(chave)
+    
+    async def manter_reserva(self, chave: str):
+        """Renova a reserva enquanto a requisição roda (a tarefa é cancelada ao terminar)"""
+        while True:
+            await asyncio.sleep(IDEMPOTENCIA_ESPERA_MAX / 3)
+            try:
+                async with async_engine.begin() as conexao:
+                    await conexao.execute(
+                        update(IdempotenciaDB)
+                        .where(IdempotenciaDB.chave == chave, IdempotenciaDB.status.is_(None))
+                        .values(expira_em=datetime.utcnow() + timedelta(seconds=IDEMPOTENCIA_ESPERA_MAX))
+                    )
+            except Exception as e:
+                logger.error(f"Erro ao renovar a reserva da Idempotency-Key: {str(e)}")
+    
+    async def liberar(self, chave: str):
+        """Desfaz a reserva (a requisição falhou): a próxima com a chave executa de novo"""
+        try:
+            async with async_engine.begin() as conexao:
+                await conexao.execute(
+                    IdempotenciaDB.__table__.delete()
+                    .where(IdempotenciaDB.chave == chave, IdempotenciaDB.status.is_(None))
+                )
+        except Exception as e:
+            logger.error(f"Erro ao liberar a Idempotency-Key: {str(e)}")
+        finally:
+            self._encerrar(chave)
+    
+    async def _reservar(self, chave: str, hash_corpo: str) -> Optional[dict]:
+        """Insere a reserva; se a chave já existe, retorna a linha (status None = em andamento)"""
+        agora = datetime.utcnow()
+        async with async_engine.begin() as conexao:
+            if time.monotonic() >= self.limpeza_em:
+                self.limpeza_em = time.monotonic() + 60
+                await conexao.execute(IdempotenciaDB.__table__.delete().where(IdempotenciaDB.expira_em < agora))
+            else:
+                await conexao.execute(
+                    IdempotenciaDB.__table__.delete()
+                    .where(IdempotenciaDB.chave == chave, IdempotenciaDB.expira_em < agora)
+                )
+        try:
+            async with async_engine.begin() as conexao:
+                await conexao.execute(insert(IdempotenciaDB).values(
+                    chave=chave, hash_corpo=hash_corpo, expira_em=agora + timedelta(seconds=IDEMPOTENCIA_ESPERA_MAX)
+                ))
+            return None
+        except IntegrityError:
+            pass
+        async with async_engine.connect() as conexao:
+            linha = (await conexao.execute(
+                select(
+                    IdempotenciaDB.hash_corpo, IdempotenciaDB.status, IdempotenciaDB.tipo_conteudo,
+                    IdempotenciaDB.corpo, IdempotenciaDB.headers, IdempotenciaDB.expira_em
+                ).where(IdempotenciaDB.chave == chave)
+            )).first()
+        if linha is None:
+            # Liberada entre o INSERT e o SELECT: status None faz tentar de novo
+            return {"status": None}
+        return {
+            "hash": linha.hash_corpo, "status": linha.status, "tipo": linha.tipo_conteudo,
+            "corpo": linha.corpo, "headers": json.loads(linha.headers or "{}"), "expira_em": linha.expira_em
+        }
+    
+    async def _guardar_na_memoria(self, chave: str, entrada: dict):
+        ttl = (entrada["expira_em"] - datetime.utcnow()).total_seconds()
+        if ttl > 0:
+            await self.memoria.guardar(chave, entrada, ttl)
+    
+    def _encerrar(self, chave: str):
+        futuro = self.em_andamento.pop(chave, None)
+        if futuro is not None and not futuro.done():
+            futuro.set_result(None)
+    
+    def _em_andamento(self) -> HTTPException:
+        return HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Requisição com a mesma Idempotency-Key ainda em andamento, tente novamente em instantes"
+        )
+
+idempotencia = ArmazemIdempotencia(IDEMPOTENCIA_TTL, IDEMPOTENCIA_CACHE_MAX)
+
+# Paginação por cursor (keyset)
+ORDENACOES_CLIENTES = ("id", "-id", "created_at", "-created_at")
+
+def codificar_cursor(ultimo_id: int, sort: str = "id", created_at: Optional[datetime] = None) -> str:
+    """Gera o token opaco que aponta para a página seguinte ao último cliente visto"""
+    dados = {"id": ultimo_id}
+    if sort != "id":
+        dados["sort"] = sort
+    if sort.endswith("created_at"):
+        dados["created_at"] = _data_iso(created_at)
+    payload = json.dumps(dados, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(payload).decode().rstrip("=")
+
+def decodificar_cursor(cursor: str, sort: str = "id") -> Tuple[int, Optional[datetime]]:
+    """Extrai (último id, último created_at) de um cursor; levanta ValueError se for inválido"""
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        dados = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        ultimo_id = dados["id"]
+        ordem = dados.get("sort", "id")
+        ultimo_created_at = (
+            datetime.fromisoformat(dados["created_at"]) if sort.endswith("created_at") else None
+        )
+    except (binascii.Error, ValueError, TypeError, KeyError, AttributeError) as e:
+        raise ValueError("Cursor inválido") from e
+    if not isinstance(ultimo_id, int) or isinstance(ultimo_id, bool):
+        raise ValueError("Cursor inválido")
+    if ordem != sort:
+        raise ValueError("Cursor gerado para outra ordenação: use o mesmo sort da primeira página")
+    return ultimo_id, ultimo_created_at
+
+# Filtros da listagem e das estatísticas de clientes
+TIPOS_DOCUMENTO = ("cpf", "cnpj")
+
+def utc_sem_fuso(valor: datetime) -> datetime:
+    """Converte um instante com fuso para UTC sem fuso, como as datas gravadas no banco"""
+    if valor.tzinfo is not None:
+        return valor.astimezone(timezone.utc).replace(tzinfo=None)
+    return valor
+
+def filtros_clientes(
+    created_since: Optional[datetime],
+    created_before: Optional[datetime],
+    tipo_documento: Optional[str]
+) -> list:
+    """Condições WHERE dos filtros (sempre só clientes ativos); 400 se algum for inválido"""
+    condicoes = [ClienteDB.deleted_at.is_(None)]
+    if tipo_documento is not None:
+        tipo_documento = tipo_documento.lower()
+        if tipo_documento not in TIPOS_DOCUMENTO:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="tipo_documento inválido: use cpf ou cnpj"
+            )
+        condicoes.append(ClienteDB.tipo_documento == tipo_documento)
+    if created_since is not None:
+        condicoes.append(ClienteDB.created_at >= utc_sem_fuso(created_since))
+    if created_before is not None:
+        condicoes.append(ClienteDB.created_at < utc_sem_fuso(created_before))
+    return condicoes
+
+# Unicidade de email e CPF/CNPJ
+def campo_duplicado(erro: IntegrityError) -> Optional[str]:
+    """Identifica qual índice UNIQUE de clientes foi violado ("email" ou "cpf_cnpj")"""
+    mensagem = str(erro.orig).lower()
+    for campo in ("cpf_cnpj", "email"):
+        if campo in mensagem:
+            return campo
+    return None
+
+def mensagem_duplicado(erro: IntegrityError, sufixo: str = "") -> str:
+    """Mensagem de erro 400 correspondente à violação de unicidade"""
+    campo = campo_duplicado(erro)
+    if campo == "email":
+        return f"Email já cadastrado{sufixo}"
+    if campo == "cpf_cnpj":
+        return f"CPF/CNPJ já cadastrado{sufixo}"
+    return f"Email ou CPF/CNPJ já cadastrado{sufixo}"
+
 # Endpoints CRUD
 
 @app.post("/clientes", response_model=ClienteResponse, status_code=status.HTTP_201_CREATED)
-async def criar_cliente(cliente: ClienteCreate, db: Session = Depends(get_db)):
+async def criar_cliente(cliente: ClienteCreate, db: AsyncSession = Depends(get_db)):
     """Criar um novo cliente"""
     try:
-        # Verificar se email já existe
-        db_cliente_email = db.query(ClienteDB).filter(ClienteDB.email == cliente.email).first()
-        if db_cliente_email:
+        # Criar novo cliente: a unicidade de email e CPF/CNPJ é garantida pelos
+        # índices UNIQUE, então o INSERT é a própria verificação
+        cpf_cnpj_limpo = re.sub(r'[^\d]', '', cliente.cpf_cnpj)
+        db_cliente = ClienteDB(
+            nome=cliente.nome,
+            email=cliente.email,
+            cpf_cnpj=cpf_cnpj_limpo
+        )
+        db.add(db_cliente)
+        try:
+            with etapa("criar_cliente.insert"):
+                await db.flush()
+        except IntegrityError as e:
+            await db.rollback()
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Email já cadastrado"
+                detail=mensagem_duplicado(e)
             )
         
-        # Verificar se CPF/CNPJ já existe
-        cpf_cnpj_limpo = re.sub(r'[^\d]', '', cliente.cpf_cnpj)
-        db_cliente_cpf_cnpj = db.query(ClienteDB).filter(
-            ClienteDB.cpf_cnpj == cpf_cnpj_limpo
-        ).first()
-        if db_cliente_cpf_cnpj:
+        # Evento para o N8N gravado na mesma transação (entregue pelo dispatcher do outbox)
+        db.add(evento_cliente_criado({
+            "id": db_cliente.id,
+            "nome": db_cliente.nome,
+            "email": db_cliente.email,
+            "cpf_cnpj": db_cliente.cpf_cnpj,
+            "created_at": db_cliente.created_at
+        }))
+        db.add(alteracao_cliente("criado", db_cliente))
+        with etapa("criar_cliente.commit"):
+            await db.commit()
+        aviso_alteracoes.notificar()
+        with etapa("criar_cliente.cache"):
+            await invalidar_cache_cliente()
+        
+        dispatcher = getattr(app.state, "outbox", None)
+        if dispatcher:
+            dispatcher.notificar()
+        
+        return db_cliente
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro interno do servidor: {str(e)}"
+        )
+
+# Importação em massa
+def mensagem_validacao(erro: ValidationError) -> str:
+    """Resume o primeiro erro de validação do Pydantic em uma mensagem curta"""
+    detalhe = erro.errors()[0]
+    campo = ".".join(str(parte) for parte in detalhe["loc"])
+    mensagem = detalhe["msg"].removeprefix("Value error, ")
+    return f"{campo}: {mensagem}" if campo else mensagem
+
+async def ler_linhas(pedacos, juntar_aspas: bool = False):
+    """Lê o corpo em streaming, linha a linha (bytes fora do UTF-8 viram U+FFFD)"""
+    decodificador = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    pendente = ""
+    registro = []
+    aspas = 0
+    final = False
+    while not final:
+        pedaco = await anext(pedacos, None)
+        final = pedaco is None
+        pendente += decodificador.decode(pedaco or b"", final=final)
+        *linhas, pendente = pendente.split("\n")
+        if final:
+            linhas.append(pendente)
+        for linha in linhas:
+            if juntar_aspas:
+                registro.append(linha)
+                aspas += linha.count('"')
+                if aspas % 2:
+                    continue
+                linha = "\n".join(registro)
+                registro = []
+                aspas = 0
+            linha = linha.rstrip("\r")
+            if linha.strip():
+                yield linha
+    if registro:
+        # Aspas abertas até o fim do corpo: o registro vai assim mesmo
+        yield "\n".join(registro)
+
+def importar_lote(registros: List[tuple], notificar: bool) -> List[dict]:
+    """Valida e grava um lote de registros (número, dados ou erro de parse)"""
+    resultados = {}
+    validos = []
+    for numero, dados, erro in registros:
+        if erro:
+            resultados[numero] = {"linha": numero, "status": "erro", "erro": erro}
+            continue
+        try:
+            cliente = ClienteCreate(**dados)
+        except ValidationError as e:
+            resultados[numero] = {"linha": numero, "status": "erro", "erro": mensagem_validacao(e)}
+            continue
+        except TypeError:
+            resultados[numero] = {"linha": numero, "status": "erro", "erro": "Registro deve ser um objeto"}
+            continue
+        validos.append((numero, cliente))
+    
+    if validos:
+        db = SessionLocal()
+        try:
+            emails = {cliente.email for _, cliente in validos}
+            documentos = {cliente.cpf_cnpj for _, cliente in validos}
+            existentes = db.execute(
+                select(ClienteDB.email, ClienteDB.cpf_cnpj).where(
+                    or_(ClienteDB.email.in_(emails), ClienteDB.cpf_cnpj.in_(documentos)),
+                    ClienteDB.deleted_at.is_(None)
+                )
+            ).all()
+            emails_usados = {email for email, _ in existentes}
+            documentos_usados = {documento for _, documento in existentes}
+            
+            linhas = []
+            for numero, cliente in validos:
+                if cliente.email in emails_usados:
+                    resultados[numero] = {"linha": numero, "status": "erro", "erro": "Email já cadastrado"}
+                elif cliente.cpf_cnpj in documentos_usados:
+                    resultados[numero] = {"linha": numero, "status": "erro", "erro": "CPF/CNPJ já cadastrado"}
+                else:
+                    emails_usados.add(cliente.email)
+                    documentos_usados.add(cliente.cpf_cnpj)
+                    linhas.append((numero, {
+                        "nome": cliente.nome,
+                        "email": cliente.email,
+                        "cpf_cnpj": cliente.cpf_cnpj,
+                        "created_at": datetime.utcnow()
+                    }))
+            
+            if linhas:
+                try:
+                    criados = gravar_clientes(db, [dados for _, dados in linhas], notificar)
+                except IntegrityError:
+                    # Outra requisição gravou um dos registros entre o SELECT e o INSERT:
+                    # refaz o lote registro a registro para isolar os conflitos
+                    db.rollback()
+                    criados = []
+                    for numero, dados in linhas:
+                        try:
+                            with db.begin_nested():
+                                criados.extend(gravar_clientes(db, [dados], notificar))
+                        except IntegrityError as e:
+                            criados.append(None)
+                            resultados[numero] = {
+                                "linha": numero, "status": "erro",
+                                "erro": mensagem_duplicado(e)
+                            }
+                db.commit()
+                for (numero, _), cliente_id in zip(linhas, criados):
+                    if cliente_id is not None:
+                        resultados[numero] = {"linha": numero, "status": "criado", "id": cliente_id}
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+    
+    return [resultados[numero] for numero, _, _ in registros]
+
+def gravar_clientes(db: Session, linhas: List[dict], notificar: bool) -> List[int]:
+    """INSERT executemany dos clientes (com o registro de alterações e os eventos do outbox), retornando os ids"""
+    ids = list(db.scalars(
+        insert(ClienteDB).returning(ClienteDB.id, sort_by_parameter_order=True),
+        linhas
+    ))
+    db.execute(insert(ClienteAlteracaoDB), [
+        {"operacao": "criado", **dados_alteracao({**dados, "id": cliente_id, "updated_at": dados["created_at"]})}
+        for dados, cliente_id in zip(linhas, ids)
+    ])
+    if notificar:
+        db.add_all(evento_cliente_criado({**dados, "id": cliente_id}) for dados, cliente_id in zip(linhas, ids))
+        db.flush()
+    return ids
+
+class StreamingResponseComCorpo(StreamingResponse):
+    """StreamingResponse que pode continuar lendo o corpo da requisição"""
+    
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+@app.post("/clientes/bulk")
+async def importar_clientes(request: Request, notificar: bool = True):
+    """Importar clientes em massa a partir de NDJSON ou CSV"""
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in ("text/csv", "application/csv"):
+        formato = "csv"
+    elif content_type in ("application/x-ndjson", "application/ndjson", "application/jsonl", ""):
+        formato = "ndjson"
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Use Content-Type application/x-ndjson ou text/csv"
+        )
+    
+    # O primeiro pedaço é conferido antes da resposta: um arquivo em outra
+    # codificação (Latin-1, Windows-1252) é recusado com 400
+    pedacos = request.stream()
+    primeiro = await anext(pedacos, b"")
+    try:
+        codecs.getincrementaldecoder("utf-8")().decode(primeiro)
+    except UnicodeDecodeError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="O arquivo deve estar em UTF-8"
+        )
+    
+    async def corpo():
+        yield primeiro
+        async for pedaco in pedacos:
+            yield pedaco
+    
+    async def registros():
+        numero = 0
+        cabecalho = None
+        async for linha in ler_linhas(corpo(), juntar_aspas=formato == "csv"):
+            if "\ufffd" in linha and (formato == "ndjson" or cabecalho is not None):
+                numero += 1
+                yield numero, None, "Registro com bytes fora do UTF-8"
+                continue
+            if formato == "csv":
+                campos = next(csv.reader([linha]))
+                if cabecalho is None:
+                    cabecalho = [campo.strip().lower() for campo in campos]
+                    continue
+                numero += 1
+                if len(campos) != len(cabecalho):
+                    yield numero, None, "Quantidade de colunas diferente do cabeçalho"
+                else:
+                    yield numero, dict(zip(cabecalho, campos)), None
+            else:
+                numero += 1
+                try:
+                    yield numero, json.loads(linha), None
+                except json.JSONDecodeError:
+                    yield numero, None, "JSON inválido"
+    
+    async def processar():
+        criados = erros = 0
+        lote = []
+        
+        async def despachar(lote):
+            nonlocal criados, erros
+            resultados = await run_in_threadpool(importar_lote, lote, notificar)
+            if any(resultado["status"] == "criado" for resultado in resultados):
+                aviso_alteracoes.notificar()
+                await invalidar_cache_cliente()
+            saida = []
+            for resultado in resultados:
+                if resultado["status"] == "criado":
+                    criados += 1
+                else:
+                    erros += 1
+                saida.append(json.dumps(resultado, ensure_ascii=False))
+            return "\n".join(saida) + "\n"
+        
+        async for registro in registros():
+            lote.append(registro)
+            if len(lote) >= BULK_LOTE:
+                yield await despachar(lote)
+                lote = []
+        if lote:
+            yield await despachar(lote)
+        
+        if criados and notificar:
+            dispatcher = getattr(app.state, "outbox", None)
+            if dispatcher:
+                dispatcher.notificar()
+        logger.info(f"Importação em massa concluída: {criados} criados, {erros} com erro")
+        yield json.dumps({"resumo": {"criados": criados, "erros": erros}}) + "\n"
+    
+    return StreamingResponseComCorpo(processar(), media_type="application/x-ndjson")
+
+async def alterar_clientes_em_lotes(
+    db: AsyncSession, alvo: AlvoClientesLote, valores: dict, operacao: str, alterados: List[int]
+):
+    """UPDATE set-based nos clientes ativos do alvo, um lote de `BULK_LOTE` por transação"""
+    condicoes = [ClienteDB.deleted_at.is_(None)]
+    if alvo.filtro is not None:
+        condicoes = filtros_clientes(**alvo.filtro.model_dump())
+    ids = sorted(set(alvo.ids)) if alvo.ids is not None else None
+    inicio = 0
+    while True:
+        if ids is not None:
+            lote = ids[inicio:inicio + BULK_LOTE]
+            if not lote:
+                break
+            inicio += BULK_LOTE
+            selecao = ClienteDB.id.in_(lote)
+        else:
+            ultimo_id = alterados[-1] if alterados else 0
+            selecao = ClienteDB.id.in_(
+                select(ClienteDB.id)
+                .where(*condicoes, ClienteDB.id > ultimo_id)
+                .order_by(ClienteDB.id)
+                .limit(BULK_LOTE)
+                .scalar_subquery()
+            )
+        
+        with etapa(f"clientes_bulk.{operacao}"):
+            linhas = (await db.execute(
+                update(ClienteDB)
+                .where(selecao, *condicoes)
+                .values(**valores)
+                .returning(*COLUNAS_ALTERACAO)
+            )).all()
+            if linhas:
+                await db.execute(insert(ClienteAlteracaoDB), [
+                    {"operacao": operacao, **dados_alteracao(linha)} for linha in linhas
+                ])
+            await db.commit()
+        alterados.extend(sorted(linha.id for linha in linhas))
+        if ids is None and len(linhas) < BULK_LOTE:
+            break
+
+def resumo_lote(alvo: AlvoClientesLote, chave: str, alterados: List[int]) -> dict:
+    resumo = {chave: len(alterados)}
+    if alvo.ids is not None:
+        resumo["nao_encontrados"] = len(set(alvo.ids)) - len(alterados)
+    return resumo
+
+async def aplicar_lote(db: AsyncSession, alvo: AlvoClientesLote, valores: dict, operacao: str) -> List[int]:
+    """Executa a operação em massa, avisa o feed e invalida o cache (também se um lote falhar)"""
+    alterados = []
+    try:
+        await alterar_clientes_em_lotes(db, alvo, valores, operacao, alterados)
+        return alterados
+    except HTTPException:
+        raise
+    except IntegrityError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=mensagem_duplicado(e, " por outro cliente")
+        )
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro interno do servidor: {str(e)}"
+        )
+    finally:
+        # Os lotes já confirmados continuam valendo mesmo se um lote seguinte falhar
+        aviso_alteracoes.notificar()
+        await invalidar_cache_clientes(alterados)
+
+@app.patch("/clientes/bulk")
+async def atualizar_clientes_em_massa(lote: ClientesLoteUpdate, db: AsyncSession = Depends(get_db)):
+    """Atualizar em massa os clientes de uma lista de ids ou de um filtro"""
+    alterados = await aplicar_lote(db, lote, valores_atualizacao(lote.valores), "atualizado")
+    logger.info(f"Atualização em massa concluída: {len(alterados)} clientes")
+    return resumo_lote(lote, "atualizados", alterados)
+
+@app.delete("/clientes/bulk")
+async def deletar_clientes_em_massa(alvo: AlvoClientesLote, db: AsyncSession = Depends(get_db)):
+    """Deletar em massa os clientes de uma lista de ids ou de um filtro"""
+    agora = datetime.utcnow()
+    alterados = await aplicar_lote(db, alvo, {"deleted_at": agora, "updated_at": agora}, "apagado")
+    logger.info(f"Exclusão em massa concluída: {len(alterados)} clientes")
+    return resumo_lote(alvo, "apagados", alterados)
+
+@app.get("/clientes", response_model=List[ClienteResponse])
+async def listar_clientes(
+    request: Request,
+    skip: int = 0,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    sort: str = "id",
+    created_since: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    tipo_documento: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Listar todos os clientes com paginação, filtros e ordenação"""
+    try:
+        if sort not in ORDENACOES_CLIENTES:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
-                detail="CPF/CNPJ já cadastrado"
+                detail="Ordenação inválida: use id, -id, created_at ou -created_at"
+            )
+        condicoes = filtros_clientes(created_since, created_before, tipo_documento)
+        chave = None
+        if cache_respostas is not None:
+            chave = await cache_respostas.chave_lista(
+                skip, limit, cursor, sort, created_since, created_before, tipo_documento
+            )
+            entrada = await cache_respostas.obter(chave)
+            if entrada is not None:
+                return resposta_cacheada(request, entrada, "HIT")
+        
+        decrescente = sort.startswith("-")
+        if sort.endswith("created_at"):
+            chave_ordem = (ClienteDB.created_at, ClienteDB.id)
+        else:
+            chave_ordem = (ClienteDB.id,)
+        query = select(*COLUNAS_CLIENTE).where(*condicoes).order_by(
+            *(coluna.desc() if decrescente else coluna for coluna in chave_ordem)
+        )
+        if cursor is not None:
+            try:
+                ultimo_id, ultimo_created_at = decodificar_cursor(cursor, sort)
+            except ValueError as e:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=str(e)
+                )
+            if len(chave_ordem) == 1:
+                posicao, ultimo = ClienteDB.id, ultimo_id
+            else:
+                posicao, ultimo = tuple_(*chave_ordem), tuple_(ultimo_created_at, ultimo_id)
+            query = query.where(posicao < ultimo if decrescente else posicao > ultimo)
+        else:
+            query = query.offset(skip)
+        
+        with etapa("listar_clientes.consulta"):
+            clientes = (await db.execute(query.limit(limit))).all()
+        headers = {}
+        if limit > 0 and len(clientes) == limit:
+            headers["X-Next-Cursor"] = codificar_cursor(clientes[-1].id, sort, clientes[-1].created_at)
+        
+        with etapa("listar_clientes.serializacao"):
+            corpo = lista_clientes_json(clientes)
+        if chave is None:
+            return Response(content=corpo, media_type="application/json", headers=headers)
+        entrada = await cache_respostas.guardar(chave, corpo, headers)
+        return resposta_cacheada(request, entrada, "MISS")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro interno do servidor: {str(e)}"
+        )
+
+PERIODOS_ESTATISTICAS = {"dia": ("%Y-%m-%d", "YYYY-MM-DD"), "mes": ("%Y-%m", "YYYY-MM")}
+
+@app.get("/clientes/stats")
+async def estatisticas_clientes(
+    request: Request,
+    created_since: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    tipo_documento: Optional[str] = None,
+    periodo: Optional[str] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    """Contagens agregadas dos clientes ativos, com os mesmos filtros da listagem"""
+    try:
+        if periodo is not None and periodo not in PERIODOS_ESTATISTICAS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Período inválido: use dia ou mes"
+            )
+        condicoes = filtros_clientes(created_since, created_before, tipo_documento)
+        chave = None
+        if cache_respostas is not None:
+            chave = await cache_respostas.chave_lista(
+                "stats", created_since, created_before, tipo_documento, periodo
+            )
+            entrada = await cache_respostas.obter(chave)
+            if entrada is not None:
+                return resposta_cacheada(request, entrada, "HIT")
+        
+        with etapa("estatisticas_clientes.consulta"):
+            # Uma subconsulta por tipo: cada uma é um seek em (tipo_documento, created_at)
+            tipos = [tipo_documento.lower()] if tipo_documento is not None else TIPOS_DOCUMENTO
+            query = select(*(
+                select(func.count()).where(*condicoes, ClienteDB.tipo_documento == tipo).scalar_subquery()
+                for tipo in tipos
+            ))
+            contagens = (await db.execute(query)).one()
+            por_tipo = dict.fromkeys(TIPOS_DOCUMENTO, 0)
+            por_tipo.update(zip(tipos, contagens))
+            resultado = {"total": sum(por_tipo.values()), "por_tipo_documento": por_tipo}
+            
+            if periodo is not None:
+                formato_sqlite, formato_postgres = PERIODOS_ESTATISTICAS[periodo]
+                if engine.dialect.name == "sqlite":
+                    coluna_periodo = func.strftime(formato_sqlite, ClienteDB.created_at)
+                else:
+                    coluna_periodo = func.to_char(ClienteDB.created_at, formato_postgres)
+                coluna_periodo = coluna_periodo.label("periodo")
+                query = (
+                    select(coluna_periodo, func.count())
+                    .where(*condicoes)
+                    .group_by(coluna_periodo)
+                    .order_by(coluna_periodo)
+                )
+                resultado["por_periodo"] = [
+                    {"periodo": valor, "total": total} for valor, total in await db.execute(query)
+                ]
+        
+        corpo = _codificar_json(resultado).encode()
+        if chave is None:
+            return Response(content=corpo, media_type="application/json")
+        entrada = await cache_respostas.guardar(chave, corpo)
+        return resposta_cacheada(request, entrada, "MISS")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro interno do servidor: {str(e)}"
+        )
+
+# Letras acentuadas (Latin-1 e Latin Extended-A) -> letra base
+TABELA_SEM_ACENTO = {
+    codigo: "".join(c for c in unicodedata.normalize("NFKD", chr(codigo)) if not unicodedata.combining(c))
+    for codigo in range(0xC0, 0x180)
+    if unicodedata.normalize("NFKD", chr(codigo)) != chr(codigo)
+}
+
+def normalizar_texto(texto: str) -> str:
+    """Minúsculas e sem acentos (busca de clientes e classificação de notas)"""
+    texto = texto.lower()
+    if texto.isascii():
+        return texto
+    return texto.translate(TABELA_SEM_ACENTO)
+
+def consulta_busca(q: str):
+    """Decide o tipo de busca pelo termo"""
+    if RE_TERMO_DOCUMENTO.fullmatch(q):
+        return "documento", RE_NAO_DIGITO.sub('', q)
+    if ("@" in q and q.strip("@")) or RE_TERMO_EMAIL.fullmatch(q):
+        return "email", q
+    tokens = RE_TOKEN_BUSCA.findall(normalizar_texto(q))
+    if not tokens:
+        return None, None
+    return "nome", tokens
+
+def faixa_prefixo(coluna, prefixo: str):
+    """Condição `coluna LIKE 'prefixo%'` como faixa, para usar o índice B-tree"""
+    if engine.dialect.name == "postgresql":
+        coluna = coluna.collate("C")
+    return (coluna >= prefixo) & (coluna < prefixo[:-1] + chr(ord(prefixo[-1]) + 1))
+
+def query_busca(tipo: str, consulta):
+    """SELECT das colunas do cliente filtrado e ordenado para as buscas por e-mail e documento"""
+    ativos = select(*COLUNAS_CLIENTE).where(ClienteDB.deleted_at.is_(None))
+    if tipo == "email":
+        # Prefixo do e-mail pelo índice único (como digitado e em minúsculas)
+        faixas = {consulta, consulta.lower()}
+        return ativos.where(
+            or_(*(faixa_prefixo(ClienteDB.email, prefixo) for prefixo in faixas))
+        ).order_by(ClienteDB.email)
+    
+    if tipo == "nome":
+        # Sem FTS5 (outros bancos): LIKE simples no nome
+        return ativos.where(
+            *(ClienteDB.nome.ilike(f"%{token}%") for token in consulta)
+        ).order_by(ClienteDB.nome, ClienteDB.id)
+    
+    if len(consulta) < 3 or len(consulta) in PESOS_DOCUMENTO:
+        # Documento completo ou prefixo curto (trigramas precisam de 3 dígitos):
+        # direto no índice único de cpf_cnpj
+        return ativos.where(faixa_prefixo(ClienteDB.cpf_cnpj, consulta)).order_by(ClienteDB.cpf_cnpj)
+    
+    if engine.dialect.name != "sqlite":
+        return ativos.where(ClienteDB.cpf_cnpj.like(f"%{consulta}%")).order_by(ClienteDB.id)
+    
+    encontrados = text(
+        "SELECT rowid AS id FROM clientes_busca_documento WHERE clientes_busca_documento MATCH :consulta"
+    ).bindparams(consulta=f'"{consulta}"').columns(id=Integer).subquery("busca")
+    # Quem começa com os dígitos buscados vem antes de quem só os contém
+    return ativos.join(encontrados, encontrados.c.id == ClienteDB.id).order_by(
+        ClienteDB.cpf_cnpj.notlike(f"{consulta}%"), ClienteDB.id
+    )
+
+def expressao_busca_nome(tokens: List[str], todas_prefixo: bool) -> str:
+    """Expressão FTS5 da busca por nome"""
+    termos = [
+        f'"{token}"*' if todas_prefixo or posicao == len(tokens) - 1 or len(token) <= 6 else f'"{token}"'
+        for posicao, token in enumerate(tokens)
+    ]
+    return " AND ".join(termos)
+
+async def buscar_por_nome(db: AsyncSession, tokens: List[str], skip: int, limit: int) -> list:
+    """Busca por nome no índice FTS5, retornando linhas com as colunas de ClienteResponse"""
+    sql = text(
+        "SELECT c.id, c.nome, c.email, c.cpf_cnpj, c.created_at "
+        "FROM clientes_busca JOIN clientes AS c ON c.id = clientes_busca.rowid "
+        "WHERE clientes_busca MATCH :consulta AND c.deleted_at IS NULL "
+        "ORDER BY clientes_busca.rank, length(c.nome), c.id LIMIT :limit OFFSET :skip"
+    ).columns(*COLUNAS_CLIENTE)
+    consulta = expressao_busca_nome(tokens, False)
+    todas_prefixo = expressao_busca_nome(tokens, True)
+    if consulta != todas_prefixo and (await db.execute(
+        text("SELECT 1 FROM clientes_busca WHERE clientes_busca MATCH :consulta LIMIT 1"), {"consulta": consulta}
+    )).first() is None:
+        consulta = todas_prefixo
+    return (await db.execute(sql, {"consulta": consulta, "limit": limit, "skip": skip})).all()
+
+@app.get("/clientes/search", response_model=List[ClienteResponse])
+async def buscar_clientes(
+    request: Request,
+    q: str,
+    skip: int = 0,
+    limit: int = 20,
+    db: AsyncSession = Depends(get_db)
+):
+    """Buscar clientes por nome, e-mail ou CPF/CNPJ"""
+    termo = q.strip()
+    tipo, consulta = consulta_busca(termo)
+    if not tipo or not consulta:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Informe um termo de busca com letras ou números"
+        )
+    limit = max(1, min(limit, BUSCA_LIMITE_MAX))
+    skip = max(0, skip)
+    
+    try:
+        chave = None
+        if cache_respostas is not None:
+            chave = await cache_respostas.chave_lista("busca", termo, skip, limit)
+            entrada = await cache_respostas.obter(chave)
+            if entrada is not None:
+                return resposta_cacheada(request, entrada, "HIT")
+        
+        if tipo == "nome" and engine.dialect.name == "sqlite":
+            clientes = await buscar_por_nome(db, consulta, skip, limit)
+        else:
+            clientes = (await db.execute(query_busca(tipo, consulta).offset(skip).limit(limit))).all()
+        
+        corpo = lista_clientes_json(clientes)
+        if chave is None:
+            return Response(content=corpo, media_type="application/json")
+        entrada = await cache_respostas.guardar(chave, corpo)
+        return resposta_cacheada(request, entrada, "MISS")
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro interno do servidor: {str(e)}"
+        )
+
+# Colunas e formatos da exportação
+COLUNAS_EXPORTACAO = ("id", "nome", "email", "cpf_cnpj", "created_at", "updated_at", "deleted_at")
+TIPOS_EXPORTACAO = {
+    "ndjson": ("application/x-ndjson", "ndjson"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+def blocos_ndjson(linhas) -> bytes:
+    return "".join(
+        _codificar_json({
+            "id": linha[0], "nome": linha[1], "email": linha[2], "cpf_cnpj": linha[3],
+            "created_at": _data_iso(linha[4]), "updated_at": _data_iso(linha[5]),
+            "deleted_at": _data_iso(linha[6])
+        }) + "\n"
+        for linha in linhas
+    ).encode()
+
+def blocos_csv(linhas, cabecalho: bool) -> bytes:
+    saida = io.StringIO()
+    escritor = csv.writer(saida, lineterminator="\n")
+    if cabecalho:
+        escritor.writerow(COLUNAS_EXPORTACAO)
+    escritor.writerows(
+        (linha[0], linha[1], linha[2], linha[3], *(_data_iso(data) or "" for data in linha[4:]))
+        for linha in linhas
+    )
+    return saida.getvalue().encode()
+
+class SaidaParquet:
+    """Arquivo só de escrita para o ParquetWriter, esvaziado a cada row group enviado"""
+    
+    def __init__(self):
+        self.pedacos = []
+        self.posicao = 0
+        self.closed = False
+    
+    def write(self, dados) -> int:
+        dados = bytes(dados)
+        self.pedacos.append(dados)
+        self.posicao += len(dados)
+        return len(dados)
+    
+    def tell(self) -> int:
+        return self.posicao
+    
+    def flush(self):
+        pass
+    
+    def close(self):
+        self.closed = True
+    
+    def esvaziar(self) -> bytes:
+        dados = b"".join(self.pedacos)
+        self.pedacos.clear()
+        return dados
+
+class EscritorParquet:
+    """Grava cada lote de linhas como um row group Parquet (requer `pip install pyarrow`)"""
+    
+    def __init__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        self._pa = pa
+        self.esquema = pa.schema([
+            ("id", pa.int64()), ("nome", pa.string()), ("email", pa.string()), ("cpf_cnpj", pa.string()),
+            ("created_at", pa.timestamp("us")), ("updated_at", pa.timestamp("us")),
+            ("deleted_at", pa.timestamp("us")),
+        ])
+        self.saida = SaidaParquet()
+        self.escritor = pq.ParquetWriter(self.saida, self.esquema, compression="zstd")
+    
+    def bloco(self, linhas) -> bytes:
+        colunas = list(zip(*linhas))
+        self.escritor.write_table(self._pa.Table.from_arrays(
+            [self._pa.array(coluna, type=campo.type) for coluna, campo in zip(colunas, self.esquema)],
+            schema=self.esquema
+        ))
+        return self.saida.esvaziar()
+    
+    def finalizar(self) -> bytes:
+        self.escritor.close()
+        return self.saida.esvaziar()
+
+@app.get("/clientes/export")
+async def exportar_clientes(
+    formato: str = Query("ndjson", alias="format"),
+    updated_since: Optional[datetime] = None,
+    since_seq: Optional[int] = None
+):
+    """Exportar a base de clientes em NDJSON, CSV ou Parquet"""
+    formato = formato.lower()
+    if formato not in TIPOS_EXPORTACAO:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Formato inválido: use ndjson, csv ou parquet"
+        )
+    escritor_parquet = None
+    if formato == "parquet":
+        try:
+            escritor_parquet = EscritorParquet()
+        except ImportError:
+            raise HTTPException(
+                status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                detail="Exportação em Parquet requer o pacote pyarrow (pip install pyarrow)"
+            )
+    
+    if since_seq is not None and updated_since is not None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use since_seq ou updated_since, não os dois"
+        )
+    
+    exportado_em = datetime.utcnow() - timedelta(seconds=EXPORTACAO_MARGEM)
+    async with async_engine.connect() as conexao:
+        ultimo_seq = await conexao.scalar(select(func.coalesce(func.max(ClienteAlteracaoDB.seq), 0)))
+    colunas = [getattr(ClienteDB, nome) for nome in COLUNAS_EXPORTACAO]
+    if since_seq is not None:
+        # O seq cresce na ordem de confirmação: nada confirmado depois fica com um seq menor
+        alterados = select(ClienteAlteracaoDB.cliente_id).where(ClienteAlteracaoDB.seq > since_seq)
+        query = select(*colunas).where(ClienteDB.id.in_(alterados)).order_by(ClienteDB.id)
+    elif updated_since is None:
+        query = select(*colunas).where(ClienteDB.deleted_at.is_(None)).order_by(ClienteDB.id)
+    else:
+        query = (
+            select(*colunas)
+            .where(ClienteDB.updated_at >= utc_sem_fuso(updated_since))
+            .order_by(ClienteDB.updated_at, ClienteDB.id)
+        )
+    
+    async def gerar():
+        primeiro = True
+        try:
+            async with async_engine.connect() as conexao:
+                resultado = await conexao.stream(query.execution_options(yield_per=EXPORTACAO_LOTE))
+                async for linhas in resultado.partitions():
+                    if formato == "ndjson":
+                        yield blocos_ndjson(linhas)
+                    elif formato == "csv":
+                        yield blocos_csv(linhas, cabecalho=primeiro)
+                    else:
+                        yield await run_in_threadpool(escritor_parquet.bloco, linhas)
+                    primeiro = False
+            if formato == "csv" and primeiro:
+                yield blocos_csv([], cabecalho=True)
+            if escritor_parquet is not None:
+                yield escritor_parquet.finalizar()
+        except Exception as e:
+            # O status 200 já foi enviado: a resposta termina truncada
+            logger.error(f"Erro durante a exportação de clientes: {str(e)}")
+            raise
+    
+    media_type, extensao = TIPOS_EXPORTACAO[formato]
+    return StreamingResponse(
+        gerar(),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="clientes.{extensao}"',
+            "X-Exportado-Em": exportado_em.isoformat(),
+            "X-Ultimo-Seq": str(ultimo_seq)
+        }
+    )
+
+# Feed de alterações de clientes
+def alteracao_json(linha) -> str:
+    """Alteração em JSON (o estado do cliente já está gravado como JSON em `dados`)"""
+    return (
+        f'{{"seq":{linha.seq},"cliente_id":{linha.cliente_id},"operacao":"{linha.operacao}",'
+        f'"created_at":"{linha.created_at.isoformat()}","cliente":{linha.dados}}}'
+    )
+
+async def ler_alteracoes(since: int, limit: int) -> list:
+    """Alterações com `seq` maior que `since`, pelo índice da chave primária"""
+    async with async_engine.connect() as conexao:
+        return (await conexao.execute(
+            select(
+                ClienteAlteracaoDB.seq, ClienteAlteracaoDB.cliente_id, ClienteAlteracaoDB.operacao,
+                ClienteAlteracaoDB.dados, ClienteAlteracaoDB.created_at
             )
-        
-        # Criar novo cliente
-        db_cliente = ClienteDB(
-            nome=cliente.nome,
-            email=cliente.email,
-            cpf_cnpj=cpf_cnpj_limpo
+            .where(ClienteAlteracaoDB.seq > since)
+            .order_by(ClienteAlteracaoDB.seq)
+            .limit(limit)
+        )).all()
+
+async def esperar_alteracoes(since: int, limit: int, espera: float) -> list:
+    """Lê as alterações depois de `since`, esperando até `espera` segundos se ainda não houver"""
+    prazo = time.monotonic() + espera
+    while True:
+        # O evento é pego antes da leitura para não perder uma alteração confirmada entre as duas
+        evento = aviso_alteracoes.evento
+        # Protegida do cancelamento (cliente SSE que desconecta): a leitura termina
+        # e devolve a conexão ao pool em vez de ser interrompida no meio
+        linhas = await asyncio.shield(ler_alteracoes(since, limit))
+        restante = prazo - time.monotonic()
+        if linhas or restante <= 0:
+            return linhas
+        inicio_espera = time.perf_counter()
+        try:
+            await asyncio.wait_for(evento.wait(), timeout=min(restante, ALTERACOES_INTERVALO))
+        except asyncio.TimeoutError:
+            pass
+        contexto = contexto_requisicao.get()
+        if contexto is not None:
+            contexto.espera += time.perf_counter() - inicio_espera
+
+@app.get("/clientes/changes")
+async def alteracoes_clientes(request: Request, since: int = 0, limit: int = 100, wait: float = 0):
+    """Feed das alterações de clientes (criação, atualização e exclusão) depois de `since`"""
+    if since < 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="since deve ser maior ou igual a zero"
         )
-        db.add(db_cliente)
-        db.commit()
-        db.refresh(db_cliente)
+    limit = max(1, min(limit, ALTERACOES_LIMITE_MAX))
+    wait = max(0.0, min(wait, ALTERACOES_ESPERA_MAX))
+    
+    if "text/event-stream" in request.headers.get("accept", ""):
+        ultimo_evento = request.headers.get("last-event-id")
+        if ultimo_evento:
+            try:
+                since = int(ultimo_evento)
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="Last-Event-ID inválido"
+                )
         
-        # Chamar webhook do N8N
-        try:
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    N8N_WEBHOOK_URL,
-                    json={
-                        "id": db_cliente.id,
-                        "nome": db_cliente.nome,
-                        "email": db_cliente.email,
-                        "cpf_cnpj": db_cliente.cpf_cnpj,
-                        "created_at": str(db_cliente.created_at)
-                    },
-                    timeout=5.0
+        async def eventos():
+            ultimo_seq = since
+            while True:
+                linhas = await esperar_alteracoes(ultimo_seq, limit, ALTERACOES_HEARTBEAT)
+                if not linhas:
+                    # Comentário SSE: mantém a conexão viva em proxies e detecta o cliente desconectado
+                    yield ": heartbeat\n\n"
+                    continue
+                yield "".join(
+                    f"id: {linha.seq}\nevent: {linha.operacao}\ndata: {alteracao_json(linha)}\n\n"
+                    for linha in linhas
                 )
-                print(f"✅ N8N Webhook chamado com sucesso para {db_cliente.nome}")
-                print(f"   Status: {response.status_code}")
-        except Exception as e:
-            print(f"⚠️ Erro ao chamar N8N webhook: {e}")
+                ultimo_seq = linhas[-1].seq
         
-        return db_cliente
-    
-    except HTTPException:
-        raise
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Erro interno do servidor: {str(e)}"
+        return StreamingResponse(
+            eventos(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
         )
-
-@app.get("/clientes", response_model=List[ClienteResponse])
-def listar_clientes(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
-    """Listar todos os clientes com paginação"""
+    
     try:
-        clientes = db.query(ClienteDB).offset(skip).limit(limit).all()
-        return clientes
+        linhas = await esperar_alteracoes(since, limit, wait)
+        ultimo_seq = linhas[-1].seq if linhas else since
+        corpo = '{"alteracoes":[' + ",".join(map(alteracao_json, linhas)) + f'],"ultimo_seq":{ultimo_seq}}}'
+        return Response(content=corpo, media_type="application/json", headers={"X-Ultimo-Seq": str(ultimo_seq)})
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -288,16 +2663,31 @@ def listar_clientes(skip: int = 0, limit: int = 100, db: Session = Depends(get_d
         )
 
 @app.get("/clientes/{cliente_id}", response_model=ClienteResponse)
-def obter_cliente(cliente_id: int, db: Session = Depends(get_db)):
+async def obter_cliente(cliente_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Obter um cliente específico por ID"""
     try:
-        cliente = db.query(ClienteDB).filter(ClienteDB.id == cliente_id).first()
+        chave = f"cliente:{cliente_id}"
+        if cache_respostas is not None:
+            entrada = await cache_respostas.obter(chave)
+            if entrada is not None:
+                return resposta_cacheada(request, entrada, "HIT")
+            # Lida antes da consulta: uma escrita no meio impede guardar o corpo antigo
+            versao = await cache_respostas.versao_clientes()
+        
+        cliente = (await db.execute(
+            select(*COLUNAS_CLIENTE).where(ClienteDB.id == cliente_id, ClienteDB.deleted_at.is_(None))
+        )).first()
         if cliente is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Cliente não encontrado"
             )
-        return cliente
+        
+        corpo = cliente_json(cliente)
+        if cache_respostas is None:
+            return Response(content=corpo, media_type="application/json")
+        entrada = await cache_respostas.guardar_se_atual(chave, corpo, versao)
+        return resposta_cacheada(request, entrada, "MISS")
     except HTTPException:
         raise
     except Exception as e:
@@ -307,83 +2697,82 @@ def obter_cliente(cliente_id: int, db: Session = Depends(get_db)):
         )
 
 @app.put("/clientes/{cliente_id}", response_model=ClienteResponse)
-def atualizar_cliente(cliente_id: int, cliente: ClienteUpdate, db: Session = Depends(get_db)):
+async def atualizar_cliente(cliente_id: int, cliente: ClienteUpdate, db: AsyncSession = Depends(get_db)):
     """Atualizar um cliente existente"""
     try:
-        db_cliente = db.query(ClienteDB).filter(ClienteDB.id == cliente_id).first()
-        if db_cliente is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Cliente não encontrado"
-            )
-        
         # Atualizar campos fornecidos
-        if cliente.nome is not None:
-            db_cliente.nome = cliente.nome
-        
-        if cliente.email is not None:
-            # Verificar se novo email já existe (exceto para o cliente atual)
-            db_cliente_email = db.query(ClienteDB).filter(
-                ClienteDB.email == cliente.email,
-                ClienteDB.id != cliente_id
-            ).first()
-            if db_cliente_email:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="Email já cadastrado por outro cliente"
-                )
-            db_cliente.email = cliente.email
+        valores = valores_atualizacao(cliente)
         
-        if cliente.cpf_cnpj is not None:
-            # Validação simples: apenas verifica se já existe outro cliente com o mesmo CPF/CNPJ
-            cpf_cnpj_limpo = re.sub(r'[^\d]', '', cliente.cpf_cnpj)
-            
-            # Verificar se novo CPF/CNPJ já existe (exceto para o cliente atual)
-            db_cliente_cpf_cnpj = db.query(ClienteDB).filter(
-                ClienteDB.cpf_cnpj == cpf_cnpj_limpo,
-                ClienteDB.id != cliente_id
-            ).first()
-            
-            if db_cliente_cpf_cnpj:
+        if valores:
+            # UPDATE ... RETURNING: busca, alteração e verificação de unicidade em um só comando
+            try:
+                db_cliente = await db.scalar(
+                    update(ClienteDB)
+                    .where(ClienteDB.id == cliente_id, ClienteDB.deleted_at.is_(None))
+                    .values(**valores)
+                    .returning(ClienteDB)
+                )
+            except IntegrityError as e:
+                await db.rollback()
                 raise HTTPException(
                     status_code=status.HTTP_400_BAD_REQUEST,
-                    detail="CPF/CNPJ já cadastrado por outro cliente"
+                    detail=mensagem_duplicado(e, " por outro cliente")
                 )
-            
-            db_cliente.cpf_cnpj = cpf_cnpj_limpo
+        else:
+            db_cliente = await db.get(ClienteDB, cliente_id)
+            if db_cliente is not None and db_cliente.deleted_at is not None:
+                db_cliente = None
         
-        db.commit()
-        db.refresh(db_cliente)
+        if db_cliente is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Cliente não encontrado"
+            )
+        
+        if valores:
+            db.add(alteracao_cliente("atualizado", db_cliente))
+        await db.commit()
+        if valores:
+            aviso_alteracoes.notificar()
+        await invalidar_cache_cliente(cliente_id)
         return db_cliente
     
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro interno do servidor: {str(e)}"
         )
 
 @app.delete("/clientes/{cliente_id}", status_code=status.HTTP_204_NO_CONTENT)
-def deletar_cliente(cliente_id: int, db: Session = Depends(get_db)):
+async def deletar_cliente(cliente_id: int, db: AsyncSession = Depends(get_db)):
     """Deletar um cliente"""
     try:
-        db_cliente = db.query(ClienteDB).filter(ClienteDB.id == cliente_id).first()
-        if db_cliente is None:
+        agora = datetime.utcnow()
+        apagado = (await db.execute(
+            update(ClienteDB)
+            .where(ClienteDB.id == cliente_id, ClienteDB.deleted_at.is_(None))
+            .values(deleted_at=agora, updated_at=agora)
+            .returning(*COLUNAS_ALTERACAO)
+        )).first()
+        if apagado is None:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Cliente não encontrado"
             )
         
-        db.delete(db_cliente)
-        db.commit()
+        db.add(alteracao_cliente("apagado", apagado))
+        await db.commit()
+        aviso_alteracoes.notificar()
+        await invalidar_cache_cliente(cliente_id)
         return None
     
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Erro interno do servidor: {str(e)}"
@@ -395,6 +2784,21 @@ def health_check():
     """Verificar status da API"""
     return {"status": "healthy", "timestamp": datetime.now()}
 
+# Endpoint com os contadores do cache de respostas
+@app.get("/cache/estatisticas")
+def estatisticas_cache():
+    """Contadores de acerto/falha do cache de respostas e do cache de análises"""
+    respostas = {"habilitado": False}
+    if cache_respostas is not None:
+        respostas = {"habilitado": True, **cache_respostas.estatisticas()}
+    return {"respostas": respostas, "analises": cache_analises.estatisticas()}
+
+# Endpoint de métricas no formato de exposição do Prometheus
+@app.get("/metrics", include_in_schema=False)
+def exportar_metricas():
+    """Latência por rota, banco, pool, webhook, OpenAI e etapas instrumentadas"""
+    return Response(content=metricas.exportar(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Endpoint raiz
 @app.get("/")
 def root():
@@ -406,9 +2810,168 @@ def root():
         "redoc": "/redoc"
     }
 
+# Clientes OpenAI compartilhados pelo processo, um por API key: trocar a key
+# não derruba as chamadas em andamento com a anterior; todos são fechados no shutdown
+_clientes_openai: dict = {}
+
+# Prioridade na fila da OpenAI (menor = atendida primeiro)
+PRIORIDADE_INTERATIVA = 0
+PRIORIDADE_LOTE = 1
+
+class AgendadorOpenAI:
+    """Fila com prioridade na frente da OpenAI, dentro do orçamento por minuto da conta"""
+    
+    def __init__(self, rpm: int, tpm: int, concorrencia: int, fila_max: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.concorrencia = concorrencia
+        self.fila_max = fila_max
+        self._requisicoes = float(rpm)
+        self._tokens = float(tpm)
+        self._atualizado_em = time.monotonic()
+        self._pausado_ate = 0.0
+        self._em_andamento = 0
+        self._fila = []
+        self._ordem = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+    
+    async def reservar(self, tokens: int, prioridade: int, ordem: Optional[int] = None) -> int:
+        """Espera a vez e o orçamento; retorna a posição de chegada na fila"""
+        if ordem is None:
+            if len(self._fila) >= self.fila_max:
+                METRICA_OPENAI_FILA_CHEIA.inc()
+                raise HTTPException(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    detail="Muitas análises aguardando a OpenAI, tente novamente em instantes",
+                    headers={"Retry-After": str(self.segundos_para_esvaziar())}
+                )
+            ordem = next(self._ordem)
+        
+        futuro = asyncio.get_running_loop().create_future()
+        entrada = (prioridade, ordem, tokens, futuro)
+        heapq.heappush(self._fila, entrada)
+        self._despachar()
+        try:
+            await futuro
+        except asyncio.CancelledError:
+            if futuro.cancelled():
+                # Desistiu na fila: sai dela para não ocupar lugar
+                if entrada in self._fila:
+                    self._fila.remove(entrada)
+                    heapq.heapify(self._fila)
+            else:
+                # Cancelado depois de receber a vaga: devolve
+                self.liberar()
+            raise
+        return ordem
+    
+    def liberar(self):
+        """Devolve a vaga de concorrência e chama o próximo da fila"""
+        self._em_andamento -= 1
+        if self._fila:
+            self._despachar()
+    
+    def pausar(self, segundos: float):
+        """Segura a fila inteira (429 da OpenAI: o orçamento da conta acabou)"""
+        self._pausado_ate = max(self._pausado_ate, time.monotonic() + segundos)
+    
+    def ajustar(self, headers):
+        """Corrige os baldes pelo saldo informado pela OpenAI (x-ratelimit-remaining-*)"""
+        for header, atributo in (("x-ratelimit-remaining-requests", "_requisicoes"), ("x-ratelimit-remaining-tokens", "_tokens")):
+            try:
+                restante = float(headers.get(header))
+            except (TypeError, ValueError):
+                continue
+            setattr(self, atributo, min(getattr(self, atributo), restante))
+    
+    def segundos_para_esvaziar(self) -> int:
+        """Estimativa para o Retry-After: tempo até a fila atual sair, pelo orçamento de requisições"""
+        espera = max(0.0, self._pausado_ate - time.monotonic())
+        if self.rpm:
+            espera += len(self._fila) * 60 / self.rpm
+        return max(1, math.ceil(espera))
+    
+    def _recarregar(self, agora: float):
+        decorrido = agora - self._atualizado_em
+        self._atualizado_em = agora
+        if self.rpm:
+            self._requisicoes = min(self.rpm, self._requisicoes + decorrido * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + decorrido * self.tpm / 60)
+    
+    def _espera_orcamento(self, tokens: int, agora: float) -> float:
+        """Segundos até caberem 1 requisição e `tokens` no orçamento (0 = cabe agora)"""
+        espera = max(0.0, self._pausado_ate - agora)
+        if self.rpm and self._requisicoes < 1:
+            espera = max(espera, (1 - self._requisicoes) * 60 / self.rpm)
+        if self.tpm:
+            # Um pedido maior que o orçamento inteiro passa quando o balde enche
+            tokens = min(tokens, self.tpm)
+            if self._tokens < tokens:
+                espera = max(espera, (tokens - self._tokens) * 60 / self.tpm)
+        return espera
+    
+    def _despachar(self):
+        """Entrega vagas à frente da fila enquanto houver orçamento e concorrência livres"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        agora = time.monotonic()
+        self._recarregar(agora)
+        while self._fila and self._em_andamento < self.concorrencia:
+            _, _, tokens, futuro = self._fila[0]
+            if futuro.done():
+                # Cancelado na fila (a limpeza em `reservar` só roda no próximo ciclo do loop)
+                heapq.heappop(self._fila)
+                continue
+            espera = self._espera_orcamento(tokens, agora)
+            if espera > 0:
+                self._timer = asyncio.get_running_loop().call_later(espera, self._despachar)
+                return
+            heapq.heappop(self._fila)
+            if self.rpm:
+                self._requisicoes -= 1
+            if self.tpm:
+                self._tokens -= tokens
+            self._em_andamento += 1
+            futuro.set_result(None)
+
+def orcamento_por_worker(orcamento: int) -> int:
+    """Parte de um orçamento da conta (RPM/TPM) que cabe a cada worker (0 = sem limite)"""
+    return max(1, orcamento // WEB_CONCURRENCY) if orcamento else 0
+
+# A conta é compartilhada entre os workers: cada um agenda com a sua parte do orçamento
+agendador_openai = AgendadorOpenAI(
+    orcamento_por_worker(OPENAI_RPM), orcamento_por_worker(OPENAI_TPM), OPENAI_CONCORRENCIA, OPENAI_FILA_MAX
+)
+
+def obter_cliente_openai(api_key: str) -> AsyncOpenAI:
+    """Retorna o AsyncOpenAI do processo para a API key, criado no primeiro uso"""
+    cliente = _clientes_openai.get(api_key)
+    if cliente is None:
+        cliente = _clientes_openai[api_key] = AsyncOpenAI(
+            api_key=api_key,
+            timeout=OPENAI_TIMEOUT,
+            # Novas tentativas ficam com o agendador, que conhece a fila e o orçamento
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                timeout=OPENAI_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=OPENAI_MAX_CONEXOES,
+                    max_keepalive_connections=OPENAI_MAX_CONEXOES,
+                    keepalive_expiry=120
+                )
+            )
+        )
+    return cliente
+
+async def fechar_clientes_openai():
+    while _clientes_openai:
+        await _clientes_openai.popitem()[1].close()
+
 # Endpoint para testar API key da OpenAI
 @app.get("/test-openai")
-def test_openai():
+async def test_openai():
     """Testa a conexão com a OpenAI API"""
     try:
         api_key = os.getenv("OPENAI_API_KEY")
@@ -419,14 +2982,18 @@ def test_openai():
         masked_key = f"{api_key[:10]}...{api_key[-4:]}" if len(api_key) > 14 else "***"
         logger.info(f"Testando API key: {masked_key}")
         
-        client = OpenAI(api_key=api_key)
+        client = obter_cliente_openai(api_key)
         
         # Teste simples
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{"role": "user", "content": "Responda apenas com 'OK'"}],
-            max_tokens=10
-        )
+        await agendador_openai.reservar(estimar_tokens("", 10), PRIORIDADE_INTERATIVA)
+        try:
+            response = await client.chat.completions.create(
+                model=OPENAI_MODELO,
+                messages=[{"role": "user", "content": "Responda apenas com 'OK'"}],
+                max_tokens=10
+            )
+        finally:
+            agendador_openai.liberar()
         
         return {
             "status": "success", 
@@ -438,98 +3005,696 @@ def test_openai():
         logger.error(f"Erro ao testar OpenAI: {str(e)}")
         return {"status": "error", "message": f"Erro: {str(e)}"}
 
-# Endpoint para análise de notas fiscais
-@app.post("/analisar-nota", response_model=NotaFiscalResponse)
-def analisar_nota_fiscal(nota: NotaFiscalRequest):
-    """Analisa uma nota fiscal usando OpenAI GPT-4"""
-    logger.info("Iniciando análise de nota fiscal")
+# Extração local dos campos da nota (antes de recorrer à OpenAI)
+RE_CNPJ = re.compile(r'(?<!\d)(\d{2}\.?\d{3}\.?\d{3}/?\d{4}-?\d{2})(?!\d)')
+RE_VALOR = r'(\d{1,3}(?:\.\d{3})+,\d{2}|\d+,\d{2}|\d+\.\d{2})(?![\d,])'
+RE_TOTAL = re.compile(
+    r'(?<![a-z])(?:valor\s+total|total\s+a\s+pagar|valor\s+a\s+pagar|total)'
+    r'(?:\s+(?:da\s+nota|geral|r\$))?\s*[:=]?\s*(?:r\$\s*)?' + RE_VALOR,
+    re.IGNORECASE
+)
+RE_DATA = re.compile(r'(?<!\d)(\d{2})/(\d{2})/(\d{4})(?!\d)')
+RE_DATA_EMISSAO = re.compile(r'(?:emiss[aã]o|emitid[ao]|data)\D{0,20}(\d{2}/\d{2}/\d{4})', re.IGNORECASE)
+RE_PALAVRA = re.compile(r'[a-z]+')
+
+# Vocabulário de cada categoria (sem acentos, minúsculo). O peso de cada termo
+# é o IDF entre as categorias: termos exclusivos de uma categoria valem mais.
+VOCABULARIO_CATEGORIAS = {
+    "alimentação": "supermercado mercado mercearia hortifruti padaria panificadora acougue restaurante lanchonete "
+                   "pizzaria ifood refeicao alimentos arroz feijao carne frango leite pao cafe acucar oleo "
+                   "macarrao frutas verduras legumes bebidas refrigerante queijo ovos biscoito",
+    "transporte": "combustivel gasolina etanol diesel posto uber taxi onibus metro passagem pedagio "
+                  "estacionamento oficina pneu pneus mecanica lubrificante corrida",
+    "saúde": "farmacia drogaria medicamento medicamentos remedio consulta clinica hospital laboratorio exame "
+             "exames dentista odontologia medico vacina",
+    "educação": "escola faculdade universidade curso cursos mensalidade matricula livraria livro livros "
+                "apostila material escolar caderno cadernos caneta canetas lapis papelaria",
+    "moradia": "aluguel condominio energia eletrica agua saneamento gas iptu internet telefone "
+               "reforma construcao tinta cimento materiais",
+    "tecnologia": "notebook computador celular smartphone monitor teclado mouse impressora software "
+                  "eletronicos tablet fone cabo carregador",
+    "vestuário": "roupa roupas camisa camiseta calca vestido sapato sapatos tenis calcados loja moda",
+    "lazer": "cinema teatro show ingresso ingressos hotel pousada viagem turismo parque streaming",
+}
+
+def _pesos_categorias() -> dict:
+    termos_por_categoria = {
+        categoria: set(normalizar_texto(vocabulario).split())
+        for categoria, vocabulario in VOCABULARIO_CATEGORIAS.items()
+    }
+    total = len(termos_por_categoria)
+    frequencia = {}
+    for termos in termos_por_categoria.values():
+        for termo in termos:
+            frequencia[termo] = frequencia.get(termo, 0) + 1
+    pesos = {}
+    for categoria, termos in termos_por_categoria.items():
+        for termo in termos:
+            pesos.setdefault(termo, []).append((categoria, math.log(total / frequencia[termo]) + 1))
+    return pesos
+
+PESOS_CATEGORIAS = _pesos_categorias()
+
+class ExtracaoNota(BaseModel):
+    """Campos encontrados no texto da nota sem chamar a OpenAI"""
+    categoria: Optional[str] = None
+    confianca_categoria: float = 0.0
+    valor_total: Optional[float] = None
+    data_emissao: Optional[str] = None
+    cnpj_emissor: Optional[str] = None
+    
+    @property
+    def confiavel(self) -> bool:
+        """Categoria com confiança suficiente e valor total encontrado"""
+        return (
+            self.categoria is not None
+            and self.confianca_categoria >= EXTRACAO_CONFIANCA_MIN
+            and self.valor_total is not None
+        )
+    
+    def resumo_local(self) -> str:
+        resumo = f"Despesa de {self.categoria}"
+        if self.valor_total is not None:
+            valor = f"{self.valor_total:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
+            resumo += f" no valor de R$ {valor}"
+        if self.data_emissao:
+            resumo += f" em {self.data_emissao}"
+        return resumo
     
+    def completar(self, resultado: NotaFiscalResponse) -> NotaFiscalResponse:
+        """Preenche os campos que a OpenAI deixou vazios com os extraídos localmente"""
+        return resultado.model_copy(update={
+            campo: getattr(self, campo)
+            for campo in ("valor_total", "data_emissao", "cnpj_emissor")
+            if getattr(resultado, campo) is None and getattr(self, campo) is not None
+        })
+    
+    def resposta(self, resumo: Optional[str] = None) -> NotaFiscalResponse:
+        return NotaFiscalResponse(
+            categoria=self.categoria,
+            resumo=resumo or self.resumo_local(),
+            valor_total=self.valor_total,
+            data_emissao=self.data_emissao,
+            cnpj_emissor=self.cnpj_emissor
+        )
+
+def converter_valor_brl(valor: str) -> float:
+    """'1.234,56' -> 1234.56 (aceita também '1234.56')"""
+    if "," in valor:
+        valor = valor.replace(".", "").replace(",", ".")
+    return float(valor)
+
+def extrair_cnpj(texto: str) -> Optional[str]:
+    for candidato in RE_CNPJ.findall(texto):
+        digitos = re.sub(r'\D', '', candidato)
+        if ClienteBase.validar_cnpj(digitos):
+            return f"{digitos[:2]}.{digitos[2:5]}.{digitos[5:8]}/{digitos[8:12]}-{digitos[12:]}"
+    return None
+
+def extrair_valor_total(texto: str) -> Optional[float]:
+    # O último "total" da nota costuma ser o valor final (depois de descontos)
+    encontrados = RE_TOTAL.findall(texto)
+    return converter_valor_brl(encontrados[-1]) if encontrados else None
+
+def _data_valida(data: str) -> bool:
     try:
-        # Verificar se a API key está configurada
-        api_key = os.getenv("OPENAI_API_KEY")
-        if not api_key:
-            logger.error("OpenAI API key não encontrada")
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="OpenAI API key não configurada"
-            )
+        datetime.strptime(data, "%d/%m/%Y")
+        return True
+    except ValueError:
+        return False
+
+def extrair_data_emissao(texto: str) -> Optional[str]:
+    # Preferir a data rotulada como emissão; senão, a primeira data válida
+    for data in RE_DATA_EMISSAO.findall(texto):
+        if _data_valida(data):
+            return data
+    for dia, mes, ano in RE_DATA.findall(texto):
+        data = f"{dia}/{mes}/{ano}"
+        if _data_valida(data):
+            return data
+    return None
+
+def classificar_categoria(texto: str) -> Tuple[Optional[str], float]:
+    """Categoria por TF-IDF sobre o vocabulário das categorias"""
+    pontuacao = {}
+    for palavra in RE_PALAVRA.findall(normalizar_texto(texto)):
+        for categoria, peso in PESOS_CATEGORIAS.get(palavra, ()):
+            pontuacao[categoria] = pontuacao.get(categoria, 0.0) + peso
+    if not pontuacao:
+        return None, 0.0
+    categoria, melhor = max(pontuacao.items(), key=lambda item: item[1])
+    total = sum(pontuacao.values())
+    suporte = min(1.0, melhor / EXTRACAO_PONTUACAO_MIN)
+    return categoria, round(melhor / total * suporte, 4)
+
+def extrair_dados_nota(texto: str) -> ExtracaoNota:
+    """Extrai CNPJ, valor total, data e categoria do texto, sem rede"""
+    categoria, confianca = classificar_categoria(texto)
+    return ExtracaoNota(
+        categoria=categoria,
+        confianca_categoria=confianca,
+        valor_total=extrair_valor_total(texto),
+        data_emissao=extrair_data_emissao(texto),
+        cnpj_emissor=extrair_cnpj(texto)
+    )
+
+# Análise de notas fiscais
+CAMPOS_NOTA = """- categoria: categoria principal da despesa (ex: alimentação, transporte, saúde, etc.)
+        - resumo: resumo amigável em português brasileiro
+        - valor_total: valor total da nota (apenas o número)
+        - data_emissao: data de emissão (formato DD/MM/AAAA)
+        - cnpj_emissor: CNPJ do emissor se disponível"""
+
+def montar_prompt_nota(texto: str) -> str:
+    """Prompt enviado à OpenAI para extrair os dados de uma nota fiscal"""
+    return f"""
+        Analise a seguinte nota fiscal e retorne um JSON com:
+        {CAMPOS_NOTA}
         
-        # Log da API key mascarada
-        masked_key = f"{api_key[:10]}...{api_key[-4:]}" if len(api_key) > 14 else "***"
-        logger.info(f"Usando API key: {masked_key}")
+        Nota fiscal:
+        {texto}
         
-        # Configurar cliente OpenAI
-        client = OpenAI(api_key=api_key)
+        Responda apenas com o JSON válido, sem texto adicional.
+        """
+
+def montar_prompt_lote(textos: List[str]) -> str:
+    """Prompt com várias notas fiscais, respondidas em um único JSON"""
+    notas = "\n\n".join(f"### Nota {indice}\n{texto}" for indice, texto in enumerate(textos))
+    return f"""
+        Analise cada uma das {len(textos)} notas fiscais abaixo e retorne um JSON no formato
+        {{"notas": [{{"indice": <número da nota>, ...}}]}}, com um item por nota contendo:
+        {CAMPOS_NOTA}
         
-        # Prompt para análise da nota fiscal
-        prompt = f"""
-        Analise a seguinte nota fiscal e retorne um JSON com:
-        - categoria: categoria principal da despesa (ex: alimentação, transporte, saúde, etc.)
+        {notas}
+        
+        Responda apenas com o JSON válido, sem texto adicional.
+        """
+
+def montar_prompt_resumo(texto: str, extracao: ExtracaoNota) -> str:
+    """Prompt curto: os campos já foram extraídos, a OpenAI só escreve o resumo"""
+    return f"""
+        A nota fiscal abaixo é uma despesa de {extracao.categoria}. Retorne um JSON com:
         - resumo: resumo amigável em português brasileiro
-        - valor_total: valor total da nota (apenas o número)
-        - data_emissao: data de emissão (formato DD/MM/AAAA)
-        - cnpj_emissor: CNPJ do emissor se disponível
         
         Nota fiscal:
-        {nota.texto}
+        {texto}
         
         Responda apenas com o JSON válido, sem texto adicional.
         """
+
+def limpar_resposta_json(resposta: str) -> str:
+    """Remove o bloco de markdown (```json ... ```) que a OpenAI às vezes inclui"""
+    if resposta.startswith("```json"):
+        resposta = resposta.replace("```json", "").replace("```", "").strip()
+        logger.info(f"Resposta limpa: {resposta}")
+    return resposta
+
+def nota_de_dados(dados: dict) -> NotaFiscalResponse:
+    """Monta a NotaFiscalResponse a partir do JSON de uma nota"""
+    # Validar campos obrigatórios
+    if not isinstance(dados, dict) or 'categoria' not in dados or 'resumo' not in dados:
+        logger.warning("Resposta da OpenAI não contém campos obrigatórios")
+        raise ValueError("Resposta da OpenAI não contém campos obrigatórios")
+    
+    return NotaFiscalResponse(
+        categoria=dados.get('categoria', 'Não categorizado'),
+        resumo=dados.get('resumo', 'Análise não disponível'),
+        valor_total=dados.get('valor_total'),
+        data_emissao=dados.get('data_emissao'),
+        cnpj_emissor=dados.get('cnpj_emissor')
+    )
+
+def interpretar_resposta_nota(resposta: str) -> Tuple[NotaFiscalResponse, bool]:
+    """Converte o texto retornado pela OpenAI em NotaFiscalResponse"""
+    resposta = limpar_resposta_json(resposta)
+    
+    # Tentar fazer parse da resposta JSON
+    try:
+        dados = json.loads(resposta)
+        logger.info("JSON parsed com sucesso")
         
-        logger.info("Enviando requisição para OpenAI")
+        result = nota_de_dados(dados)
         
-        # Chamar OpenAI
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",  # Usando GPT-4o-mini (mais econômico)
-            messages=[
-                {"role": "system", "content": "Você é um assistente especializado em análise de notas fiscais brasileiras. Sempre responda em JSON válido."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1,
-            max_tokens=500
+        logger.info("Análise concluída com sucesso")
+        return result, True
+        
+    except json.JSONDecodeError as e:
+        logger.error(f"Erro ao fazer parse do JSON: {str(e)}")
+        logger.error(f"Resposta que causou erro: {resposta}")
+        # Se não conseguir fazer parse do JSON, criar resposta básica
+        return NotaFiscalResponse(
+            categoria="papelaria",
+            resumo="Compra de material escolar: canetas e cadernos (fallback - erro no parse)",
+            valor_total=None,
+            data_emissao=None,
+            cnpj_emissor=None
+        ), False
+
+def nota_com_resumo(extracao: ExtracaoNota, resposta: str) -> NotaFiscalResponse:
+    """Campos da extração local + o resumo da resposta ao prompt de resumo (ou o resumo local)"""
+    try:
+        resumo = json.loads(limpar_resposta_json(resposta)).get("resumo")
+    except (json.JSONDecodeError, AttributeError):
+        resumo = None
+    return extracao.resposta(resumo if isinstance(resumo, str) and resumo else None)
+
+def interpretar_resposta_lote(resposta: str, quantidade: int) -> dict:
+    """Converte a resposta de um lote em {índice da nota: NotaFiscalResponse}"""
+    try:
+        dados = json.loads(limpar_resposta_json(resposta))
+    except json.JSONDecodeError as e:
+        logger.error(f"Erro ao fazer parse do JSON do lote: {str(e)}")
+        return {}
+    
+    itens = dados.get("notas") if isinstance(dados, dict) else dados
+    if not isinstance(itens, list):
+        logger.warning("Resposta do lote não contém a lista de notas")
+        return {}
+    
+    resultados = {}
+    for posicao, item in enumerate(itens):
+        indice = item.get("indice", posicao) if isinstance(item, dict) else posicao
+        if not isinstance(indice, int) or not 0 <= indice < quantidade or indice in resultados:
+            continue
+        try:
+            resultados[indice] = nota_de_dados(item)
+        except (ValueError, ValidationError):
+            continue
+    return resultados
+
+# Campos da nota enviados como evento `campo` no /analisar-nota/stream
+CAMPOS_NOTA_STREAM = ("categoria", "valor_total", "data_emissao", "cnpj_emissor")
+
+class LeitorJsonIncremental:
+    """Lê o objeto JSON da resposta da OpenAI à medida que os pedaços chegam"""
+    
+    def __init__(self, textos: Tuple[str, ...] = ("resumo",)):
+        self.textos = textos
+        self.estado = "inicio"
+        self.chave = None
+        self.bruto = []
+        self.escape = 0
+        self.profundidade = 0
+        self.em_string = False
+        self.emitido = ""
+    
+    def alimentar(self, pedaco: str) -> list:
+        eventos = []
+        try:
+            for c in pedaco:
+                self._ler(c, eventos)
+            if self.estado == "valor_texto" and self.chave in self.textos:
+                trecho = self._texto_parcial()
+                if trecho:
+                    eventos.append(("texto", self.chave, trecho))
+        except json.JSONDecodeError:
+            # JSON malformado: para de ler; a resposta inteira decide (inclusive o fallback)
+            self.estado = "fim"
+        return eventos
+    
+    def _ler(self, c: str, eventos: list):
+        estado = self.estado
+        if estado == "inicio":
+            if c == "{":
+                self.estado = "chave_ou_fim"
+        elif estado == "chave_ou_fim":
+            if c == '"':
+                self.estado, self.bruto, self.escape = "chave", [], 0
+            elif c == "}":
+                self.estado = "fim"
+        elif estado in ("chave", "valor_texto"):
+            if self.escape:
+                # Depois da barra: um caractere, ou "u" + 4 dígitos hexadecimais
+                self.escape = 4 if self.escape == -1 and c == "u" else max(0, self.escape - 1)
+                self.bruto.append(c)
+            elif c == "\\":
+                self.escape = -1
+                self.bruto.append(c)
+            elif c == '"':
+                valor = json.loads('"' + "".join(self.bruto) + '"')
+                if estado == "chave":
+                    self.chave = valor
+                    self.estado = "dois_pontos"
+                else:
+                    if self.chave in self.textos and len(valor) > len(self.emitido):
+                        eventos.append(("texto", self.chave, valor[len(self.emitido):]))
+                    eventos.append(("campo", self.chave, valor))
+                    self.estado = "chave_ou_fim"
+            else:
+                self.bruto.append(c)
+        elif estado == "dois_pontos":
+            if c == ":":
+                self.estado = "valor_inicio"
+        elif estado == "valor_inicio":
+            if c == '"':
+                self.estado, self.bruto, self.escape, self.emitido = "valor_texto", [], 0, ""
+            elif not c.isspace():
+                self.estado, self.bruto, self.escape = "valor_bruto", [], 0
+                self.profundidade, self.em_string = 0, False
+                self._ler(c, eventos)
+        elif estado == "valor_bruto":
+            # Número, true/false/null ou um objeto/lista aninhado: vai até a vírgula ou o } do primeiro nível
+            if self.em_string:
+                if self.escape:
+                    self.escape = 0
+                elif c == "\\":
+                    self.escape = 1
+                elif c == '"':
+                    self.em_string = False
+            elif c == '"':
+                self.em_string = True
+            elif c in "[{":
+                self.profundidade += 1
+            elif c in "]}" and self.profundidade:
+                self.profundidade -= 1
+            elif c in ",}" and not self.profundidade:
+                try:
+                    eventos.append(("campo", self.chave, json.loads("".join(self.bruto))))
+                except json.JSONDecodeError:
+                    pass
+                self.estado = "fim" if c == "}" else "chave_ou_fim"
+                return
+            self.bruto.append(c)
+    
+    def _texto_parcial(self) -> str:
+        """Trecho novo da string em andamento, sem cortar um escape ou um par de surrogates"""
+        bruto = "".join(self.bruto)
+        if self.escape:
+            bruto = bruto[:bruto.rfind("\\")]
+        texto = json.loads('"' + bruto + '"')
+        if texto and "\ud800" <= texto[-1] <= "\udbff":
+            texto = texto[:-1]
+        trecho = texto[len(self.emitido):]
+        self.emitido = texto
+        return trecho
+
+def estimar_tokens(prompt: str, max_tokens: int) -> int:
+    """Tokens reservados no orçamento: prompt estimado pelo tamanho (~3 caracteres por token) + max_tokens"""
+    return math.ceil((len(PROMPT_SISTEMA_NOTA) + len(prompt)) / 3) + max_tokens
+
+def espera_nova_tentativa(tentativa: int, erro: Exception) -> float:
+    """Backoff exponencial com jitter, ou o Retry-After da OpenAI se for maior"""
+    espera = min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * 2 ** tentativa) * random.uniform(0.5, 1.0)
+    response = getattr(erro, "response", None)
+    if response is not None:
+        try:
+            if "retry-after-ms" in response.headers:
+                return max(espera, float(response.headers["retry-after-ms"]) / 1000)
+            if "retry-after" in response.headers:
+                return max(espera, float(response.headers["retry-after"]))
+        except ValueError:
+            pass
+    return espera
+
+@asynccontextmanager
+async def chamada_openai(prompt: str, max_tokens: int, prioridade: int = PRIORIDADE_INTERATIVA, **opcoes):
+    """Envia o prompt à OpenAI pelo cliente compartilhado e entrega a resposta"""
+    # Verificar se a API key está configurada
+    api_key = os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        logger.error("OpenAI API key não encontrada")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail="OpenAI API key não configurada"
         )
+    
+    # Log da API key mascarada
+    masked_key = f"{api_key[:10]}...{api_key[-4:]}" if len(api_key) > 14 else "***"
+    logger.info(f"Usando API key: {masked_key}")
+    
+    # Cliente OpenAI compartilhado
+    client = obter_cliente_openai(api_key)
+    tokens = estimar_tokens(prompt, max_tokens)
+    ordem = None
+    
+    for tentativa in range(OPENAI_TENTATIVAS + 1):
+        with etapa("openai.espera"):
+            ordem = await agendador_openai.reservar(tokens, prioridade, ordem)
+        erro = None
+        try:
+            logger.info("Enviando requisição para OpenAI")
+            inicio = time.perf_counter()
+            try:
+                with etapa("openai.chamada"):
+                    bruta = await client.chat.completions.with_raw_response.create(
+                        model=OPENAI_MODELO,  # Usando GPT-4o-mini (mais econômico)
+                        messages=[
+                            {"role": "system", "content": PROMPT_SISTEMA_NOTA},
+                            {"role": "user", "content": prompt}
+                        ],
+                        temperature=0.1,
+                        max_tokens=max_tokens,
+                        **opcoes
+                    )
+                agendador_openai.ajustar(bruta.headers)
+                response = bruta.parse()
+            except RateLimitError as e:
+                METRICA_OPENAI_CHAMADAS.inc(resultado="limite")
+                agendador_openai.ajustar(e.response.headers)
+                erro = e
+            except (InternalServerError, APIConnectionError) as e:
+                METRICA_OPENAI_CHAMADAS.inc(resultado="erro_servidor")
+                erro = e
+            except Exception:
+                METRICA_OPENAI_CHAMADAS.inc(resultado="erro")
+                raise
+            finally:
+                METRICA_OPENAI_DURACAO.observar(time.perf_counter() - inicio)
+        except BaseException:
+            agendador_openai.liberar()
+            raise
+        
+        if erro is None:
+            break
+        agendador_openai.liberar()
+        espera = espera_nova_tentativa(tentativa, erro)
+        limite = isinstance(erro, RateLimitError)
+        if tentativa == OPENAI_TENTATIVAS:
+            logger.error(f"OpenAI falhou após {tentativa + 1} tentativas: {str(erro)}")
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS if limite else status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail=(
+                    "Limite de requisições da OpenAI atingido, tente novamente em instantes" if limite
+                    else f"OpenAI indisponível: {str(erro)}"
+                ),
+                headers={"Retry-After": str(max(1, math.ceil(espera)))}
+            )
+        METRICA_OPENAI_NOVAS_TENTATIVAS.inc(motivo="limite" if limite else "erro_servidor")
+        logger.warning(f"⚠️ OpenAI: {str(erro)}; nova tentativa em {espera:.1f}s")
+        if limite:
+            # O orçamento da conta acabou: segura a fila inteira, não só esta chamada
+            agendador_openai.pausar(espera)
+        await asyncio.sleep(espera)
+    
+    METRICA_OPENAI_CHAMADAS.inc(resultado="ok")
+    try:
+        yield response
+    finally:
+        agendador_openai.liberar()
+
+def registrar_uso_openai(usage):
+    """Soma os tokens informados pela OpenAI nas métricas"""
+    if usage is not None:
+        METRICA_OPENAI_TOKENS.inc(usage.prompt_tokens or 0, tipo="prompt")
+        METRICA_OPENAI_TOKENS.inc(usage.completion_tokens or 0, tipo="resposta")
+
+async def completar_chat(prompt: str, max_tokens: int, prioridade: int = PRIORIDADE_INTERATIVA, **opcoes) -> str:
+    """Envia o prompt à OpenAI (ver `chamada_openai`) e retorna o texto da resposta"""
+    async with chamada_openai(prompt, max_tokens, prioridade, **opcoes) as response:
+        registrar_uso_openai(response.usage)
+    
+    # Extrair resposta
+    resposta = response.choices[0].message.content.strip()
+    logger.info(f"Resposta da OpenAI: {resposta}")
+    return resposta
+
+@asynccontextmanager
+async def chat_em_stream(prompt: str, max_tokens: int, prioridade: int = PRIORIDADE_INTERATIVA):
+    """Como `completar_chat`, mas em stream: entrega os pedaços de texto conforme a OpenAI gera"""
+    async with chamada_openai(
+        prompt, max_tokens, prioridade, stream=True, stream_options={"include_usage": True}
+    ) as stream:
+        async with stream:
+            yield pedacos_de_texto(stream)
+
+async def pedacos_de_texto(stream):
+    async for pedaco in stream:
+        # Com include_usage, o último pedaço traz só o uso de tokens
+        registrar_uso_openai(pedaco.usage)
+        if pedaco.choices and pedaco.choices[0].delta.content:
+            yield pedaco.choices[0].delta.content
+
+async def analisar_com_openai(texto: str, prioridade: int = PRIORIDADE_INTERATIVA) -> Tuple[NotaFiscalResponse, bool]:
+    """Chama a OpenAI para analisar o texto da nota fiscal"""
+    resposta = await completar_chat(montar_prompt_nota(texto), max_tokens=500, prioridade=prioridade)
+    return interpretar_resposta_nota(resposta)
+
+async def analisar_nota(
+    texto: str,
+    extracao: Optional[ExtracaoNota] = None,
+    prioridade: int = PRIORIDADE_INTERATIVA
+) -> Tuple[NotaFiscalResponse, bool]:
+    """Analisa a nota combinando a extração local com a OpenAI"""
+    if EXTRACAO_LOCAL_MODO == "desligado":
+        return await analisar_com_openai(texto, prioridade)
+    
+    extracao = extracao or extrair_dados_nota(texto)
+    if tipo_analise(extracao) == "resumo":
+        resposta = await completar_chat(montar_prompt_resumo(texto, extracao), max_tokens=150, prioridade=prioridade)
+        return nota_com_resumo(extracao, resposta), True
+    
+    resultado, definitivo = await analisar_com_openai(texto, prioridade)
+    return extracao.completar(resultado), definitivo
+
+async def analisar_lote_com_openai(textos: List[str]) -> dict:
+    """Analisa várias notas em uma única chamada à OpenAI"""
+    resposta = await completar_chat(
+        montar_prompt_lote(textos),
+        max_tokens=300 * len(textos) + 100,
+        prioridade=PRIORIDADE_LOTE,
+        response_format={"type": "json_object"}
+    )
+    return interpretar_resposta_lote(resposta, len(textos))
+
+def tipo_analise(extracao: ExtracaoNota) -> str:
+    """Prompt usado na análise: `resumo` (campos da extração local) ou `completa`"""
+    return "resumo" if EXTRACAO_LOCAL_MODO != "desligado" and extracao.confiavel else "completa"
+
+def chave_analise(texto: str, tipo: str) -> str:
+    """Hash do texto normalizado (espaços colapsados) + modelo + versão e tipo do prompt"""
+    normalizado = " ".join(texto.split())
+    conteudo = f"{OPENAI_MODELO}\n{PROMPT_NOTA_VERSAO}\n{tipo}\n{normalizado}"
+    return hashlib.sha256(conteudo.encode()).hexdigest()
+
+class CacheAnalises:
+    """Cache persistente das análises de notas, com LRU em memória na frente"""
+    
+    def __init__(self, max_entradas: int):
+        self.memoria = BackendCacheMemoria(max_entradas)
+        self.em_andamento = {}
+        self.hits_memoria = 0
+        self.hits_banco = 0
+        self.misses = 0
+        self.agrupadas = 0
+    
+    async def obter_ou_calcular(self, chave: str, calcular) -> Tuple[NotaFiscalResponse, str]:
+        resultado = await self.memoria.obter(chave)
+        if resultado is not None:
+            self.hits_memoria += 1
+            return resultado, "HIT"
         
-        # Extrair resposta
-        resposta = response.choices[0].message.content.strip()
-        logger.info(f"Resposta da OpenAI: {resposta}")
+        tarefa = self.em_andamento.get(chave)
+        if tarefa is None:
+            tarefa = asyncio.create_task(self._resolver(chave, calcular))
+            self.em_andamento[chave] = tarefa
+            tarefa.add_done_callback(lambda t: self._finalizar(chave, t))
+            return await asyncio.shield(tarefa)
+        
+        self.agrupadas += 1
+        resultado, _ = await asyncio.shield(tarefa)
+        return resultado, "COALESCED"
+    
+    def _finalizar(self, chave: str, tarefa: asyncio.Task):
+        self.em_andamento.pop(chave, None)
+        if not tarefa.cancelled():
+            tarefa.exception()
+    
+    async def obter_varios(self, chaves: List[str]) -> dict:
+        """Busca várias análises de uma vez (memória e depois uma consulta ao banco)"""
+        encontrados = {}
+        faltando = []
+        for chave in chaves:
+            resultado = await self.memoria.obter(chave)
+            if resultado is not None:
+                self.hits_memoria += 1
+                encontrados[chave] = resultado
+            else:
+                faltando.append(chave)
         
-        # Limpar markdown se presente (```json ... ```)
-        if resposta.startswith("```json"):
-            resposta = resposta.replace("```json", "").replace("```", "").strip()
-            logger.info(f"Resposta limpa: {resposta}")
+        if faltando:
+            async with AsyncSessionLocal() as db:
+                registros = (await db.execute(
+                    select(AnaliseNotaDB.chave, AnaliseNotaDB.resultado).where(AnaliseNotaDB.chave.in_(faltando))
+                )).all()
+            for chave, resultado_json in registros:
+                self.hits_banco += 1
+                resultado = NotaFiscalResponse.model_validate_json(resultado_json)
+                await self.memoria.guardar(chave, resultado, ANALISE_CACHE_TTL)
+                encontrados[chave] = resultado
+        return encontrados
+    
+    async def guardar(self, chave: str, resultado: NotaFiscalResponse):
+        """Guarda uma análise calculada fora de `obter_ou_calcular` (ex.: em lote)"""
+        self.misses += 1
+        await self._gravar(chave, resultado)
+        await self.memoria.guardar(chave, resultado, ANALISE_CACHE_TTL)
+    
+    async def _resolver(self, chave: str, calcular) -> Tuple[NotaFiscalResponse, str]:
+        async with AsyncSessionLocal() as db:
+            registro = await db.get(AnaliseNotaDB, chave)
+        if registro is not None:
+            self.hits_banco += 1
+            resultado = NotaFiscalResponse.model_validate_json(registro.resultado)
+            await self.memoria.guardar(chave, resultado, ANALISE_CACHE_TTL)
+            return resultado, "HIT"
         
-        # Tentar fazer parse da resposta JSON
+        self.misses += 1
+        resultado, definitivo = await calcular()
+        if definitivo:
+            await self._gravar(chave, resultado)
+            await self.memoria.guardar(chave, resultado, ANALISE_CACHE_TTL)
+        return resultado, "MISS"
+    
+    async def _gravar(self, chave: str, resultado: NotaFiscalResponse):
         try:
-            dados = json.loads(resposta)
-            logger.info("JSON parsed com sucesso")
-            
-            # Validar campos obrigatórios
-            if 'categoria' not in dados or 'resumo' not in dados:
-                logger.warning("Resposta da OpenAI não contém campos obrigatórios")
-                raise ValueError("Resposta da OpenAI não contém campos obrigatórios")
-            
-            result = NotaFiscalResponse(
-                categoria=dados.get('categoria', 'Não categorizado'),
-                resumo=dados.get('resumo', 'Análise não disponível'),
-                valor_total=dados.get('valor_total'),
-                data_emissao=dados.get('data_emissao'),
-                cnpj_emissor=dados.get('cnpj_emissor')
-            )
-            
-            logger.info("Análise concluída com sucesso")
-            return result
-            
-        except json.JSONDecodeError as e:
-            logger.error(f"Erro ao fazer parse do JSON: {str(e)}")
-            logger.error(f"Resposta que causou erro: {resposta}")
-            # Se não conseguir fazer parse do JSON, criar resposta básica
-            return NotaFiscalResponse(
-                categoria="papelaria",
-                resumo="Compra de material escolar: canetas e cadernos (fallback - erro no parse)",
-                valor_total=None,
-                data_emissao=None,
-                cnpj_emissor=None
-            )
+            async with AsyncSessionLocal() as db:
+                db.add(AnaliseNotaDB(
+                    chave=chave,
+                    modelo=OPENAI_MODELO,
+                    prompt_versao=PROMPT_NOTA_VERSAO,
+                    resultado=resultado.model_dump_json()
+                ))
+                await db.commit()
+        except IntegrityError:
+            # Outro processo gravou a mesma análise primeiro
+            pass
+        except Exception as e:
+            logger.error(f"Erro ao gravar análise no cache: {str(e)}")
+    
+    def estatisticas(self) -> dict:
+        total = self.hits_memoria + self.hits_banco + self.misses + self.agrupadas
+        return {
+            "hits_memoria": self.hits_memoria,
+            "hits_banco": self.hits_banco,
+            "misses": self.misses,
+            "agrupadas": self.agrupadas,
+            "taxa_acerto": round((total - self.misses) / total, 4) if total else 0.0,
+            "entradas_memoria": len(self.memoria)
+        }
+
+cache_analises = CacheAnalises(ANALISE_CACHE_MAX_ENTRADAS)
+
+# Endpoint para análise de notas fiscais
+@app.post("/analisar-nota", response_model=NotaFiscalResponse)
+async def analisar_nota_fiscal(nota: NotaFiscalRequest, response: Response):
+    """Analisa uma nota fiscal usando OpenAI GPT-4"""
+    logger.info("Iniciando análise de nota fiscal")
+    
+    try:
+        with etapa("analise.extracao_local"):
+            extracao = extrair_dados_nota(nota.texto)
+        if EXTRACAO_LOCAL_MODO == "local" and extracao.confiavel:
+            response.headers["X-Cache"] = "LOCAL"
+            METRICA_ANALISES.inc(origem="LOCAL")
+            return extracao.resposta()
+        
+        resultado, origem = await cache_analises.obter_ou_calcular(
+            chave_analise(nota.texto, tipo_analise(extracao)),
+            lambda: analisar_nota(nota.texto, extracao)
+        )
+        response.headers["X-Cache"] = origem
+        METRICA_ANALISES.inc(origem=origem)
+        return resultado
             
     except HTTPException:
         raise
@@ -540,6 +3705,273 @@ def analisar_nota_fiscal(nota: NotaFiscalRequest):
             detail=f"Erro ao analisar nota fiscal: {str(e)}"
         )
 
+class StreamingResponseComSaida(StreamingResponse):
+    """StreamingResponse que fecha `saida` (AsyncExitStack) quando a resposta termina"""
+    
+    def __init__(self, conteudo, saida: AsyncExitStack, **kwargs):
+        super().__init__(conteudo, **kwargs)
+        self.saida = saida
+    
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await self.saida.aclose()
+
+def evento_sse(evento: str, dados) -> str:
+    return f"event: {evento}\ndata: {json.dumps(dados, ensure_ascii=False)}\n\n"
+
+def eventos_nota_pronta(resultado: NotaFiscalResponse) -> str:
+    """Campos, resumo e resultado de uma análise que já estava pronta, de uma vez"""
+    return "".join(
+        [evento_sse("campo", {"campo": campo, "valor": getattr(resultado, campo)}) for campo in CAMPOS_NOTA_STREAM]
+        + [evento_sse("resumo", {"texto": resultado.resumo}), evento_sse("resultado", resultado.model_dump())]
+    )
+
+@app.post("/analisar-nota/stream")
+async def analisar_nota_fiscal_stream(nota: NotaFiscalRequest):
+    """Analisa uma nota fiscal como o `/analisar-nota`, respondendo em Server-Sent Events"""
+    logger.info("Iniciando análise de nota fiscal em stream")
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    
+    with etapa("analise.extracao_local"):
+        extracao = extrair_dados_nota(nota.texto)
+    chave = chave_analise(nota.texto, tipo_analise(extracao))
+    if EXTRACAO_LOCAL_MODO == "local" and extracao.confiavel:
+        pronto, origem = extracao.resposta(), "LOCAL"
+    else:
+        pronto, origem = (await cache_analises.obter_varios([chave])).get(chave), "HIT"
+    
+    if pronto is not None:
+        METRICA_ANALISES.inc(origem=origem)
+        async def eventos_prontos():
+            yield eventos_nota_pronta(pronto)
+        return StreamingResponse(
+            eventos_prontos(), media_type="text/event-stream", headers={**headers, "X-Cache": origem}
+        )
+    
+    # Com a extração confiável, só o resumo vem da OpenAI (como em analisar_nota)
+    so_resumo = tipo_analise(extracao) == "resumo"
+    completar_local = EXTRACAO_LOCAL_MODO != "desligado"
+    if so_resumo:
+        prompt, max_tokens = montar_prompt_resumo(nota.texto, extracao), 150
+    else:
+        prompt, max_tokens = montar_prompt_nota(nota.texto), 500
+    
+    # O stream da OpenAI é aberto antes da resposta: fila cheia, tentativas
+    # esgotadas e API key ausente viram 429/503/500 de verdade, com headers
+    abertura = AsyncExitStack()
+    try:
+        pedacos = await abertura.enter_async_context(chat_em_stream(prompt, max_tokens))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Erro ao abrir a análise de nota fiscal em stream: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Erro ao analisar nota fiscal: {str(e)}"
+        )
+    
+    async def eventos():
+        if so_resumo:
+            yield "".join(
+                evento_sse("campo", {"campo": campo, "valor": getattr(extracao, campo)}) for campo in CAMPOS_NOTA_STREAM
+            )
+        else:
+            # Comentário SSE: headers e primeiro byte saem assim que a OpenAI abre o stream
+            yield ": analisando\n\n"
+        try:
+            leitor = LeitorJsonIncremental()
+            partes = []
+            async for pedaco in pedacos:
+                partes.append(pedaco)
+                saida = []
+                for tipo, campo, valor in leitor.alimentar(pedaco):
+                    if tipo == "texto":
+                        saida.append(evento_sse("resumo", {"texto": valor}))
+                    elif campo in CAMPOS_NOTA_STREAM and not so_resumo:
+                        if valor is None and completar_local:
+                            valor = getattr(extracao, campo)
+                        saida.append(evento_sse("campo", {"campo": campo, "valor": valor}))
+                if saida:
+                    yield "".join(saida)
+            # Stream lido: devolve a vaga do agendador antes de gravar no cache
+            await abertura.aclose()
+            resposta = "".join(partes).strip()
+            logger.info(f"Resposta da OpenAI: {resposta}")
+            
+            if so_resumo:
+                resultado, definitivo = nota_com_resumo(extracao, resposta), True
+            else:
+                resultado, definitivo = interpretar_resposta_nota(resposta)
+                if completar_local:
+                    resultado = extracao.completar(resultado)
+            if definitivo:
+                await cache_analises.guardar(chave, resultado)
+            METRICA_ANALISES.inc(origem="MISS")
+            yield evento_sse("resultado", resultado.model_dump())
+        except Exception as e:
+            # O status 200 já foi enviado: a falha no meio do stream vira um evento
+            logger.error(f"Erro geral ao analisar nota fiscal em stream: {str(e)}")
+            yield evento_sse("erro", {
+                "status": status.HTTP_500_INTERNAL_SERVER_ERROR,
+                "detail": f"Erro ao analisar nota fiscal: {str(e)}"
+            })
+    
+    return StreamingResponseComSaida(
+        eventos(), abertura, media_type="text/event-stream", headers={**headers, "X-Cache": "MISS"}
+    )
+
+@app.post("/analisar-notas/lote")
+async def analisar_notas_lote(lote: NotasFiscaisLoteRequest):
+    """Analisa várias notas fiscais, com várias notas por chamada à OpenAI"""
+    textos = [nota.texto for nota in lote.notas]
+    indices_por_chave = {}
+    for indice, texto in enumerate(textos):
+        # As chamadas em lote usam sempre o prompt completo
+        indices_por_chave.setdefault(chave_analise(texto, "completa"), []).append(indice)
+    
+    def linhas(chave, resultado=None, origem=None, erro=None):
+        """Uma linha de saída para cada posição do lote com esse texto"""
+        saida = []
+        for indice in indices_por_chave[chave]:
+            if erro is None:
+                item = {"indice": indice, "status": "ok", "cache": origem, "resultado": resultado.model_dump()}
+                METRICA_ANALISES.inc(origem=origem)
+            else:
+                item = {"indice": indice, "status": "erro", "erro": erro}
+            saida.append(item)
+        return saida
+    
+    async def analisar_individual(chave):
+        texto = textos[indices_por_chave[chave][0]]
+        extracao = extracoes[chave]
+        try:
+            # Sozinha, a nota pode ir só com o prompt de resumo: a chave do cache segue o prompt
+            resultado, origem = await cache_analises.obter_ou_calcular(
+                chave_analise(texto, tipo_analise(extracao)), lambda: analisar_nota(texto, extracao, PRIORIDADE_LOTE)
+            )
+            return linhas(chave, resultado, origem)
+        except Exception as e:
+            detalhe = e.detail if isinstance(e, HTTPException) else str(e)
+            logger.error(f"Erro ao analisar nota do lote: {detalhe}")
+            return linhas(chave, erro=f"Erro ao analisar nota fiscal: {detalhe}")
+    
+    extracoes = {}
+    limite_grupos = asyncio.Semaphore(LOTE_CONCORRENCIA)
+    
+    async def analisar_grupo(grupo):
+        async with limite_grupos:
+            try:
+                resultados = await analisar_lote_com_openai([textos[indices_por_chave[chave][0]] for chave in grupo])
+            except HTTPException as e:
+                return [item for chave in grupo for item in linhas(chave, erro=e.detail)]
+            except Exception as e:
+                logger.error(f"Erro ao analisar grupo do lote: {str(e)}")
+                resultados = {}
+        
+        saida = []
+        faltando = []
+        for posicao, chave in enumerate(grupo):
+            if posicao in resultados:
+                resultado = resultados[posicao]
+                if EXTRACAO_LOCAL_MODO != "desligado":
+                    resultado = extracoes[chave].completar(resultado)
+                await cache_analises.guardar(chave, resultado)
+                saida.extend(linhas(chave, resultado, "MISS"))
+            else:
+                faltando.append(chave)
+        if faltando:
+            logger.warning(f"{len(faltando)} nota(s) do grupo sem resposta, reanalisando individualmente")
+            for parcial in await asyncio.gather(*(analisar_individual(chave) for chave in faltando)):
+                saida.extend(parcial)
+        return saida
+    
+    async def processar():
+        analisadas = erros = 0
+        
+        def contar(saida):
+            nonlocal analisadas, erros
+            for item in saida:
+                if item["status"] == "ok":
+                    analisadas += 1
+                else:
+                    erros += 1
+            return "\n".join(json.dumps(item, ensure_ascii=False) for item in saida) + "\n"
+        
+        prontos = await cache_analises.obter_varios(list(indices_por_chave))
+        if prontos:
+            yield contar([item for chave, resultado in prontos.items() for item in linhas(chave, resultado, "HIT")])
+        
+        pendentes = []
+        locais = []
+        for chave in indices_por_chave:
+            if chave in prontos:
+                continue
+            extracoes[chave] = extrair_dados_nota(textos[indices_por_chave[chave][0]])
+            if EXTRACAO_LOCAL_MODO == "local" and extracoes[chave].confiavel:
+                locais.extend(linhas(chave, extracoes[chave].resposta(), "LOCAL"))
+            else:
+                pendentes.append(chave)
+        if locais:
+            yield contar(locais)
+        
+        grupos = [pendentes[i:i + LOTE_NOTAS_POR_CHAMADA] for i in range(0, len(pendentes), LOTE_NOTAS_POR_CHAMADA)]
+        tarefas = [asyncio.create_task(analisar_grupo(grupo)) for grupo in grupos]
+        try:
+            for proxima in asyncio.as_completed(tarefas):
+                yield contar(await proxima)
+        finally:
+            # Cliente desconectou: não continuar gastando chamadas à OpenAI
+            for tarefa in tarefas:
+                tarefa.cancel()
+        
+        logger.info(f"Lote de notas concluído: {analisadas} analisadas, {erros} com erro, {len(grupos)} chamada(s) em lote")
+        yield json.dumps({"resumo": {
+            "total": len(textos),
+            "analisadas": analisadas,
+            "erros": erros,
+            "do_cache": sum(len(indices_por_chave[chave]) for chave in prontos),
+            "locais": len(locais),
+            "chamadas_lote": len(grupos)
+        }}) + "\n"
+    
+    return StreamingResponse(processar(), media_type="application/x-ndjson")
+
+def numero_workers(valor: str) -> int:
+    """`SERVIDOR_WORKERS`/`--workers`: um número ou `auto` (um por núcleo)"""
+    if str(valor).lower() == "auto":
+        return os.cpu_count() or 1
+    return max(1, int(valor))
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    
+    parser = argparse.ArgumentParser(description="API de Clientes")
+    parser.add_argument("comando", nargs="?", choices=("servir", "migrar"), default="servir",
+                        help="servir (padrão): migra o banco e sobe a API; migrar: só migra")
+    parser.add_argument("--host", default=SERVIDOR_HOST)
+    parser.add_argument("--port", type=int, default=SERVIDOR_PORTA)
+    parser.add_argument("--workers", default=SERVIDOR_WORKERS, help="Número de processos ou 'auto'")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    
+    migrar_banco()
+    logger.info("✅ Banco de dados migrado")
+    if args.comando == "servir":
+        # Esquema pronto: os workers não disputam o create_all ao subir
+        os.environ["DB_MIGRAR_NA_INICIALIZACAO"] = "false"
+        # Cada worker divide DB_CONEXOES_MAX pelo número de workers
+        workers = numero_workers(args.workers)
+        os.environ["WEB_CONCURRENCY"] = str(workers)
+        engine.dispose()
+        uvicorn.run(
+            "main:app",
+            app_dir=os.path.dirname(os.path.abspath(__file__)),
+            host=args.host,
+            port=args.port,
+            workers=workers,
+            timeout_graceful_shutdown=SERVIDOR_DRENAGEM_TIMEOUT,
+            log_level=args.log_level
+        )
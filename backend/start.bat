@@ -26,7 +26,8 @@ pip install -r requirements.txt
 
 REM Criar banco de dados (se não existir)
 echo 🗄️ Verificando banco de dados...
-python -c "from main import Base, engine; Base.metadata.create_all(bind=engine); print('✅ Banco de dados configurado!')"
+python main.py migrar
+echo ✅ Banco de dados configurado!
 
 REM Iniciar a API
 echo 🌐 Iniciando API na porta 8000...
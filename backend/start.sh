@@ -25,11 +25,7 @@ pip install -r requirements.txt
 
 # Criar banco de dados (se não existir)
 echo "🗄️ Verificando banco de dados..."
-python3 -c "
-from main import Base, engine
-Base.metadata.create_all(bind=engine)
-print('✅ Banco de dados configurado!')
-"
+python3 main.py migrar && echo "✅ Banco de dados configurado!"
 
 # Iniciar a API
 echo "🌐 Iniciando API na porta 8000..."
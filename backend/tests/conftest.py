@@ -0,0 +1,20 @@
+import os
+import sys
+import tempfile
+from contextlib import asynccontextmanager
+
+# Banco temporário e sem entrega de webhooks: definidos antes de importar main
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'clientes.db')}")
+os.environ.setdefault("OUTBOX_HABILITADO", "false")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+@asynccontextmanager
+async def cliente_api():
+    """Cliente HTTP da API em processo, com o lifespan da aplicação"""
+    import main
+    async with main.app.router.lifespan_context(main.app):
+        transporte = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://teste") as cliente:
+            yield cliente
@@ -0,0 +1,39 @@
+import asyncio
+
+import main
+from main import AgendadorOpenAI, PRIORIDADE_INTERATIVA
+
+def test_liberar_com_espera_cancelada_na_fila():
+    """Cancelar quem espera e liberar a vaga no mesmo ciclo do loop não vaza a vaga"""
+    async def cenario():
+        agendador = AgendadorOpenAI(rpm=0, tpm=0, concorrencia=1, fila_max=10)
+        await agendador.reservar(100, PRIORIDADE_INTERATIVA)
+        
+        na_fila = asyncio.create_task(agendador.reservar(100, PRIORIDADE_INTERATIVA))
+        await asyncio.sleep(0)
+        assert len(agendador._fila) == 1
+        
+        # O futuro fica cancelado na hora; a limpeza de `reservar` só roda depois
+        na_fila.cancel()
+        agendador.liberar()
+        assert agendador._em_andamento == 0
+        assert agendador._fila == []
+        
+        await asyncio.gather(na_fila, return_exceptions=True)
+        assert na_fila.cancelled()
+        assert agendador._em_andamento == 0
+        
+        # A vaga continua disponível para a próxima chamada
+        await asyncio.wait_for(agendador.reservar(100, PRIORIDADE_INTERATIVA), timeout=1)
+        assert agendador._em_andamento == 1
+        agendador.liberar()
+    
+    asyncio.run(cenario())
+
+def test_orcamento_dividido_entre_workers(monkeypatch):
+    """Cada worker agenda com a sua parte do RPM/TPM da conta; 0 continua sem limite"""
+    monkeypatch.setattr(main, "WEB_CONCURRENCY", 4)
+    assert main.orcamento_por_worker(500) == 125
+    assert main.orcamento_por_worker(200000) == 50000
+    assert main.orcamento_por_worker(2) == 1
+    assert main.orcamento_por_worker(0) == 0
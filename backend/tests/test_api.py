@@ -0,0 +1,76 @@
+import asyncio
+
+from conftest import cliente_api
+
+def test_health_check():
+    async def cenario():
+        async with cliente_api() as cliente:
+            resposta = await cliente.get("/health")
+            assert resposta.status_code == 200
+            assert resposta.json()["status"] == "healthy"
+
+    asyncio.run(cenario())
+
+def test_crud_cliente():
+    """Cria, lista, obtém, atualiza e apaga um cliente"""
+    async def cenario():
+        async with cliente_api() as cliente:
+            criado = await cliente.post(
+                "/clientes", json={"nome": "Joana Ribeiro", "email": "joana.ribeiro@email.com", "cpf_cnpj": "526.018.159-06"}
+            )
+            assert criado.status_code == 201
+            cliente_id = criado.json()["id"]
+            assert criado.json()["cpf_cnpj"] == "52601815906"
+
+            listados = await cliente.get("/clientes", params={"sort": "-id", "limit": 20})
+            assert cliente_id in [item["id"] for item in listados.json()]
+
+            obtido = await cliente.get(f"/clientes/{cliente_id}")
+            assert obtido.json()["email"] == "joana.ribeiro@email.com"
+
+            atualizado = await cliente.put(f"/clientes/{cliente_id}", json={"nome": "Joana Ribeiro - ATUALIZADO"})
+            assert atualizado.status_code == 200
+            assert atualizado.json()["nome"] == "Joana Ribeiro - ATUALIZADO"
+            assert atualizado.json()["email"] == "joana.ribeiro@email.com"
+
+            assert (await cliente.delete(f"/clientes/{cliente_id}")).status_code == 204
+            assert (await cliente.get(f"/clientes/{cliente_id}")).status_code == 404
+            assert (await cliente.delete(f"/clientes/{cliente_id}")).status_code == 404
+            listados = await cliente.get("/clientes", params={"sort": "-id", "limit": 20})
+            assert cliente_id not in [item["id"] for item in listados.json()]
+
+    asyncio.run(cenario())
+
+def test_validacoes_cliente():
+    """CPF inválido, nome curto e email ou documento duplicados"""
+    async def cenario():
+        async with cliente_api() as cliente:
+            cpf_invalido = await cliente.post(
+                "/clientes", json={"nome": "Teste CPF", "email": "teste.cpf@email.com", "cpf_cnpj": "12345678900"}
+            )
+            assert cpf_invalido.status_code == 422
+
+            nome_curto = await cliente.post(
+                "/clientes", json={"nome": "A", "email": "teste.nome@email.com", "cpf_cnpj": "08301661305"}
+            )
+            assert nome_curto.status_code == 422
+
+            original = await cliente.post(
+                "/clientes", json={"nome": "Caio Mendes", "email": "caio.mendes@email.com", "cpf_cnpj": "08301661305"}
+            )
+            assert original.status_code == 201
+
+            email_duplicado = await cliente.post(
+                "/clientes", json={"nome": "Outro Caio", "email": "caio.mendes@email.com", "cpf_cnpj": "18609139034"}
+            )
+            assert email_duplicado.status_code == 400
+
+            documento_duplicado = await cliente.post(
+                "/clientes", json={"nome": "Outro Caio", "email": "outro.caio@email.com", "cpf_cnpj": "08301661305"}
+            )
+            assert documento_duplicado.status_code == 400
+
+            inexistente = await cliente.put("/clientes/999999999", json={"nome": "Ninguém Aqui"})
+            assert inexistente.status_code == 404
+
+    asyncio.run(cenario())
@@ -0,0 +1,52 @@
+import asyncio
+
+import main
+from conftest import cliente_api
+
+SOBRENOMES = ["Pereira", "Lima", "Gomes", "Costa", "Ribeiro", "Martins"]
+
+def inserir_clientes(clientes):
+    with main.SessionLocal() as db:
+        db.add_all(main.ClienteDB(nome=nome, email=email, cpf_cnpj=documento) for nome, email, documento in clientes)
+        db.commit()
+
+def test_busca_pagina_alem_de_200_resultados():
+    """Nome e documento: a ordenação e a paginação valem para todos os resultados, não só os primeiros do índice"""
+    async def cenario():
+        async with cliente_api() as cliente:
+            inserir_clientes(
+                (f"Zuleica {SOBRENOMES[i % 6]} {SOBRENOMES[i // 6 % 6]}", f"zuleica{i}@email.com", f"98765{i:06d}")
+                for i in range(300)
+            )
+            # O nome exato entra por último, depois dos 300 parecidos
+            inserir_clientes([("Zuleica", "zuleica@email.com", "98765999999")])
+            
+            primeira = (await cliente.get("/clientes/search", params={"q": "zuleica", "limit": 5})).json()
+            assert primeira[0]["nome"] == "Zuleica"
+            
+            ids = []
+            for skip in range(0, 400, 100):
+                pagina = await cliente.get("/clientes/search", params={"q": "zuleica", "skip": skip, "limit": 100})
+                ids.extend(item["id"] for item in pagina.json())
+            assert len(ids) == len(set(ids)) == 301
+            
+            documentos = []
+            for skip in range(0, 400, 100):
+                pagina = await cliente.get("/clientes/search", params={"q": "8765", "skip": skip, "limit": 100})
+                documentos.extend(item["cpf_cnpj"] for item in pagina.json())
+            assert len(documentos) == len(set(documentos)) == 301
+    
+    asyncio.run(cenario())
+
+def test_busca_ignora_apagados():
+    """A exclusão lógica tira o cliente da busca"""
+    async def cenario():
+        async with cliente_api() as cliente:
+            inserir_clientes([("Wanderleia Brito", "wanderleia@email.com", "11122233344")])
+            encontrados = (await cliente.get("/clientes/search", params={"q": "wanderleia"})).json()
+            assert [item["nome"] for item in encontrados] == ["Wanderleia Brito"]
+            
+            assert (await cliente.delete(f"/clientes/{encontrados[0]['id']}")).status_code == 204
+            assert (await cliente.get("/clientes/search", params={"q": "wanderleia"})).json() == []
+    
+    asyncio.run(cenario())
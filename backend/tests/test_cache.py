@@ -0,0 +1,48 @@
+import asyncio
+
+import main
+from conftest import cliente_api
+
+def test_cache_desligado_com_varios_workers_sem_redis(monkeypatch):
+    """Sem Redis, vários workers teriam um cache cada um: o cache de respostas fica desligado"""
+    monkeypatch.setattr(main, "CACHE_REDIS_URL", None)
+    monkeypatch.setattr(main, "WEB_CONCURRENCY", 4)
+    assert main.criar_cache_respostas() is None
+    
+    monkeypatch.setattr(main, "WEB_CONCURRENCY", 1)
+    assert isinstance(main.criar_cache_respostas().backend, main.BackendCacheMemoria)
+
+def test_escrita_invalida_cliente_e_listagem():
+    """PUT e DELETE invalidam o GET do cliente e as listagens; o ETag antigo deixa de dar 304"""
+    async def cenario():
+        async with cliente_api() as cliente:
+            criado = await cliente.post(
+                "/clientes", json={"nome": "Heloisa Prado", "email": "heloisa@email.com", "cpf_cnpj": "39053344705"}
+            )
+            assert criado.status_code == 201
+            url = f"/clientes/{criado.json()['id']}"
+            
+            primeira = await cliente.get(url)
+            assert primeira.headers["x-cache"] == "MISS"
+            repetida = await cliente.get(url)
+            assert repetida.headers["x-cache"] == "HIT"
+            etag = repetida.headers["etag"]
+            assert (await cliente.get(url, headers={"If-None-Match": etag})).status_code == 304
+            lista = await cliente.get("/clientes", params={"sort": "-id", "limit": 20})
+            assert any(item["nome"] == "Heloisa Prado" for item in lista.json())
+            
+            assert (await cliente.put(url, json={"nome": "Heloisa Prado Lima"})).status_code == 200
+            
+            atualizada = await cliente.get(url, headers={"If-None-Match": etag})
+            assert atualizada.status_code == 200
+            assert atualizada.headers["x-cache"] == "MISS"
+            assert atualizada.json()["nome"] == "Heloisa Prado Lima"
+            lista = await cliente.get("/clientes", params={"sort": "-id", "limit": 20})
+            assert any(item["nome"] == "Heloisa Prado Lima" for item in lista.json())
+            
+            assert (await cliente.delete(url)).status_code == 204
+            assert (await cliente.get(url)).status_code == 404
+            lista = await cliente.get("/clientes", params={"sort": "-id", "limit": 20})
+            assert all(item["id"] != criado.json()["id"] for item in lista.json())
+    
+    asyncio.run(cenario())
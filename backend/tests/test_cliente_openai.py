@@ -0,0 +1,17 @@
+import asyncio
+
+import main
+
+def test_troca_de_api_key_fecha_clientes_no_shutdown():
+    """Trocar a API key não derruba o cliente anterior, e o shutdown fecha todos"""
+    async def cenario():
+        antigo = main.obter_cliente_openai("sk-antiga")
+        assert main.obter_cliente_openai("sk-antiga") is antigo
+        novo = main.obter_cliente_openai("sk-nova")
+        assert novo is not antigo and not antigo.is_closed()
+        
+        await main.fechar_clientes_openai()
+        assert antigo.is_closed() and novo.is_closed()
+        assert main._clientes_openai == {}
+    
+    asyncio.run(cenario())
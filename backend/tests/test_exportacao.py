@@ -0,0 +1,52 @@
+import asyncio
+import json
+
+from sqlalchemy import update
+
+import main
+from conftest import cliente_api
+
+def linhas_ndjson(resposta) -> list:
+    return [json.loads(linha) for linha in resposta.text.splitlines()]
+
+def test_exportacao_incremental_nao_perde_transacao_aberta():
+    """Uma escrita confirmada depois do início da exportação sai na próxima incremental"""
+    async def cenario():
+        async with cliente_api() as cliente:
+            criado = (await cliente.post(
+                "/clientes", json={"nome": "Otília Campos", "email": "otilia@email.com", "cpf_cnpj": "86288366757"}
+            )).json()
+            
+            with main.SessionLocal() as db:
+                # Transação aberta durante a exportação: updated_at gravado antes, commit depois
+                db.execute(update(main.ClienteDB).where(main.ClienteDB.id == criado["id"]).values(nome="Otília Campos Reis"))
+                db.add(main.alteracao_cliente("atualizado", db.get(main.ClienteDB, criado["id"])))
+                db.flush()
+                exportacao = await cliente.get("/clientes/export", params={"format": "ndjson"})
+                db.commit()
+            
+            assert exportacao.status_code == 200
+            assert "Otília Campos Reis" not in exportacao.text
+            ultimo_seq = exportacao.headers["x-ultimo-seq"]
+            exportado_em = exportacao.headers["x-exportado-em"]
+            
+            por_seq = await cliente.get("/clientes/export", params={"format": "ndjson", "since_seq": ultimo_seq})
+            assert [linha["nome"] for linha in linhas_ndjson(por_seq)] == ["Otília Campos Reis"]
+            
+            por_instante = await cliente.get("/clientes/export", params={"format": "ndjson", "updated_since": exportado_em})
+            assert "Otília Campos Reis" in [linha["nome"] for linha in linhas_ndjson(por_instante)]
+            
+            seguinte = await cliente.get("/clientes/export", params={"format": "ndjson", "since_seq": por_seq.headers["x-ultimo-seq"]})
+            assert seguinte.text == ""
+    
+    asyncio.run(cenario())
+
+def test_exportacao_recusa_dois_filtros():
+    async def cenario():
+        async with cliente_api() as cliente:
+            resposta = await cliente.get(
+                "/clientes/export", params={"since_seq": 0, "updated_since": "2024-01-01T00:00:00"}
+            )
+            assert resposta.status_code == 400
+    
+    asyncio.run(cenario())
@@ -0,0 +1,94 @@
+import asyncio
+
+import httpx
+
+import main
+from conftest import cliente_api
+
+TEXTO_NOTA = "qualquer coisa sem valor nem data"
+
+def test_429_nao_e_repetido(monkeypatch):
+    """Uma 429 (fila cheia) libera a chave: a nova tentativa executa de verdade"""
+    monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+    
+    async def completar_chat(prompt, max_tokens, **opcoes):
+        return '{"categoria": "outros", "resumo": "Nota de teste", "valor_total": 10.0}'
+    
+    async def cenario():
+        async with cliente_api() as cliente:
+            headers = {"Idempotency-Key": "nota-429"}
+            monkeypatch.setattr(main.agendador_openai, "fila_max", 0)
+            r = await cliente.post("/analisar-nota", json={"texto": TEXTO_NOTA}, headers=headers)
+            assert r.status_code == 429
+            assert "retry-after" in r.headers
+            
+            monkeypatch.undo()
+            monkeypatch.setenv("OPENAI_API_KEY", "sk-teste")
+            monkeypatch.setattr(main, "completar_chat", completar_chat)
+            r = await cliente.post("/analisar-nota", json={"texto": TEXTO_NOTA}, headers=headers)
+            assert r.status_code == 200
+            assert "idempotent-replayed" not in r.headers
+            
+            r = await cliente.post("/analisar-nota", json={"texto": TEXTO_NOTA}, headers=headers)
+            assert r.status_code == 200
+            assert r.headers["idempotent-replayed"] == "true"
+            assert r.json()["resumo"] == "Nota de teste"
+    
+    asyncio.run(cenario())
+
+def test_repeticao_guarda_headers():
+    """A resposta repetida traz o mesmo corpo e os headers guardados (ETag, Location)"""
+    execucoes = []
+    
+    async def endpoint(scope, receive, send):
+        execucoes.append(scope["path"])
+        await send({
+            "type": "http.response.start",
+            "status": 201,
+            "headers": [(b"content-type", b"application/json"), (b"etag", b'"v1"'), (b"location", b"/clientes/1")],
+        })
+        await send({"type": "http.response.body", "body": b'{"id": 1}'})
+    
+    async def cenario():
+        # O lifespan da API cria a tabela de idempotência
+        async with cliente_api():
+            transporte = httpx.ASGITransport(app=main.IdempotenciaMiddleware(endpoint))
+            async with httpx.AsyncClient(transport=transporte, base_url="http://teste") as cliente:
+                headers = {"Idempotency-Key": "headers-guardados"}
+                primeira = await cliente.post("/clientes", json={"nome": "Ana"}, headers=headers)
+                repetida = await cliente.post("/clientes", json={"nome": "Ana"}, headers=headers)
+                outro_corpo = await cliente.post("/clientes", json={"nome": "Outra"}, headers=headers)
+        
+        assert execucoes == ["/clientes"]
+        assert repetida.status_code == primeira.status_code == 201
+        assert repetida.headers["idempotent-replayed"] == "true"
+        assert repetida.json() == {"id": 1}
+        assert repetida.headers["etag"] == '"v1"'
+        assert repetida.headers["location"] == "/clientes/1"
+        assert outro_corpo.status_code == 422
+    
+    asyncio.run(cenario())
+
+def test_reserva_renovada_durante_requisicao_longa(monkeypatch):
+    """Uma requisição mais longa que IDEMPOTENCIA_ESPERA_MAX não perde a reserva para outro worker"""
+    monkeypatch.setattr(main, "IDEMPOTENCIA_ESPERA_MAX", 0.3)
+    
+    async def endpoint_lento(scope, receive, send):
+        await asyncio.sleep(1.0)
+        await send({"type": "http.response.start", "status": 201, "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": b"{}"})
+    
+    async def cenario():
+        async with cliente_api():
+            transporte = httpx.ASGITransport(app=main.IdempotenciaMiddleware(endpoint_lento))
+            async with httpx.AsyncClient(transport=transporte, base_url="http://teste") as cliente:
+                primeira = asyncio.create_task(
+                    cliente.post("/clientes", json={}, headers={"Idempotency-Key": "reserva-longa"})
+                )
+                await asyncio.sleep(0.7)
+                # Outro worker (sem o Future deste processo) ainda vê a reserva em andamento
+                entrada = await main.idempotencia._reservar("/clientes:reserva-longa", "outro")
+                assert entrada is not None and entrada["status"] is None
+                assert (await primeira).status_code == 201
+    
+    asyncio.run(cenario())
@@ -0,0 +1,56 @@
+import asyncio
+import json
+
+from conftest import cliente_api
+
+def resultados(resposta) -> list:
+    return [json.loads(linha) for linha in resposta.text.splitlines()]
+
+def test_csv_com_quebra_de_linha_entre_aspas():
+    """Um campo entre aspas com quebra de linha é um único registro"""
+    corpo = (
+        'nome,email,cpf_cnpj\r\n'
+        '"Rosângela\r\nDias",rosangela@email.com,07068093868\r\n'
+        'Ítalo Mendes,italo@email.com,28625587887\r\n'
+    ).encode()
+    
+    async def cenario():
+        async with cliente_api() as cliente:
+            resposta = await cliente.post("/clientes/bulk", content=corpo, headers={"Content-Type": "text/csv"})
+            assert resposta.status_code == 200
+            linhas = resultados(resposta)
+            assert [linha.get("status") for linha in linhas[:-1]] == ["criado", "criado"]
+            assert linhas[-1] == {"resumo": {"criados": 2, "erros": 0}}
+            assert (await cliente.get(f"/clientes/{linhas[0]['id']}")).json()["nome"] == "Rosângela\r\nDias"
+    
+    asyncio.run(cenario())
+
+def test_arquivo_fora_do_utf8_recusado_antes_do_streaming():
+    """Um CSV em Latin-1 recebe 400 em vez de uma resposta cortada no meio"""
+    corpo = "nome,email,cpf_cnpj\nJoão Latin,joao.latin@email.com,45317828791\n".encode("latin-1")
+    
+    async def cenario():
+        async with cliente_api() as cliente:
+            resposta = await cliente.post("/clientes/bulk", content=corpo, headers={"Content-Type": "text/csv"})
+            assert resposta.status_code == 400
+    
+    asyncio.run(cenario())
+
+def test_bytes_invalidos_depois_do_inicio_viram_erro_do_registro():
+    """Bytes inválidos depois do primeiro pedaço do corpo: erro só naquele registro"""
+    async def pedacos():
+        yield '{"nome": "Valéria Cruz", "email": "valeria@email.com", "cpf_cnpj": "11438374798"}\n'.encode()
+        yield '{"nome": "Célio Luz", "email": "celio@email.com", "cpf_cnpj": "74221003030"}\n'.encode("latin-1")
+    
+    async def cenario():
+        async with cliente_api() as cliente:
+            resposta = await cliente.post(
+                "/clientes/bulk", content=pedacos(), headers={"Content-Type": "application/x-ndjson"}
+            )
+            assert resposta.status_code == 200
+            linhas = resultados(resposta)
+            assert linhas[0]["status"] == "criado"
+            assert linhas[1] == {"linha": 2, "status": "erro", "erro": "Registro com bytes fora do UTF-8"}
+            assert linhas[-1] == {"resumo": {"criados": 1, "erros": 1}}
+    
+    asyncio.run(cenario())
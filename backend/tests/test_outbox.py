@@ -0,0 +1,88 @@
+import asyncio
+import json
+from datetime import datetime
+
+import httpx
+from sqlalchemy import select, update
+
+import main
+from conftest import cliente_api
+
+def evento_do_cliente(cliente_id: int) -> main.OutboxEventoDB:
+    with main.SessionLocal() as db:
+        eventos = db.scalars(select(main.OutboxEventoDB).where(main.OutboxEventoDB.tipo == "cliente.criado")).all()
+        return next(evento for evento in eventos if json.loads(evento.payload)["id"] == cliente_id)
+
+def vencer_tentativas():
+    """Adianta o backoff: os eventos pendentes ficam prontos para nova tentativa"""
+    with main.SessionLocal() as db:
+        db.execute(
+            update(main.OutboxEventoDB)
+            .where(main.OutboxEventoDB.enviado_em.is_(None))
+            .values(proxima_tentativa_em=datetime.utcnow())
+        )
+        db.commit()
+
+def test_evento_reagendado_e_entregue():
+    """Falha do webhook reagenda o evento; a tentativa seguinte entrega e marca enviado_em"""
+    recebidos = []
+    falhar = True
+
+    def webhook(requisicao: httpx.Request) -> httpx.Response:
+        recebidos.append(requisicao)
+        return httpx.Response(500 if falhar else 200)
+
+    async def cenario():
+        nonlocal falhar
+        async with cliente_api() as cliente:
+            criado = (await cliente.post(
+                "/clientes", json={"nome": "Rafaela Nunes", "email": "rafaela.nunes@email.com", "cpf_cnpj": "99603082430"}
+            )).json()
+            dispatcher = main.OutboxDispatcher()
+            dispatcher._client = httpx.AsyncClient(transport=httpx.MockTransport(webhook))
+            try:
+                assert await dispatcher.drenar() >= 1
+                evento = evento_do_cliente(criado["id"])
+                assert evento.enviado_em is None
+                assert evento.tentativas == 1
+                assert "500" in evento.ultimo_erro
+                assert evento.proxima_tentativa_em > datetime.utcnow()
+                # Ainda no backoff: não é tentado de novo
+                recebidos.clear()
+                await dispatcher.drenar()
+                assert str(evento.id) not in [r.headers["x-evento-id"] for r in recebidos]
+
+                falhar = False
+                vencer_tentativas()
+                await dispatcher.drenar()
+                entrega = next(r for r in recebidos if r.headers["x-evento-id"] == str(evento.id))
+                assert entrega.headers["x-evento-tipo"] == "cliente.criado"
+                assert json.loads(entrega.content)["email"] == "rafaela.nunes@email.com"
+                evento = evento_do_cliente(criado["id"])
+                assert evento.enviado_em is not None
+                assert evento.ultimo_erro is None
+                assert await dispatcher.drenar() == 0
+            finally:
+                await dispatcher._client.aclose()
+
+    asyncio.run(cenario())
+
+def test_evento_gravado_uma_vez_e_reservado_uma_vez():
+    async def cenario():
+        async with cliente_api() as cliente:
+            dados = {"nome": "Breno Tavares", "email": "breno.tavares@email.com", "cpf_cnpj": "18609139034"}
+            criado = (await cliente.post("/clientes", json=dados)).json()
+            duplicado = await cliente.post("/clientes", json={**dados, "email": "breno.outro@email.com"})
+            assert duplicado.status_code == 400
+            with main.SessionLocal() as db:
+                payloads = db.scalars(select(main.OutboxEventoDB.payload)).all()
+            assert [json.loads(p)["cpf_cnpj"] for p in payloads].count("18609139034") == 1
+
+            # Um evento reservado fica fora das reservas seguintes até o lease vencer
+            vencer_tentativas()
+            primeira = main.reservar_eventos_outbox(main.OUTBOX_LOTE)
+            segunda = main.reservar_eventos_outbox(main.OUTBOX_LOTE)
+            assert criado["id"] in [json.loads(e["payload"])["id"] for e in primeira]
+            assert not {e["id"] for e in primeira} & {e["id"] for e in segunda}
+
+    asyncio.run(cenario())
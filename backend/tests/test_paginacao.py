@@ -0,0 +1,68 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import main
+from conftest import cliente_api
+
+# Datas fora das usadas pelos outros testes: o filtro isola estes clientes
+INICIO = datetime(2031, 1, 1)
+
+def inserir_clientes(quantidade: int) -> list:
+    """Insere clientes com created_at repetido de três em três (empates saem por id)"""
+    with main.SessionLocal() as db:
+        clientes = [
+            main.ClienteDB(
+                nome=f"Cliente Paginado {i}", email=f"paginado{i}@email.com",
+                cpf_cnpj=f"{70000000000 + i}", created_at=INICIO + timedelta(minutes=i // 3)
+            )
+            for i in range(quantidade)
+        ]
+        db.add_all(clientes)
+        db.commit()
+        return [cliente.id for cliente in clientes]
+
+async def percorrer(cliente, params: dict) -> list:
+    """Segue o X-Next-Cursor até a última página e devolve os ids na ordem"""
+    ids, cursor = [], None
+    while True:
+        resposta = await cliente.get("/clientes", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert resposta.status_code == 200
+        ids.extend(item["id"] for item in resposta.json())
+        cursor = resposta.headers.get("x-next-cursor")
+        if cursor is None:
+            return ids
+
+def test_cursor_percorre_todas_as_ordenacoes():
+    """Páginas por cursor batem com a ordem completa, sem repetir nem pular clientes"""
+    async def cenario():
+        async with cliente_api() as cliente:
+            ids = inserir_clientes(23)
+            assert (await cliente.delete(f"/clientes/{ids[10]}")).status_code == 204
+            ativos = [i for i in ids if i != ids[10]]
+            # Mesmo created_at a cada três clientes: o empate sai por id
+            por_data = sorted(ativos, key=lambda i: (ids.index(i) // 3, i))
+
+            filtro = {"created_since": INICIO.isoformat(), "limit": 5}
+            assert await percorrer(cliente, {**filtro, "sort": "id"}) == ativos
+            assert await percorrer(cliente, {**filtro, "sort": "-id"}) == ativos[::-1]
+            assert await percorrer(cliente, {**filtro, "sort": "created_at"}) == por_data
+            assert await percorrer(cliente, {**filtro, "sort": "-created_at"}) == por_data[::-1]
+
+            # A primeira página por skip também devolve o cursor da seguinte
+            primeira = await cliente.get("/clientes", params={**filtro, "skip": 5})
+            segunda = await cliente.get("/clientes", params={**filtro, "cursor": primeira.headers["x-next-cursor"]})
+            assert [item["id"] for item in segunda.json()] == ativos[10:15]
+
+    asyncio.run(cenario())
+
+def test_cursor_invalido_ou_de_outra_ordenacao():
+    async def cenario():
+        async with cliente_api() as cliente:
+            assert (await cliente.get("/clientes", params={"cursor": "nao-e-um-cursor"})).status_code == 400
+
+            cursor = main.codificar_cursor(1, "-created_at", datetime(2024, 1, 1))
+            resposta = await cliente.get("/clientes", params={"cursor": cursor, "sort": "id"})
+            assert resposta.status_code == 400
+            assert "sort" in resposta.json()["detail"]
+
+    asyncio.run(cenario())